@@ -0,0 +1,266 @@
+# cache_policy_replay.py
+"""
+Replay recorded traffic from chat_history.db through a simulation of the
+cache tiers and sweep their tuning knobs, without touching Redis, Milvus or
+Gemini.
+
+Every chat_history row is one (session, question) pair asked hit_count
+times: the first ask at `timestamp`, the rest spread evenly up to
+`last_asked_at`. Those asks are replayed in time order, each with the row's
+stored vector from vec_chat_history (a variant row uses its canonical row's),
+through the same policy as src.step_3_llm_loaders:
+
+  * exact tier: normalized question text, written on every turn, EXACT_CACHE_TTL,
+  * Redis semantic tier: best cosine >= THRESHOLD; entries are upserted on a
+    miss while the row count is below K_THRESHOLD, and the whole set is
+    replaced by the top-`refresh limit` questions by hits once each time the
+    row count reaches a new multiple of K_THRESHOLD,
+  * SQLite tier: best cosine over every stored row >= proximity_threshold,
+  * otherwise a full RAG call (Milvus + rerank + Gemini).
+
+Redis is credited when both semantic tiers would hit (it answers first in
+production). The L1 copy, memory budget and semantic-cache TTL are not
+modelled.
+
+For each combination it reports hits per tier, LLM calls avoided, estimated
+mean latency and cost saved against running every ask through the LLM, and
+the similarity of accepted semantic hits. A similarity histogram is printed
+for the production settings.
+
+Usage:
+    python -m benchmarks.cache_policy_replay --db chat_history.db
+    python -m benchmarks.cache_policy_replay --thresholds 0.95,0.97,0.98 --proximity 0.9,0.95 \\
+        --k 10,17,50 --refresh-limits 5,50 --llm-cost 0.004
+"""
+import heapq
+import sqlite3
+import argparse
+import itertools
+from datetime import datetime
+
+import numpy as np
+
+from caching_hisotry.caching.exact_cache import normalize_query
+
+PRODUCTION = {"threshold": 0.98, "proximity": 0.95, "k": 17, "refresh_limit": 5}
+EXACT_CACHE_TTL = 7 * 24 * 3600
+HISTOGRAM_BINS = [0.90, 0.93, 0.95, 0.96, 0.97, 0.98, 0.99, 0.995, 1.0001]
+
+
+def parse_time(value):
+    return datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def load_traffic(path, first_ask_only=False):
+    """
+    Rows and their asks in time order.
+
+    Returns:
+        tuple: (questions, normalized questions, unit vectors, [(time, row)])
+    """
+    import sqlite_vec
+    conn = sqlite3.connect(path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    rows = conn.execute("""
+        SELECT h.question, h.timestamp, h.last_asked_at, h.hit_count, v.query_vector
+        FROM chat_history h
+        JOIN vec_chat_history v ON v.rowid = COALESCE(h.canonical_id, h.id)
+        ORDER BY h.id
+    """).fetchall()
+    conn.close()
+    if not rows:
+        raise SystemExit(f"No chat_history rows with vectors in {path}")
+
+    questions, events, vectors = [], [], []
+    for i, (question, first, last, hits, vector) in enumerate(rows):
+        questions.append(question)
+        vectors.append(np.frombuffer(vector, dtype=np.float32))
+        start = parse_time(first)
+        # last_asked_at is written by SQLite (UTC), timestamp by Python: never go backwards
+        end = max(start, parse_time(last)) if last else start
+        asks = 1 if first_ask_only else max(1, int(hits or 1))
+        events.extend((t, i) for t in np.linspace(start, end, asks))
+    events.sort()
+
+    matrix = np.vstack(vectors)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return questions, [normalize_query(q) for q in questions], matrix / norms, events
+
+
+def neighbours(matrix, min_similarity, block=1024):
+    """For every row, {other row: cosine} of rows at or above min_similarity (self included)."""
+    result = []
+    for start in range(0, len(matrix), block):
+        sims = matrix[start:start + block] @ matrix.T
+        for row in sims:
+            idx = np.nonzero(row >= min_similarity)[0]
+            result.append(dict(zip(idx.tolist(), row[idx].tolist())))
+    return result
+
+
+def best_match(near, present):
+    """Highest similarity among the present rows, or 0.0."""
+    if len(near) < len(present):
+        return max((s for j, s in near.items() if j in present), default=0.0)
+    return max((near[j] for j in present if j in near), default=0.0)
+
+
+def simulate(config, normalized, near, events):
+    """Replay the asks under one parameter set; returns per-tier counts and accepted similarities."""
+    threshold, proximity = config["threshold"], config["proximity"]
+    k, refresh_limit = config["k"], config["refresh_limit"]
+
+    exact_until = {}        # normalized question -> expiry time
+    redis_rows = {}         # normalized question -> row (content-addressed keys)
+    redis_present = set()
+    stored_rows = set()     # rows persisted in chat_history
+    asks_per_question = {}
+    latest_row = {}
+    refresh_epoch = 0
+    tiers = {"exact": 0, "redis": 0, "sqlite": 0, "llm": 0}
+    similarities = {"redis": [], "sqlite": []}
+
+    def set_redis(rows_by_key):
+        redis_rows.clear()
+        redis_rows.update(rows_by_key)
+        redis_present.clear()
+        redis_present.update(rows_by_key.values())
+
+    for when, row in events:
+        key = normalized[row]
+        if exact_until.get(key, 0) > when:
+            tier = "exact"
+        else:
+            sim = best_match(near[row], redis_present)
+            if sim >= threshold:
+                tier = "redis"
+            else:
+                sim = best_match(near[row], stored_rows)
+                tier = "sqlite" if sim >= proximity else "llm"
+            if tier != "llm":
+                similarities[tier].append(sim)
+        tiers[tier] += 1
+
+        # save_chat_turn, then sync_redis_cache
+        stored_rows.add(row)
+        asks_per_question[key] = asks_per_question.get(key, 0) + 1
+        latest_row[key] = row
+        exact_until[key] = when + EXACT_CACHE_TTL
+        count = len(stored_rows)
+        if tier == "llm" and count < k:
+            redis_present.discard(redis_rows.get(key))
+            redis_rows[key] = row
+            redis_present.add(row)
+        elif count // k > refresh_epoch:
+            refresh_epoch = count // k
+            top = heapq.nlargest(refresh_limit, asks_per_question.items(), key=lambda item: item[1])
+            set_redis({q: latest_row[q] for q, _ in top})
+
+    return tiers, similarities
+
+
+def summarize(config, tiers, similarities, costs):
+    asks = sum(tiers.values())
+    semantic_asks = asks - tiers["exact"]
+    # Every ask checks the exact tier first; Redis and SQLite are looked up concurrently
+    latency = (
+        asks * costs.exact_ms
+        + semantic_asks * costs.embedding_ms
+        + tiers["redis"] * costs.redis_ms
+        + tiers["sqlite"] * max(costs.redis_ms, costs.sqlite_ms)
+        + tiers["llm"] * (max(costs.redis_ms, costs.sqlite_ms) + costs.llm_ms)
+    ) / asks
+    baseline = costs.embedding_ms + costs.llm_ms
+    # Against embedding + LLM for every ask: exact hits skip both, semantic hits skip the LLM
+    cost_saved = (asks - tiers["llm"]) * costs.llm_cost + tiers["exact"] * costs.embedding_cost
+    accepted = similarities["redis"] + similarities["sqlite"]
+    return {
+        **config,
+        **{f"{tier}_ratio": n / asks for tier, n in tiers.items()},
+        "llm_avoided": asks - tiers["llm"],
+        "mean_ms": latency,
+        "saved_ms": baseline - latency,
+        "cost_saved": cost_saved,
+        "min_sim": min(accepted) if accepted else float("nan"),
+        "p10_sim": float(np.percentile(accepted, 10)) if accepted else float("nan"),
+    }
+
+
+def histogram(similarities):
+    for tier, values in similarities.items():
+        counts, _ = np.histogram(values, bins=HISTOGRAM_BINS)
+        print(f"\n{tier} hits by cosine similarity (n={len(values)})")
+        for lo, hi, n in zip(HISTOGRAM_BINS, HISTOGRAM_BINS[1:], counts):
+            bar = "#" * int(40 * n / max(1, counts.max()))
+            print(f"  [{lo:.3f}, {min(hi, 1.0):.3f})  {n:>6}  {bar}")
+
+
+def floats(text):
+    return [float(v) for v in text.split(",")]
+
+
+def ints(text):
+    return [int(v) for v in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="chat_history.db")
+    parser.add_argument("--thresholds", type=floats, default=[0.95, 0.96, 0.97, 0.98, 0.99], help="Redis THRESHOLD values")
+    parser.add_argument("--proximity", type=floats, default=[0.90, 0.93, 0.95, 0.97], help="SQLite proximity_threshold values")
+    parser.add_argument("--k", type=ints, default=[10, 17, 50], help="K_THRESHOLD values")
+    parser.add_argument("--refresh-limits", type=ints, default=[5, 20, 100], help="refresh_redis_from_sqlite limits")
+    parser.add_argument("--first-ask-only", action="store_true", help="replay each row once, ignoring hit_count")
+    parser.add_argument("--top", type=int, default=20, help="rows to print, best mean latency first")
+    parser.add_argument("--exact-ms", type=float, default=1.0)
+    parser.add_argument("--embedding-ms", type=float, default=150.0)
+    parser.add_argument("--redis-ms", type=float, default=3.0)
+    parser.add_argument("--sqlite-ms", type=float, default=20.0)
+    parser.add_argument("--llm-ms", type=float, default=4000.0, help="Milvus + rerank + Gemini + translation")
+    parser.add_argument("--embedding-cost", type=float, default=0.00002, help="$ per embedding call")
+    parser.add_argument("--llm-cost", type=float, default=0.002, help="$ per full RAG answer")
+    args = parser.parse_args()
+
+    questions, normalized, matrix, events = load_traffic(args.db, args.first_ask_only)
+    min_similarity = min(args.thresholds + args.proximity + [PRODUCTION["threshold"], PRODUCTION["proximity"]])
+    near = neighbours(matrix, min_similarity)
+    print(f"rows={len(questions)}  asks={len(events)}  "
+          f"distinct questions={len(set(normalized))}  vectors={matrix.shape[1]}d\n")
+
+    configs = [
+        dict(threshold=t, proximity=p, k=k, refresh_limit=n)
+        for t, p, k, n in itertools.product(args.thresholds, args.proximity, args.k, args.refresh_limits)
+    ]
+    if PRODUCTION not in configs:
+        configs.append(dict(PRODUCTION))
+
+    results, production_sims = [], None
+    for config in configs:
+        tiers, similarities = simulate(config, normalized, near, events)
+        results.append(summarize(config, tiers, similarities, args))
+        if config == PRODUCTION:
+            production_sims = similarities
+            production = results[-1]
+
+    header = (f"{'thresh':>7}{'prox':>6}{'K':>5}{'limit':>6}{'exact':>8}{'redis':>8}{'sqlite':>8}{'llm':>8}"
+              f"{'avoided':>9}{'mean ms':>9}{'saved ms':>10}{'saved $':>9}{'min sim':>9}{'p10 sim':>9}")
+
+    def line(res):
+        return (f"{res['threshold']:>7.3f}{res['proximity']:>6.2f}{res['k']:>5}{res['refresh_limit']:>6}"
+                f"{res['exact_ratio']:>8.3f}{res['redis_ratio']:>8.3f}{res['sqlite_ratio']:>8.3f}{res['llm_ratio']:>8.3f}"
+                f"{res['llm_avoided']:>9}{res['mean_ms']:>9.0f}{res['saved_ms']:>10.0f}{res['cost_saved']:>9.2f}"
+                f"{res['min_sim']:>9.3f}{res['p10_sim']:>9.3f}")
+
+    print(header)
+    print(line(production), " <- production")
+    print()
+    for res in sorted(results, key=lambda res: res["mean_ms"])[:args.top]:
+        print(line(res))
+
+    histogram(production_sims)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# concurrency_benchmark.py
+"""
+Compare how many concurrent /query requests one worker can overlap with the
+old serving model against the async pipeline.
+
+  * legacy: the old sync handler. Each request occupies one of --threads
+    threads and runs asyncio.run(main(...)) on it, so at most --threads
+    requests are in flight and every one blocks its thread throughout.
+  * async: every request awaited concurrently on the worker's event loop.
+
+Both modes drive the real src.step_3_llm_loaders.main end to end, with every
+upstream replaced by the local fakes from benchmarks.fakes (simulated
+latencies scaled by --scale). Each mode runs in a fresh process and scratch
+directory, so neither starts with the other's history or cache entries.
+
+Usage:
+    python -m benchmarks.concurrency_benchmark --requests 64 --threads 2
+"""
+import os
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+import multiprocessing
+from dataclasses import fields
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from benchmarks.fakes import FakeLatency, install_fakes
+from benchmarks.pipeline_benchmark import DEFAULT_QUERIES, load_queries, percentile, replay
+
+
+async def replay_threaded(rag_main, outbox, queries, threads, sessions):
+    """
+    Serve every query the way the old sync /query handler did: a request
+    waits for one of `threads` threads, which then runs asyncio.run(main())
+    to completion. Returns (wall seconds, per-request latency including
+    the wait for a thread).
+    """
+    loop = asyncio.get_running_loop()
+
+    def handle(i, query):
+        return asyncio.run(rag_main(query=query, session_id=f"bench-{i % sessions}"))
+
+    async def one(pool, i, query):
+        submitted = time.perf_counter()
+        await loop.run_in_executor(pool, handle, i, query)
+        return time.perf_counter() - submitted
+
+    outbox.start()
+    try:
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="legacy-handler") as pool:
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(one(pool, i, q) for i, q in enumerate(queries)))
+            wall = time.perf_counter() - start
+        while await asyncio.to_thread(outbox.stats):
+            await asyncio.sleep(0.05)
+    finally:
+        await outbox.stop()
+    return wall, latencies
+
+
+def run_mode(mode, queries, concurrency, scale, sessions):
+    """Replay queries through main() in one serving model; runs in a child process."""
+    os.chdir(tempfile.mkdtemp(prefix="rag-concurrency-"))
+    defaults = FakeLatency()
+    install_fakes(FakeLatency(**{f.name: getattr(defaults, f.name) * scale for f in fields(FakeLatency)}))
+
+    from src.step_3_llm_loaders import main as rag_main
+    from persistant_memory.outbox import outbox
+
+    if mode == "legacy":
+        return asyncio.run(replay_threaded(rag_main, outbox, queries, concurrency, sessions))
+    # Latency as the client sees it, including time queued for a slot
+    wall, results = asyncio.run(replay(rag_main, outbox, queries, concurrency, sessions, include_queueing=True))
+    return wall, [total for total, _ in results]
+
+
+def report(name, wall, latencies):
+    print(
+        f"{name:<8} wall={wall:7.2f}s  throughput={len(latencies) / wall:6.2f} req/s  "
+        f"p50={statistics.median(latencies):6.2f}s  "
+        f"p95={percentile(latencies, 95):6.2f}s  "
+        f"p99={percentile(latencies, 99):6.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64, help="concurrent requests sent to one worker")
+    parser.add_argument("--threads", type=int, default=2, help="threads per worker on the old path (gunicorn --threads)")
+    parser.add_argument("--scale", type=float, default=0.1, help="multiplier applied to every simulated upstream latency")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="file with one query per line (cycled up to --requests)")
+    parser.add_argument("--sessions", type=int, default=4, help="distinct session ids to spread requests over")
+    args = parser.parse_args()
+
+    base = load_queries(args.queries)
+    queries = [base[i % len(base)] for i in range(args.requests)]
+    print(f"{args.requests} requests over {len(base)} distinct queries, latency scale {args.scale}\n")
+
+    # One process per mode: the pipeline keeps module-level caches and clients
+    context = multiprocessing.get_context("spawn")
+    for name, concurrency in (("legacy", args.threads), ("async", args.requests)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            wall, latencies = pool.submit(run_mode, name, queries, concurrency, args.scale, args.sessions).result()
+        report(name, wall, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+# fakes.py
+"""
+Local stand-ins for every upstream used by src.step_3_llm_loaders.main, so the
+pipeline can be benchmarked on a laptop with no Gemini, Discovery Engine,
+Translate, Ollama, Redis or Milvus.
+
+Several production modules connect at import time (Milvus in
+milvus_database.config, the service-account Translate client, the RediSearch
+index in step_3), so install_fakes() must run before src.step_3_llm_loaders is
+imported. The real SQLite / sqlite-vec history tier and the outbox are used
+as-is, pointed at a scratch directory. Code that still talks to Redis itself
+(single-flight leases, admission token buckets) gets an in-process fakeredis
+server, so nothing is written to a real Redis. The benchmarks need fakeredis
+and lupa (for the Lua scripts) on top of requirements.txt.
+"""
+import sys
+import json
+import types
+import asyncio
+import hashlib
+import re
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import fakeredis
+
+from src.utils import BASE_DIR
+
+DIM = 3072
+
+
+@dataclass
+class FakeLatency:
+    """Simulated upstream latencies in seconds."""
+    embedding: float = 0.15
+    intent: float = 0.30
+    redis: float = 0.005
+    milvus: float = 0.05
+    rerank: float = 0.25
+    gemini: float = 3.0
+    translate: float = 0.08
+
+
+# -------------------------
+# Embeddings
+# -------------------------
+class HashEmbedding:
+    """
+    Deterministic feature-hashing embedding: every token adds a signed unit to
+    a hashed dimension. Texts that share words get similar vectors, identical
+    texts get identical ones, and nothing leaves the process.
+    """
+
+    def __init__(self, dim=DIM, delay=0.0):
+        self.dim = dim
+        self.delay = delay
+        self.calls = 0
+
+    def _vector(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vec[value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._vector(text)
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self._vector(text)
+
+
+# -------------------------
+# Milvus
+# -------------------------
+class InMemoryVectorStore:
+    """Brute-force cosine search implementing the milvus_db.vector_search contract."""
+
+    def __init__(self, embedding, delay=0.0):
+        self.embedding = embedding
+        self.delay = delay
+        self.entities = []
+        self.matrix = np.zeros((0, embedding.dim), dtype=np.float32)
+
+    def load_json(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        vectors = []
+        for item in items:
+            text = item.get("section_desc", "").strip()
+            if not text:
+                continue
+            self.entities.append({
+                "text": text,
+                "chapter": item.get("chapter"),
+                "chapter_title": item.get("chapter_title"),
+                "section": item.get("section"),
+                "section_title": item.get("section_title"),
+            })
+            vectors.append(self.embedding._vector(text))
+        self.matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.embedding.dim)
+        return self
+
+    def vector_search(self, collection_name, partition_name, query_vectors, num_results):
+        if self.delay:
+            threading.Event().wait(self.delay)   # blocking, like the real client
+        q = np.asarray(query_vectors, dtype=np.float32)
+        scores = self.matrix @ q
+        top = np.argsort(-scores)[:num_results]
+        return [[{"entity": self.entities[i], "distance": float(scores[i])} for i in top]]
+
+
+# -------------------------
+# Redis semantic cache
+# -------------------------
+class InMemoryKNNCache:
+    """In-memory KNN implementing the cache_rag / upsert_rag_response contract."""
+
+    def __init__(self, threshold=0.98, delay=0.0):
+        self.threshold = threshold
+        self.delay = delay
+        self._lock = threading.Lock()
+        self.items = []          # (normalized vector, query, answer, confidence)
+
+    def cache_rag(self, query_text, query_vector, k=3):
+        if self.delay:
+            threading.Event().wait(self.delay)
+        return self._lookup(query_vector)
+
+    async def acache_rag(self, query_text, query_vector, k=3):
+        await asyncio.sleep(self.delay)
+        return self._lookup(query_vector)
+
+    def _lookup(self, query_vector):
+        q = np.asarray(query_vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        with self._lock:
+            items = list(self.items)
+        best = None
+        for vec, _, answer, confidence in items:
+            similarity = float(vec @ q)
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, answer, confidence)
+        if best is None:
+            return {"cache": None}
+        return {"cache": {
+            "answer": best[1],
+            "similarity": best[0],
+            "cache_key": None,
+            "confidence_score": best[2],
+            "source": "semantic-cache",
+        }}
+
+    def upsert_rag_response(self, rag_answer, query_text, query_vector, confidence_score, id_generator=None, language="en"):
+        v = np.asarray(query_vector, dtype=np.float32)
+        v = v / (np.linalg.norm(v) or 1.0)
+        with self._lock:
+            self.items.append((v, query_text, rag_answer, confidence_score))
+
+    def refresh_redis_from_sqlite(self, limit=100):
+        pass
+
+
+# -------------------------
+# Reranker / Gemini / intent / translate
+# -------------------------
+class IdentityReranker:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    async def arerank_with_google(self, query, docs, project_id=None, location="global", return_scores=False, client=None):
+        await asyncio.sleep(self.delay)
+        return list(docs)
+
+    def rerank_with_google(self, query, docs, *args, **kwargs):
+        return list(docs)
+
+
+CANNED_ANSWER = {
+    "Explanation": "This is a canned **benchmark** explanation.\nIt has two lines.",
+    "Summary": "Canned summary.",
+    "Follow_up": "Would you like to know more?",
+    "table_data": "[]",
+    "Confidence_Reasoning": "Canned.",
+    "Confidence_Score": 0.83,
+}
+
+
+class CannedGemini:
+    """GenerativeModel stand-in returning a fixed JSON answer after a delay."""
+
+    def __init__(self, delay=0.0, answer=None):
+        self.delay = delay
+        self.text = json.dumps(answer or CANNED_ANSWER)
+        self.calls = 0
+
+    def _response(self):
+        part = types.SimpleNamespace(text=self.text)
+        candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]))
+        return types.SimpleNamespace(candidates=[candidate], text=self.text)
+
+    def _chunks(self, size=40):
+        return [types.SimpleNamespace(text=self.text[i:i + size]) for i in range(0, len(self.text), size)]
+
+    async def _astream(self):
+        for chunk in self._chunks():
+            yield chunk
+
+    async def generate_content_async(self, *args, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self._astream() if stream else self._response()
+
+    def generate_content(self, *args, stream=False, **kwargs):
+        self.calls += 1
+        threading.Event().wait(self.delay)
+        return self._chunks() if stream else self._response()
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+@dataclass
+class Fakes:
+    embedding: HashEmbedding
+    vector_store: InMemoryVectorStore
+    cache: InMemoryKNNCache
+    reranker: IdentityReranker
+    gemini: CannedGemini
+
+
+def install_fakes(latency: FakeLatency = None, corpus=None):
+    """
+    Register the fakes in sys.modules and the client registry.
+
+    Must be called before importing src.step_3_llm_loaders.
+    """
+    latency = latency or FakeLatency()
+    corpus = corpus or f"{BASE_DIR}/demo_data/demo_json.json"
+
+    # Shared clients from src.redis_pool (sync and asyncio) on one fake server
+    from src import redis_pool
+    redis_server = fakeredis.FakeServer()
+    redis_pool._redis = fakeredis.FakeRedis(server=redis_server)
+    redis_pool._async_redis = fakeredis.FakeAsyncRedis(server=redis_server)
+
+    embedding = HashEmbedding(delay=latency.embedding)
+    vector_store = InMemoryVectorStore(embedding, delay=latency.milvus).load_json(corpus)
+    cache = InMemoryKNNCache(delay=latency.redis)
+    reranker = IdentityReranker(delay=latency.rerank)
+    gemini = CannedGemini(delay=latency.gemini)
+
+    class DB:
+        milvus_collection_name = "benchmark"
+        model_dimensions = DIM
+        default_partition = "default"
+
+    _module("milvus_database.config", DB=DB)
+    _module("milvus_database.milvus_db", vector_search=vector_store.vector_search)
+    _module("milvus_database.milvus_loading", loading_milvus=lambda: None)
+
+    def translate_fields(fields, targeted_language, source_language="en"):
+        fields = list(fields)
+        if targeted_language and targeted_language != source_language:
+            threading.Event().wait(latency.translate)
+        return fields
+
+    def output_converison(text, targeted_language):
+        [text] = translate_fields([text], targeted_language)
+        return text
+
+    _module(
+        "multilingual_pipeline.conversion",
+        translation=lambda detected_lang, user_query: user_query,
+        output_converison=output_converison,
+        translate_fields=translate_fields,
+    )
+
+    _module(
+        "caching_hisotry.caching.redis_semantic_cache",
+        cache_rag=cache.cache_rag,
+        acache_rag=cache.acache_rag,
+        upsert_rag_response=cache.upsert_rag_response,
+        refresh_redis_from_sqlite=cache.refresh_redis_from_sqlite,
+        record_cache_hit=lambda cache_key: None,
+        cache_stats=lambda: {"entries": len(cache.items)},
+        create_index_if_not_exists=lambda *a, **k: None,
+    )
+
+    # Exact-match tier backed by a dict instead of Redis, real key normalization
+    from caching_hisotry.caching import exact_cache as real_exact_cache
+    exact_store = {}
+
+    def get_exact_answer(query_text, language="en"):
+        hit = exact_store.get(real_exact_cache.exact_key(query_text, language))
+        if hit is None:
+            real_exact_cache.exact_cache_stats.misses += 1
+        else:
+            real_exact_cache.exact_cache_stats.hits += 1
+        return hit
+
+    def put_exact_answer(query_text, answer, confidence_score=None, language="en"):
+        exact_store[real_exact_cache.exact_key(query_text, language)] = {
+            "answer": answer, "confidence_score": confidence_score, "question": query_text,
+        }
+
+    _module("caching_hisotry.caching.exact_cache", get_exact_answer=get_exact_answer,
+            put_exact_answer=put_exact_answer, normalize_query=real_exact_cache.normalize_query,
+            exact_key=real_exact_cache.exact_key, cache_digest=real_exact_cache.cache_digest,
+            exact_cache_stats=real_exact_cache.exact_cache_stats)
+
+    # The in-memory KNN cache is already in-process; no L1 tier in front of it
+    _module("caching_hisotry.caching.l1_cache",
+            l1_cache=types.SimpleNamespace(lookup=lambda query_vector: None, start=lambda: None,
+                                           stats=lambda: {}))
+
+    async def allm_detect_intent(query):
+        await asyncio.sleep(latency.intent)
+        return types.SimpleNamespace(intent="QA", complaint_type=None)
+
+    _module("complaint_generator.generator_script", allm_detect_intent=allm_detect_intent,
+            llm_detect_intent=lambda query: types.SimpleNamespace(intent="QA", complaint_type=None))
+
+    async def agenerate_legal_text(user_input):
+        await asyncio.sleep(latency.gemini)
+        return "Canned legal document."
+
+    _module("complaint_generator.legal_generator", agenerate_legal_text=agenerate_legal_text,
+            save_to_docx=lambda text, filename: filename, save_to_pdf=lambda text, filename: filename)
+
+    _module("src.step_6_reranker", arerank_with_google=reranker.arerank_with_google,
+            rerank_with_google=reranker.rerank_with_google)
+
+    from src.client_registry import registry
+    registry._embedding_model = embedding
+    registry._gemini_model = gemini
+    registry._rank_client = object()
+    registry.ready = True
+
+    return Fakes(embedding, vector_store, cache, reranker, gemini)
@@ -0,0 +1,160 @@
+# history_index_benchmark.py
+"""
+Compare the exact sqlite-vec scan used by search_history_semantic with the
+reduced coarse indexes of persistant_memory.history_index (truncated
+Matryoshka prefixes stored as float32, int8 or bits, rescored with the full
+float32 vectors).
+
+For each history size it builds a scratch chat-history database of
+synthetic 3072-dim vectors (variance decaying with the dimension index,
+like Matryoshka embeddings) and replays queries, half near-duplicates of
+stored rows and half unrelated. Reported per layout:
+  * p50 / p95 lookup latency (coarse KNN + rescoring, or the exact scan),
+  * recall@k of the returned rows against the exact scan,
+  * agreement: same hit/miss decision and same winning row at --threshold,
+  * index bytes per row, on top of the FULL_DIM * 4 bytes per row of
+    vec_chat_history, which rescoring reads by rowid.
+
+Database files go to --workdir and are reused on later runs. 1M rows need
+about 13 GB of disk for the float32 table alone, and the exact scan takes
+seconds per query there, so lower --queries for the largest size.
+
+Usage:
+    python -m benchmarks.history_index_benchmark --rows 10000,100000
+    python -m benchmarks.history_index_benchmark --rows 1000000 --queries 50 --workdir /data/bench
+    python -m benchmarks.history_index_benchmark --layouts int8-768,bit-3072 --candidates 80
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+
+import numpy as np
+import sqlite_vec
+
+from persistant_memory.history_index import HistoryIndex, FULL_DIM
+from persistant_memory.sqlite_pool import SQLITE_MMAP_SIZE, SQLITE_CACHE_KIB
+from benchmarks.synthetic import synthetic_batch, synthetic_queries
+
+DEFAULT_LAYOUTS = "float-768,int8-3072,int8-768,int8-256,bit-3072"
+BATCH = 2000
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    # Same read settings as the app's pooled connections; rowid lookups in
+    # vec0 walk overflow pages and are several times slower without mmap
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KIB}")
+    return conn
+
+
+def build(path, rows, layouts, seed=7):
+    """Create (or top up) the scratch database; returns a sample of stored vectors for queries."""
+    conn = connect(path)
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS vec_chat_history USING vec0(query_vector float[{FULL_DIM}])")
+    for layout in layouts:
+        layout.create(conn)
+    present = conn.execute("SELECT COUNT(*) FROM vec_chat_history").fetchone()[0]
+
+    rng = np.random.default_rng(seed)
+    sample = None
+    start = time.perf_counter()
+    for offset in range(0, rows, BATCH):
+        batch = synthetic_batch(rng, min(BATCH, rows - offset), FULL_DIM)
+        if sample is None:
+            sample = batch[:1000].copy()
+        ids = range(offset + 1, offset + 1 + len(batch))
+        if offset + len(batch) > present:
+            conn.executemany("INSERT OR IGNORE INTO vec_chat_history(rowid, query_vector) VALUES (?, ?)",
+                             ((i, v.tobytes()) for i, v in zip(ids, batch)))
+        for layout in layouts:
+            if conn.execute(f"SELECT 1 FROM {layout.table} WHERE rowid = ?", (ids[-1],)).fetchone():
+                continue
+            wrapper = layout.reduce(batch[0])[0]
+            conn.executemany(f"INSERT INTO {layout.table}(rowid, query_vector) VALUES (?, {wrapper})",
+                             ((i, layout.reduce(v)[1]) for i, v in zip(ids, batch)))
+        conn.commit()
+        if offset and offset % 50000 == 0:
+            print(f"  ... {offset} rows ({time.perf_counter() - start:.0f}s)")
+    conn.close()
+    return sample
+
+
+def exact(conn, q, top_k):
+    blob = q.tobytes()
+    return conn.execute("""
+        SELECT rowid, vec_distance_cosine(query_vector, ?)
+        FROM vec_chat_history
+        WHERE query_vector MATCH ? AND k = ?
+    """, (blob, blob, top_k)).fetchall()
+
+
+def decision(rows, threshold):
+    best = min(rows, key=lambda row: row[1]) if rows else None
+    if best is None or 1 - best[1] < threshold:
+        return None
+    return best[0]
+
+
+def measure(lookup, queries, truth, top_k, threshold):
+    latencies, recall, agree = [], 0.0, 0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows = lookup(q)
+        latencies.append(time.perf_counter() - start)
+        recall += len({r[0] for r in rows} & {r[0] for r in expected}) / max(1, len(expected))
+        agree += decision(rows, threshold) == decision(expected, threshold)
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "recall": recall / len(queries),
+        "agree": agree / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000,1000000", help="comma-separated history sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--layouts", default=DEFAULT_LAYOUTS, help="comma-separated TYPE-DIM list (float, int8, bit)")
+    parser.add_argument("--candidates", type=int, default=40, help="coarse KNN size before rescoring")
+    parser.add_argument("--top-k", type=int, default=5, help="rows returned, as in search_history_semantic")
+    parser.add_argument("--threshold", type=float, default=0.95, help="proximity_threshold for the agreement check")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "history-index-bench"))
+    args = parser.parse_args()
+
+    layouts = []
+    for spec in args.layouts.split(","):
+        vector_type, dim = spec.strip().lower().split("-")
+        layouts.append(HistoryIndex(vector_type, int(dim), candidates=args.candidates))
+    os.makedirs(args.workdir, exist_ok=True)
+
+    for rows in (int(n) for n in args.rows.split(",")):
+        path = os.path.join(args.workdir, f"history-{rows}.db")
+        print(f"\nrows={rows}  queries={args.queries}  candidates={args.candidates}  db={path}")
+        sample = build(path, rows, layouts)
+        queries = synthetic_queries(np.random.default_rng(11), sample, args.queries)
+
+        conn = connect(path)
+        truth = [exact(conn, q, args.top_k) for q in queries]
+        print(f"{'layout':<14}{'p50 ms':>9}{'p95 ms':>9}{'recall@' + str(args.top_k):>10}{'agree':>8}{'index B/row':>13}")
+        baseline = measure(lambda q: exact(conn, q, args.top_k), queries, truth, args.top_k, args.threshold)
+        print(f"{'exact':<14}{baseline['p50_ms']:>9.2f}{baseline['p95_ms']:>9.2f}"
+              f"{baseline['recall']:>10.3f}{baseline['agree']:>8.3f}{FULL_DIM * 4:>13}")
+        for layout in layouts:
+            result = measure(lambda q: layout.nearest(conn, q, args.top_k), queries, truth, args.top_k, args.threshold)
+            bytes_per_row = layout.dim // 8 if layout.vector_type == "bit" else layout.dim * (1 if layout.vector_type == "int8" else 4)
+            print(f"{layout.vector_type + '-' + str(layout.dim):<14}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                  f"{result['recall']:>10.3f}{result['agree']:>8.3f}{bytes_per_row:>13}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# pipeline_benchmark.py
+"""
+Offline end-to-end benchmark of src.step_3_llm_loaders.main.
+
+Every upstream is replaced by a local fake from benchmarks.fakes (hash
+embeddings, in-memory Milvus and Redis KNN, identity reranker, canned Gemini
+with a configurable delay); SQLite/sqlite-vec history and the outbox run for
+real in a scratch directory. A query set is replayed and p50/p95/p99 latency,
+throughput and (optionally) allocations are reported per stage, so
+regressions show up on a laptop.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark --repeat 3 --concurrency 8
+    python -m benchmarks.pipeline_benchmark --trace-allocations
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from collections import defaultdict
+from dataclasses import fields
+
+from benchmarks.fakes import FakeLatency, install_fakes
+from src.tracing import collect_spans
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "queries.txt")
+
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def replay(rag_main, outbox, queries, concurrency, sessions, include_queueing=False):
+    """
+    Run every query through main(); returns [(total seconds, spans)] in input order.
+
+    With include_queueing, a request's time starts when it is submitted
+    rather than when it gets one of the `concurrency` slots.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i, query):
+        submitted = time.perf_counter()
+        async with semaphore:
+            with collect_spans() as spans:
+                start = submitted if include_queueing else time.perf_counter()
+                await rag_main(query=query, session_id=f"bench-{i % sessions}")
+                return time.perf_counter() - start, spans
+
+    outbox.start()
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i, q) for i, q in enumerate(queries)))
+        wall = time.perf_counter() - start
+        # Let write-behind jobs finish so the SQLite tier is populated like production
+        while await asyncio.to_thread(outbox.stats):
+            await asyncio.sleep(0.05)
+    finally:
+        await outbox.stop()
+    return wall, results
+
+
+def report(wall, results, fakes):
+    totals = [total for total, _ in results]
+    print(f"\nrequests={len(totals)}  wall={wall:.2f}s  throughput={len(totals) / wall:.2f} req/s")
+    print(f"end-to-end  p50={percentile(totals, 50) * 1000:8.1f}ms  "
+          f"p95={percentile(totals, 95) * 1000:8.1f}ms  p99={percentile(totals, 99) * 1000:8.1f}ms")
+    print(f"embedding API calls={fakes.embedding.calls}  Gemini calls={fakes.gemini.calls}\n")
+
+    durations = defaultdict(list)
+    allocations = defaultdict(list)
+    for _, spans in results:
+        for stage, seconds, allocated in spans:
+            durations[stage].append(seconds)
+            if allocated is not None:
+                allocations[stage].append(allocated)
+
+    print(f"{'stage':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'alloc KiB':>12}")
+    for stage in sorted(durations, key=lambda s: -sum(durations[s])):
+        values = durations[stage]
+        alloc = allocations.get(stage)
+        alloc_text = f"{sum(alloc) / len(alloc) / 1024:12.1f}" if alloc else f"{'-':>12}"
+        print(f"{stage:<22}{len(values):>6}"
+              f"{percentile(values, 50) * 1000:10.1f}{percentile(values, 95) * 1000:10.1f}"
+              f"{percentile(values, 99) * 1000:10.1f}{alloc_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="file with one query per line")
+    parser.add_argument("--repeat", type=int, default=2, help="times the query set is replayed (repeats exercise the caches)")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--sessions", type=int, default=4, help="distinct session ids to spread queries over")
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="multiplier for every simulated upstream latency")
+    parser.add_argument("--trace-allocations", action="store_true",
+                        help="record net allocations per stage (forces --concurrency 1 so stages do not overlap)")
+    for f in fields(FakeLatency):
+        parser.add_argument(f"--{f.name}-delay", type=float, default=None, help=f"override {f.name} latency (s)")
+    args = parser.parse_args()
+
+    defaults = FakeLatency()
+    latency = FakeLatency(**{
+        f.name: getattr(args, f"{f.name}_delay") if getattr(args, f"{f.name}_delay") is not None
+        else getattr(defaults, f.name) * args.latency_scale
+        for f in fields(FakeLatency)
+    })
+
+    queries = load_queries(args.queries) * args.repeat
+    concurrency = 1 if args.trace_allocations else args.concurrency
+
+    # chat_history.db / outbox.db are relative paths: keep them out of the repo
+    os.chdir(tempfile.mkdtemp(prefix="rag-bench-"))
+    fakes = install_fakes(latency)
+
+    from src.step_3_llm_loaders import main as rag_main
+    from persistant_memory.outbox import outbox
+
+    print(f"workdir={os.getcwd()}  latency={latency}")
+    if args.trace_allocations:
+        tracemalloc.start()
+    wall, results = asyncio.run(replay(rag_main, outbox, queries, concurrency, args.sessions))
+    report(wall, results, fakes)
+
+
+if __name__ == "__main__":
+    main()
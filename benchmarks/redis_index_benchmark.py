@@ -0,0 +1,225 @@
+# redis_index_benchmark.py
+"""
+Compare Redis semantic-index layouts: full FLOAT32 (current), FLOAT16 and
+truncated (Matryoshka prefix) vectors, each with exact NumPy rescoring of
+the KNN candidates against the full-precision vector, as done by
+caching_hisotry.caching.redis_semantic_cache when INDEX_DIM /
+INDEX_VECTOR_TYPE are set.
+
+For every layout it reports
+  * agreement: how often the cache decision (hit/miss and winning key at
+    THRESHOLD) matches an exact full-precision brute-force search, with
+    and without rescoring,
+  * memory: vector bytes per entry in the HNSW index and in total
+    (index + hash blobs), or measured index size and Redis used_memory
+    growth (--redis),
+  * latency: p50/p95 of the KNN + rescore lookup (--redis).
+
+Vectors come from chat_history.db (vec_chat_history) when --sqlite is
+given, otherwise from a synthetic set whose variance decays with the
+dimension index, like Matryoshka embeddings; queries are a mix of
+near-duplicates of stored vectors and unrelated vectors.
+
+Usage:
+    python -m benchmarks.redis_index_benchmark                       # offline, NumPy only
+    python -m benchmarks.redis_index_benchmark --redis --entries 5000
+    python -m benchmarks.redis_index_benchmark --sqlite chat_history.db --layouts FLOAT32-3072,FLOAT16-768
+"""
+import time
+import sqlite3
+import argparse
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_batch, synthetic_queries
+
+DIM = 3072
+THRESHOLD = 0.98
+DTYPES = {"FLOAT32": np.float32, "FLOAT16": np.float16}
+DEFAULT_LAYOUTS = "FLOAT32-3072,FLOAT16-3072,FLOAT32-1536,FLOAT32-768,FLOAT16-768,FLOAT16-256"
+
+
+def normalize_rows(m):
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+
+def synthetic_vectors(entries, queries, dim, seed=7):
+    """Stored vectors plus queries: half near-duplicates (hits expected), half unrelated."""
+    rng = np.random.default_rng(seed)
+    stored = synthetic_batch(rng, entries, dim)
+    return stored, synthetic_queries(rng, stored, queries)
+
+
+def sqlite_vectors(path, queries, seed=7):
+    """Stored vectors from vec_chat_history; queries are perturbed copies and held-out rows."""
+    import sqlite_vec
+    conn = sqlite3.connect(path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    rows = conn.execute("SELECT query_vector FROM vec_chat_history").fetchall()
+    conn.close()
+    vectors = normalize_rows(np.vstack([np.frombuffer(v, dtype=np.float32) for (v,) in rows]))
+    rng = np.random.default_rng(seed)
+    rng.shuffle(vectors)
+    held_out = min(len(vectors) // 5, queries // 2)
+    stored, fresh = vectors[held_out:], vectors[:held_out]
+    n_dup = queries - held_out
+    base = stored[rng.integers(0, len(stored), n_dup)]
+    mix = rng.uniform(0.05, 0.2, size=(n_dup, 1)).astype(np.float32)
+    dups = normalize_rows(base + rng.standard_normal(base.shape).astype(np.float32) * mix / np.sqrt(base.shape[1]))
+    return stored, np.vstack([dups, fresh])
+
+
+def reduce(m, dim, vector_type):
+    """Index copy of vectors: truncated, renormalized, cast (returned as float32 for math)."""
+    return normalize_rows(m[:, :dim]).astype(DTYPES[vector_type]).astype(np.float32)
+
+
+def decide(similarities, keys):
+    best = int(np.argmax(similarities))
+    if similarities[best] >= THRESHOLD:
+        return keys[best]
+    return None
+
+
+def ground_truth(stored, queries):
+    scores = queries @ stored.T
+    return [decide(row, np.arange(len(stored))) for row in scores]
+
+
+def offline(stored, queries, truth, layout, candidates):
+    vector_type, dim = layout
+    index = reduce(stored, dim, vector_type)
+    q_index = reduce(queries, dim, vector_type)
+    approx = q_index @ index.T
+
+    rescored_ok = raw_ok = 0
+    for qi, row in enumerate(approx):
+        top = np.argpartition(-row, min(candidates, len(row) - 1))[:candidates]
+        raw = decide(row[top], top)
+        exact = decide(stored[top] @ queries[qi], top)
+        rescored_ok += exact == truth[qi]
+        raw_ok += raw == truth[qi]
+
+    index_bytes = dim * np.dtype(DTYPES[vector_type]).itemsize
+    # Hash fields: the full float32 blob, plus the reduced copy when it differs
+    hash_bytes = DIM * 4 + (index_bytes if (vector_type, dim) != ("FLOAT32", DIM) else 0)
+    return {
+        "agree_rescored": rescored_ok / len(queries),
+        "agree_raw": raw_ok / len(queries),
+        "index_bytes_per_entry": index_bytes,
+        "total_bytes_per_entry": index_bytes + hash_bytes,
+    }
+
+
+def live(stored, queries, truth, layout, candidates, host, port):
+    """Load the vectors into a scratch index on a real Redis Stack and measure it."""
+    import redis
+    vector_type, dim = layout
+    name = f"{vector_type.lower()}-{dim}"
+    prefix, index_name = f"bench:{name}:", f"idx:bench:{name}"
+    r = redis.Redis(host=host, port=port)
+    reduced = (vector_type, dim) != ("FLOAT32", DIM)
+    field = "embedding_idx" if reduced else "embedding"
+
+    try:
+        r.execute_command("FT.DROPINDEX", index_name, "DD")
+    except redis.exceptions.ResponseError:
+        pass
+    memory_before = r.info("memory")["used_memory"]
+    r.execute_command(
+        "FT.CREATE", index_name, "ON", "HASH", "PREFIX", "1", prefix, "SCHEMA",
+        field, "VECTOR", "HNSW", "10", "TYPE", vector_type, "DIM", str(dim),
+        "DISTANCE_METRIC", "COSINE", "M", "16", "EF_CONSTRUCTION", "200",
+    )
+
+    index = reduce(stored, dim, vector_type).astype(DTYPES[vector_type])
+    pipe = r.pipeline(transaction=False)
+    for i, vec in enumerate(stored):
+        mapping = {"embedding": vec.tobytes()}
+        if reduced:
+            mapping[field] = index[i].tobytes()
+        pipe.hset(f"{prefix}{i}", mapping=mapping)
+        if i % 500 == 499:
+            pipe.execute()
+    pipe.execute()
+    while int(dict(zip(*[iter(r.execute_command("FT.INFO", index_name))] * 2)).get(b"indexing", 0)):
+        time.sleep(0.1)
+    info = dict(zip(*[iter(r.execute_command("FT.INFO", index_name))] * 2))
+    memory_after = r.info("memory")["used_memory"]
+
+    k = candidates if reduced else 3
+    return_fields = ["score", "embedding"] if reduced else ["score"]
+    latencies, agree = [], 0
+    for qi, q in enumerate(queries):
+        q_bytes = reduce(q[None, :], dim, vector_type).astype(DTYPES[vector_type]).tobytes()
+        start = time.perf_counter()
+        res = r.execute_command(
+            "FT.SEARCH", index_name, f"*=>[KNN {k} @{field} $vec AS score]",
+            "PARAMS", "2", "vec", q_bytes, "SORTBY", "score", "LIMIT", "0", str(k),
+            "DIALECT", "2", "RETURN", str(len(return_fields)), *return_fields,
+        )
+        keys, sims = [], []
+        for j in range((len(res) - 1) // 2):
+            key, fields = res[1 + 2 * j], dict(zip(*[iter(res[2 + 2 * j])] * 2))
+            keys.append(int(key.decode().rsplit(":", 1)[1]))
+            if reduced:
+                sims.append(float(np.dot(q, np.frombuffer(fields[b"embedding"], dtype=np.float32))))
+            else:
+                sims.append(1.0 - float(fields[b"score"]))
+        latencies.append(time.perf_counter() - start)
+        agree += (decide(np.array(sims), keys) if keys else None) == truth[qi]
+
+    r.execute_command("FT.DROPINDEX", index_name, "DD")
+    latencies.sort()
+    return {
+        "agree_live": agree / len(queries),
+        "index_mb": float(info.get(b"vector_index_sz_mb", 0) or 0),
+        "used_memory_mb": (memory_after - memory_before) / 2 ** 20,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=2000, help="cached vectors (synthetic source)")
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--layouts", default=DEFAULT_LAYOUTS, help="comma-separated TYPE-DIM list")
+    parser.add_argument("--candidates", type=int, default=10, help="KNN size before exact rescoring")
+    parser.add_argument("--sqlite", help="take vectors from this chat_history.db instead of synthetic ones")
+    parser.add_argument("--redis", action="store_true", help="also measure index memory and latency on a live Redis Stack")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        stored, queries = sqlite_vectors(args.sqlite, args.queries)
+    else:
+        stored, queries = synthetic_vectors(args.entries, args.queries, DIM)
+    truth = ground_truth(stored, queries)
+    print(f"entries={len(stored)}  queries={len(queries)}  exact hits={sum(t is not None for t in truth)}  "
+          f"threshold={THRESHOLD}  candidates={args.candidates}\n")
+
+    header = f"{'layout':<16}{'agree':>8}{'no-rescore':>12}{'index KiB':>11}{'total KiB':>11}"
+    if args.redis:
+        header += f"{'agree live':>12}{'index MB':>10}{'Redis MB':>10}{'p50 ms':>9}{'p95 ms':>9}"
+    print(header)
+
+    for spec in args.layouts.split(","):
+        vector_type, dim = spec.strip().upper().split("-")
+        layout = (vector_type, int(dim))
+        result = offline(stored, queries, truth, layout, args.candidates)
+        line = (f"{spec.strip():<16}{result['agree_rescored']:>8.3f}{result['agree_raw']:>12.3f}"
+                f"{result['index_bytes_per_entry'] / 1024:>11.1f}{result['total_bytes_per_entry'] / 1024:>11.1f}")
+        if args.redis:
+            measured = live(stored, queries, truth, layout, args.candidates, args.host, args.port)
+            line += (f"{measured['agree_live']:>12.3f}{measured['index_mb']:>10.1f}"
+                     f"{measured['used_memory_mb']:>10.1f}{measured['p50_ms']:>9.2f}{measured['p95_ms']:>9.2f}")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# synthetic.py
+"""
+Synthetic embedding sets shared by the index benchmarks: unit vectors whose
+variance decays with the dimension index (like Matryoshka-trained
+embeddings), and query mixes of near-duplicates and unrelated vectors.
+"""
+import numpy as np
+
+
+def synthetic_batch(rng, n, dim):
+    """n unit float32 vectors with their energy concentrated in the early dimensions."""
+    scale = 1.0 / np.sqrt(1.0 + np.arange(dim) / 128.0)
+    m = rng.standard_normal((n, dim)).astype(np.float32) * scale
+    return (m / np.linalg.norm(m, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_queries(rng, stored, n):
+    """Half near-duplicates of stored rows (cosine ~0.95-0.995, straddling a 0.98 threshold), half unrelated."""
+    dim = stored.shape[1]
+    n_dup = n // 2
+    base = stored[rng.integers(0, len(stored), n_dup)]
+    noise = synthetic_batch(rng, n_dup, dim)
+    mix = rng.uniform(0.10, 0.32, size=(n_dup, 1)).astype(np.float32)
+    dups = base * np.sqrt(1 - mix ** 2) + noise * mix
+    dups /= np.linalg.norm(dups, axis=1, keepdims=True)
+    return np.vstack([dups.astype(np.float32), synthetic_batch(rng, n - n_dup, dim)])
@@ -0,0 +1,117 @@
+# exact_cache.py
+import os
+import json
+import hashlib
+import unicodedata
+import logging
+
+import redis
+
+from src.client_registry import registry
+from src.redis_pool import get_redis
+
+EXACT_KEY_PREFIX = "exact:"
+EXACT_CACHE_TTL = int(os.getenv("EXACT_CACHE_TTL", 7 * 24 * 3600))   # seconds
+CACHE_MODEL_VERSION = os.getenv("CACHE_MODEL_VERSION") or registry.model_version
+
+logger = logging.getLogger("semantic-cache")
+
+# Same pooled client as the semantic cache
+r = get_redis()
+
+
+def normalize_query(text: str) -> str:
+    """
+    Canonical form used for exact matching: Unicode NFKC, case-folded,
+    punctuation removed and whitespace collapsed, so "What is FIR?" and
+    "what is  fir" share a key.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return " ".join(text.split())
+
+
+def cache_digest(text: str, language: str = "en", model_version: str = CACHE_MODEL_VERSION) -> str:
+    """
+    Content address of a cached answer: SHA-256 over model version, answer
+    language and normalized query. The same question always maps to the same
+    key in every worker, and different questions never share one.
+    """
+    material = "\x1f".join([model_version, language or "en", normalize_query(text)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def exact_key(text: str, language: str = "en") -> str:
+    return f"{EXACT_KEY_PREFIX}{cache_digest(text, language)}"
+
+
+def exact_key_for_digest(digest: str) -> str:
+    """Exact-tier key of the answer cached under semantic:<digest>."""
+    return f"{EXACT_KEY_PREFIX}{digest}"
+
+
+class ExactCacheStats:
+    """Per-worker hit/miss counters for the exact-match tier."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def snapshot(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+exact_cache_stats = ExactCacheStats()
+
+
+def get_exact_answer(query_text: str, language: str = "en"):
+    """
+    Look up a stored answer for the normalized query text.
+
+    Returns:
+        dict | None: {"answer", "confidence_score", "question"} on a hit.
+    """
+    try:
+        raw = r.get(exact_key(query_text, language))
+    except redis.exceptions.RedisError as e:
+        exact_cache_stats.errors += 1
+        logger.warning("Exact cache lookup failed: %s", e)
+        return None
+
+    if raw is None:
+        exact_cache_stats.misses += 1
+        return None
+    exact_cache_stats.hits += 1
+    return json.loads(raw)
+
+
+def put_exact_answer(query_text: str, answer, confidence_score=None, language: str = "en", pipe=None):
+    """
+    Store (or refresh the TTL of) the answer for the normalized query text.
+    With `pipe`, the write is only queued on that pipeline (so it commits
+    together with a semantic-cache change).
+    """
+    if isinstance(answer, str):
+        try:
+            answer = json.loads(answer)
+        except json.JSONDecodeError:
+            pass
+    payload = json.dumps({
+        "answer": answer,
+        "confidence_score": confidence_score,
+        "question": query_text,
+    })
+    if pipe is not None:
+        pipe.set(exact_key(query_text, language), payload, ex=EXACT_CACHE_TTL)
+        return
+    try:
+        r.set(exact_key(query_text, language), payload, ex=EXACT_CACHE_TTL)
+    except redis.exceptions.RedisError as e:
+        logger.warning("Exact cache write failed: %s", e)
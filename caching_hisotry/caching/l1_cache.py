@@ -0,0 +1,214 @@
+# l1_cache.py
+import os
+import json
+import time
+import threading
+import logging
+
+import numpy as np
+import redis
+
+from caching_hisotry.caching.redis_semantic_cache import (
+    r, KEY_PREFIX, EMBED_FIELD, DIM, THRESHOLD, CACHE_TTL, RANK_KEY, INVALIDATION_CHANNEL, bytes_to_float32_array,
+)
+
+L1_MAX_ITEMS = int(os.getenv("L1_MAX_ITEMS", 256))
+L1_CACHE_ENABLED = os.getenv("L1_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+L1_RELOAD_SECONDS = int(os.getenv("L1_RELOAD_SECONDS", 300))   # re-rank and pick up TTLs slid by other workers
+RECONNECT_DELAY = 5   # seconds between pub/sub reconnect attempts
+BURST_RELOAD = 16     # a burst of more single-key changes than this reloads instead
+
+logger = logging.getLogger("semantic-cache")
+
+
+def _empty_snapshot():
+    return np.zeros((0, DIM), dtype=np.float32), [], {}, np.zeros(0)
+
+
+class L1SemanticCache:
+    """
+    Per-worker copy of the hottest entries of the Redis cache.
+
+    The normalized vectors sit in one contiguous float32 matrix, so a lookup
+    is a single matrix-vector dot product, and the answers are parsed once at
+    load time. The copy holds the top L1_MAX_ITEMS entries of RANK_KEY (the
+    same LFU/LRU rank eviction uses) together with each entry's Redis expiry,
+    so an entry that expires in Redis stops being served here too.
+
+    A daemon thread listens on INVALIDATION_CHANNEL: a message naming one
+    semantic:* key re-reads just that entry, anything else (refresh, evict,
+    flush) reloads the whole copy, as does L1_RELOAD_SECONDS of silence.
+    Every change builds a new snapshot swapped in with one assignment, so
+    readers never see a half-built cache.
+    """
+
+    def __init__(self, max_items=L1_MAX_ITEMS, threshold=THRESHOLD):
+        self.max_items = max_items
+        self.threshold = threshold
+        # (matrix [n, DIM], [cache_key], {cache_key: (answer, confidence_score)}, expires_at [n])
+        self._snapshot = _empty_snapshot()
+        self._thread = None
+        self.loaded_at = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.updates = 0
+
+    # -------------------------
+    # Read path
+    # -------------------------
+    def lookup(self, query_vector):
+        """
+        Best unexpired hot entry above threshold, in the shape cache_rag
+        returns, or None. Never touches Redis.
+        """
+        matrix, keys, entries, expires = self._snapshot
+        if not keys:
+            self.misses += 1
+            return None
+
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+        now = time.time()
+        scores = np.where(expires > now, matrix @ q, -np.inf)
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if CACHE_TTL > 0:
+            # The caller records the hit, which slides the Redis TTL by as much
+            expires[best] = now + CACHE_TTL
+        answer, confidence_score = entries[keys[best]]
+        return {"cache": {
+            "answer": answer,
+            "similarity": similarity,
+            "cache_key": keys[best],
+            "confidence_score": confidence_score,
+            "source": "semantic-cache-l1",
+        }}
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    @staticmethod
+    def _fetch(keys):
+        """{key: (vector, answer, confidence_score, expires_at)} for the keys that still exist."""
+        pipe = r.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, EMBED_FIELD, "answer", "confidence_score")
+            pipe.pttl(key)
+        replies = pipe.execute() if keys else []
+
+        now = time.time()
+        fetched = {}
+        for key, (emb, answer, confidence_score), pttl in zip(keys, replies[0::2], replies[1::2]):
+            if emb is None or answer is None:
+                continue   # expired or deleted
+            vec = bytes_to_float32_array(emb)
+            if vec.shape[0] != DIM:
+                continue
+            name = key.decode() if isinstance(key, bytes) else key
+            fetched[name] = (
+                vec,
+                json.loads(answer.decode()),
+                float(confidence_score) if confidence_score is not None else None,
+                now + pttl / 1000 if pttl is not None and pttl > 0 else np.inf,   # -1: no TTL
+            )
+        return fetched
+
+    def _swap(self, rows):
+        """Install [(key, vector, answer, confidence_score, expires_at)] as the new snapshot."""
+        if rows:
+            matrix = np.ascontiguousarray(np.vstack([row[1] for row in rows]), dtype=np.float32)
+        else:
+            matrix = np.zeros((0, DIM), dtype=np.float32)
+        matrix.setflags(write=False)
+        names = [row[0] for row in rows]
+        entries = {row[0]: (row[2], row[3]) for row in rows}
+        expires = np.array([row[4] for row in rows], dtype=np.float64)
+        self._snapshot = (matrix, names, entries, expires)
+
+    def reload(self):
+        """Rebuild the snapshot from the top-ranked semantic:* entries in Redis."""
+        keys = r.zrevrange(RANK_KEY, 0, self.max_items - 1)
+        fetched = self._fetch(keys)
+        self._swap([(name, *values) for name, values in fetched.items()])
+        self.loaded_at = time.time()
+        self.reloads += 1
+        logger.info("L1 cache loaded %d hot entries", len(fetched))
+
+    def apply(self, keys):
+        """Re-read only the given entries: add or replace the live ones, drop the rest."""
+        fetched = self._fetch(list(keys))
+        matrix, names, entries, expires = self._snapshot
+        rows = [
+            (name, matrix[i], *entries[name], expires[i])
+            for i, name in enumerate(names) if name not in keys
+        ]
+        for name, values in fetched.items():
+            if name in names or len(rows) < self.max_items:
+                rows.append((name, *values))
+        self._swap(rows)
+        self.updates += 1
+
+    def _listen(self):
+        while True:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Load after subscribing so no change between the two is lost
+                self.reload()
+                while True:
+                    message = pubsub.get_message(timeout=L1_RELOAD_SECONDS)
+                    if message is None:
+                        self.reload()
+                        continue
+                    # Coalesce a burst into one update: the changed keys, or
+                    # a full reload if any message was not a single key
+                    changed, full = set(), False
+                    while message is not None:
+                        data = message["data"]
+                        data = data.decode() if isinstance(data, bytes) else str(data)
+                        if data.startswith(KEY_PREFIX):
+                            changed.add(data)
+                        else:
+                            full = True
+                        message = pubsub.get_message(timeout=0.05)
+                    if full or len(changed) > BURST_RELOAD:
+                        self.reload()
+                    else:
+                        self.apply(changed)
+            except (redis.exceptions.RedisError, OSError) as e:
+                logger.warning("L1 cache listener lost Redis, clearing and retrying: %s", e)
+                self._snapshot = _empty_snapshot()
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+    def start(self):
+        """Start the invalidation listener (once per worker)."""
+        if not L1_CACHE_ENABLED or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._listen, name="l1-cache-listener", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            "entries": len(self._snapshot[1]),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "updates": self.updates,
+        }
+
+
+l1_cache = L1SemanticCache()
@@ -6,9 +6,10 @@ import time
 import typing as t
 import requests
 import logging
-from persistant_memory.loading_and_saving_chat import get_top_k_queries
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-embedding_model = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
+from src.redis_pool import get_redis, get_async_redis
+from persistant_memory.loading_and_saving_chat import get_top_k_queries_with_vectors
+from src.client_registry import registry
+from caching_hisotry.caching.exact_cache import put_exact_answer, cache_digest, exact_key_for_digest, EXACT_KEY_PREFIX
 
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
@@ -18,13 +19,39 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 
 
 
-INDEX_NAME = "idx:semantic"
 KEY_PREFIX = "semantic:"       # each cached item will be stored as HASH semantic:<id>
-EMBED_FIELD = "embedding"      # the vector field name in index
+EMBED_FIELD = "embedding"      # full-precision normalized float32 vector (always stored)
 DIM = int(os.getenv("DIM",3072))         # set this to your embedding dimension                                     
+
+# Optional reduced index: HNSW over a truncated (gemini-embedding is
+# Matryoshka-trained, so prefixes stay meaningful) and/or FLOAT16 copy. The
+# KNN returns coarse scores only; candidates within RESCORE_MARGIN of the
+# threshold are rescored exactly against EMBED_FIELD in NumPy.
+INDEX_DIM = int(os.getenv("INDEX_DIM", DIM))
+INDEX_VECTOR_TYPE = os.getenv("INDEX_VECTOR_TYPE", "FLOAT32").upper()   # FLOAT32 or FLOAT16
+REDUCED_INDEX = INDEX_DIM != DIM or INDEX_VECTOR_TYPE != "FLOAT32"
+INDEX_FIELD = "embedding_idx" if REDUCED_INDEX else EMBED_FIELD
+RESCORE_CANDIDATES = int(os.getenv("RESCORE_CANDIDATES", 10))   # KNN size when rescoring
+RESCORE_MARGIN = float(os.getenv("RESCORE_MARGIN", 0.05))        # coarse similarity this far below THRESHOLD is a miss
+# A different index per layout; drop the old one (FT.DROPINDEX) after switching
+INDEX_NAME = f"idx:semantic:{INDEX_VECTOR_TYPE.lower()}-{INDEX_DIM}" if REDUCED_INDEX else "idx:semantic"
+INDEX_DTYPES = {"FLOAT32": np.float32, "FLOAT16": np.float16}
 THRESHOLD = float(os.getenv("THRESHOLD",0.98)) # 98% similarity threshold       
 # EMBEDDING_API = os.getenv("EMBEDDING_API")
 DEFAULT_K = 3
+INVALIDATION_CHANNEL = "semantic-cache:invalidate"   # per-worker L1 caches: a semantic:* key updates that entry, anything else reloads
+REFRESH_LOCK_KEY = "lock:semantic-refresh"           # kept outside KEY_PREFIX, never indexed
+REFRESH_LOCK_SECONDS = 120
+
+# Memory budget / eviction
+CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 3 * 24 * 3600))                  # seconds, sliding on hits; 0 = no TTL
+CACHE_MAX_BYTES = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", 64 * 1024 * 1024))   # estimated bytes incl. the index copy
+EVICTION_POLICY = os.getenv("SEMANTIC_CACHE_EVICTION", "lfu").lower()            # "lfu" or "lru"
+RANK_KEY = "semcache:rank"            # ZSET key -> hits (lfu) or last hit time (lru)
+SIZES_KEY = "semcache:sizes"          # HASH key -> estimated bytes
+BYTES_KEY = "semcache:bytes"          # running total of SIZES_KEY (INCRBY on track / untrack)
+EVICTIONS_KEY = "semcache:evictions"  # entries evicted by the budget so far
+ENTRY_OVERHEAD = 256                  # rough per-key / per-field Redis bookkeeping
 
 print("THRESHOLD: ",THRESHOLD)
 # -------------------------
@@ -36,14 +63,15 @@ logger = logging.getLogger("semantic-cache")
 
 
 def embd_model(query):
-    res = embedding_model.embed_query(query)
+    res = registry.embedding_model.embed_query(query)
     return res
     # return [1,4,6,7,3,5,6]
 
 # -------------------------
 # Clients & model
 # -------------------------
-r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=False)
+# Pooled client shared with the exact-match tier (src.redis_pool)
+r = get_redis()
 
 
 # -------------------------
@@ -74,6 +102,12 @@ def bytes_to_float32_array(b: bytes) -> np.ndarray:
     """Convert raw bytes back to float32 numpy array (view, no copy)."""
     return np.frombuffer(b, dtype=np.float32)
 
+def index_vector_bytes(emb: np.ndarray, dim: int = INDEX_DIM, vector_type: str = INDEX_VECTOR_TYPE) -> bytes:
+    """Bytes of the vector the HNSW index searches: first `dim` components, renormalized, as `vector_type`."""
+    arr = np.array(emb[:dim], dtype=np.float32)
+    arr = normalize_inplace(arr)
+    return arr.astype(INDEX_DTYPES[vector_type]).tobytes()
+
 # -------------------------
 # Cosine / similarity helpers (assume normalized vectors)
 # -------------------------
@@ -91,8 +125,8 @@ def dot_similarity_normalized(a: np.ndarray, b: np.ndarray) -> float:
 # -------------------------
 # Index creation helper (run once)
 # -------------------------
-def create_index_if_not_exists(dim: int = DIM):
-    """Create RediSearch HNSW index configured for VECTOR FLOAT32 COSINE."""
+def create_index_if_not_exists(dim: int = INDEX_DIM):
+    """Create RediSearch HNSW index (INDEX_VECTOR_TYPE, INDEX_DIM, COSINE) on INDEX_FIELD."""
     try:
         r.execute_command("FT.INFO", INDEX_NAME)
         logger.info("Index already exists: %s", INDEX_NAME)
@@ -110,8 +144,8 @@ def create_index_if_not_exists(dim: int = DIM):
             "answer", "TEXT",
 
             # Vector field (all params inside schema)
-            EMBED_FIELD, "VECTOR", "HNSW", "10",
-                "TYPE", "FLOAT32",
+            INDEX_FIELD, "VECTOR", "HNSW", "10",
+                "TYPE", INDEX_VECTOR_TYPE,
                 "DIM", str(dim),
                 "DISTANCE_METRIC", "COSINE",
                 "M", "16",
@@ -128,10 +162,8 @@ def create_index_if_not_exists(dim: int = DIM):
 import json
 import numpy as np
 
-def upsert_cache_item(id: str, query_text: str, answer_text: str, confidence_score,embedding: np.ndarray):
-    key = f"{KEY_PREFIX}{id}"
-
-    
+def cache_item_mapping(query_text: str, answer_text, confidence_score, embedding: np.ndarray) -> dict:
+    """HASH fields of one cached Q/A, with the embedding normalized."""
     # If answer_text is a string, it means it's likely already JSON from SQLite.
     # We parse it so that json.dumps below produces a CLEAN string.
     if isinstance(answer_text, str):
@@ -139,44 +171,244 @@ def upsert_cache_item(id: str, query_text: str, answer_text: str, confidence_sco
             answer_text = json.loads(answer_text)
         except json.JSONDecodeError:
             pass
-    
 
     emb = normalize_inplace(np.array(embedding, dtype=np.float32))
     emb_bytes = float32_array_to_bytes(emb)
 
     mapping = {
         "query": query_text.encode("utf-8"),
-        "answer": json.dumps(answer_text).encode("utf-8"), 
-        "confidence_score":confidence_score,
+        "answer": json.dumps(answer_text).encode("utf-8"),
+        "confidence_score": confidence_score if confidence_score is not None else 0.0,
         EMBED_FIELD: emb_bytes
     }
-    r.hset(key, mapping=mapping)
+    if REDUCED_INDEX:
+        mapping[INDEX_FIELD] = index_vector_bytes(emb)
+    return mapping
+
+
+def upsert_cache_item(id: str, query_text: str, answer_text: str, confidence_score,embedding: np.ndarray):
+    key = f"{KEY_PREFIX}{id}"
+    mapping = cache_item_mapping(query_text, answer_text, confidence_score, embedding)
+    pipe = r.pipeline(transaction=True)
+    pipe.hset(key, mapping=mapping)
+    track_cache_entry(pipe, key, mapping)
+    pipe.execute()
     logger.debug("Upserted cache key=%s", key)
+    enforce_memory_budget()
+    publish_invalidation(key)
+
+
+def publish_invalidation(reason: str = "refresh"):
+    """Tell every worker's L1 cache that the Redis hot set changed."""
+    try:
+        r.publish(INVALIDATION_CHANNEL, reason)
+    except redis.exceptions.RedisError as e:
+        logger.warning("Could not publish cache invalidation: %s", e)
 
 
 
 
 
 
+# -------------------------
+# TTL, hit accounting and LFU/LRU eviction
+# -------------------------
+RECORD_HIT_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HINCRBY', KEYS[1], 'hits', 1)
+redis.call('HSET', KEYS[1], 'last_hit_at', ARGV[1])
+if tonumber(ARGV[2]) > 0 then redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+if ARGV[3] == 'lru' then
+    redis.call('ZADD', KEYS[2], ARGV[1], KEYS[1])
+else
+    redis.call('ZINCRBY', KEYS[2], 1, KEYS[1])
+end
+return 1
+"""
+_record_hit = r.register_script(RECORD_HIT_LUA)
+_arecord_hit = None
+
+# KEYS: SIZES_KEY, BYTES_KEY. ARGV: entry key, new size (absent = untrack).
+# Keeps BYTES_KEY equal to the sum of SIZES_KEY without ever reading it all
+TRACK_SIZE_LUA = """
+local old = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local new = tonumber(ARGV[2] or '0')
+if ARGV[2] then
+    redis.call('HSET', KEYS[1], ARGV[1], new)
+else
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+if new ~= old then redis.call('INCRBY', KEYS[2], new - old) end
+return new - old
+"""
+_track_size = r.register_script(TRACK_SIZE_LUA)
+
+# KEYS: RANK_KEY, SIZES_KEY, BYTES_KEY, EVICTIONS_KEY.
+# ARGV: max bytes, EXACT_KEY_PREFIX, length of KEY_PREFIX.
+# O(1) while under budget; otherwise pops the lowest-ranked entries (and
+# their exact-tier copies) until the running total fits. Entries already
+# expired by TTL only give their bytes back. Returns the evicted keys.
+EVICT_LUA = """
+local used = tonumber(redis.call('GET', KEYS[3]) or '0')
+local max_bytes = tonumber(ARGV[1])
+local evicted = {}
+while used > max_bytes do
+    local batch = redis.call('ZRANGE', KEYS[1], 0, 63)
+    if #batch == 0 then break end
+    for _, key in ipairs(batch) do
+        if used <= max_bytes then break end
+        used = used - tonumber(redis.call('HGET', KEYS[2], key) or '0')
+        redis.call('ZREM', KEYS[1], key)
+        redis.call('HDEL', KEYS[2], key)
+        redis.call('DEL', ARGV[2] .. string.sub(key, tonumber(ARGV[3]) + 1))
+        if redis.call('DEL', key) == 1 then table.insert(evicted, key) end
+    end
+end
+if used < 0 then used = 0 end
+redis.call('SET', KEYS[3], used)
+if #evicted > 0 then redis.call('INCRBY', KEYS[4], #evicted) end
+return evicted
+"""
+_evict = r.register_script(EVICT_LUA)
+
+RESET_BYTES_LUA = """
+local total = 0
+for _, size in ipairs(redis.call('HVALS', KEYS[1])) do total = total + tonumber(size) end
+redis.call('SET', KEYS[2], total)
+return total
+"""
+_reset_bytes = r.register_script(RESET_BYTES_LUA)
+
+
+def estimate_entry_bytes(key: str, mapping: dict) -> int:
+    """Approximate Redis memory of one entry: its fields plus the HNSW copy of the indexed vector."""
+    size = len(key) + ENTRY_OVERHEAD
+    for field, value in mapping.items():
+        size += len(field) + (len(value) if isinstance(value, (bytes, str)) else 8) + ENTRY_OVERHEAD // 4
+    return size + INDEX_DIM * np.dtype(INDEX_DTYPES[INDEX_VECTOR_TYPE]).itemsize
+
+
+def track_cache_entry(pipe, key: str, mapping: dict, initial_hits: float = 0):
+    """Queue the TTL, size and eviction-rank bookkeeping of a new entry on `pipe`."""
+    now = time.time()
+    # HSETNX / ZADD NX: re-upserting the same content key keeps its hit history
+    pipe.hsetnx(key, "hits", int(initial_hits))
+    pipe.hsetnx(key, "created_at", now)
+    pipe.hset(key, "last_hit_at", now)
+    if CACHE_TTL > 0:
+        pipe.expire(key, CACHE_TTL)
+    _track_size(keys=[SIZES_KEY, BYTES_KEY], args=[key, estimate_entry_bytes(key, mapping)], client=pipe)
+    pipe.zadd(RANK_KEY, {key: now if EVICTION_POLICY == "lru" else initial_hits}, nx=True)
+
+
+def exact_key_of(key) -> str:
+    """exact:<digest> key holding the same answer as semantic:<digest>."""
+    key = key.decode() if isinstance(key, bytes) else key
+    return exact_key_for_digest(key[len(KEY_PREFIX):])
+
+
+def untrack_cache_entry(pipe, key: str):
+    """Queue removal of an entry's bookkeeping and of its exact-tier copy."""
+    pipe.zrem(RANK_KEY, key)
+    _track_size(keys=[SIZES_KEY, BYTES_KEY], args=[key], client=pipe)
+    # The exact tier must not keep serving an answer the semantic cache dropped
+    pipe.delete(exact_key_of(key))
+
+
+def record_cache_hit(cache_key: str):
+    """Bump hit count / last-hit time of an entry and slide its TTL."""
+    if not cache_key:
+        return
+    try:
+        _record_hit(keys=[cache_key, RANK_KEY], args=[time.time(), CACHE_TTL, EVICTION_POLICY])
+    except redis.exceptions.RedisError as e:
+        logger.warning("Could not record cache hit for %s: %s", cache_key, e)
+
+
+async def arecord_cache_hit(cache_key: str):
+    """record_cache_hit on the async client."""
+    global _arecord_hit
+    if not cache_key:
+        return
+    try:
+        if _arecord_hit is None:
+            _arecord_hit = get_async_redis().register_script(RECORD_HIT_LUA)
+        await _arecord_hit(keys=[cache_key, RANK_KEY], args=[time.time(), CACHE_TTL, EVICTION_POLICY])
+    except redis.exceptions.RedisError as e:
+        logger.warning("Could not record cache hit for %s: %s", cache_key, e)
+
+
+def enforce_memory_budget(max_bytes: int = CACHE_MAX_BYTES) -> int:
+    """
+    Evict the least frequently (lfu) or least recently (lru) hit entries
+    until the running byte total fits max_bytes. One EVICT_LUA call: a
+    GET and a compare while under budget, so upserts stay O(1).
+
+    Returns:
+        int: number of entries evicted
+    """
+    victims = _evict(keys=[RANK_KEY, SIZES_KEY, BYTES_KEY, EVICTIONS_KEY],
+                     args=[max_bytes, EXACT_KEY_PREFIX, len(KEY_PREFIX)])
+    if victims:
+        logger.info("Evicted %d cache entries (%s)", len(victims), EVICTION_POLICY)
+        publish_invalidation("evict")
+    return len(victims)
+
+
+def reconcile_cache_bytes() -> int:
+    """
+    O(N) clean-up, run with each hot-cache refresh: drop the bookkeeping of
+    entries that expired by TTL (they never pass through untrack) and reset
+    the running total from the live sizes.
+
+    Returns:
+        int: bytes in use
+    """
+    ranked = r.zrange(RANK_KEY, 0, -1)
+    pipe = r.pipeline(transaction=False)
+    for key in ranked:
+        pipe.exists(key)
+    alive = pipe.execute() if ranked else []
+
+    pipe = r.pipeline(transaction=True)
+    for key, exists in zip(ranked, alive):
+        if not exists:
+            untrack_cache_entry(pipe, key)
+    pipe.execute()
+
+    # Summed and set in one script so a concurrent INCRBY is not lost
+    return int(_reset_bytes(keys=[SIZES_KEY, BYTES_KEY]))
+
+
+def cache_stats() -> dict:
+    """Size, estimated bytes and evictions of the Redis semantic cache."""
+    pipe = r.pipeline(transaction=False)
+    pipe.zcard(RANK_KEY)
+    pipe.get(BYTES_KEY)
+    pipe.get(EVICTIONS_KEY)
+    entries, used, evictions = pipe.execute()
+    return {
+        "entries": entries,
+        "bytes_used": int(used or 0),
+        "bytes_budget": CACHE_MAX_BYTES,
+        "evictions": int(evictions or 0),
+    }
+
+
 def _parse_search_response(res: list) -> t.List[t.Tuple[str, dict]]:
     """
     Parse the dialect-2 FT.SEARCH response to a list of (key, field_map) entries.
     Each field_map contains raw bytes as values.
     """
-    if not res:
-        return []
-    total = res[0]
-    if total == 0:
+    if not res or res[0] == 0:
         return []
 
     entries: t.List[t.Tuple[str, dict]] = []
-    i = 1
-    for _ in range(total):
+    # res[0] is the total match count; only the LIMITed page follows it
+    for i in range(1, len(res) - 1, 2):
         raw_key = res[i]            # bytes
         key = raw_key.decode() if isinstance(raw_key, (bytes, bytearray)) else str(raw_key)
-        i += 1
-        fields = res[i]             # list of [field, value, ...] with bytes
-        i += 1
+        fields = res[i + 1]         # list of [field, value, ...] with bytes
         it = iter(fields)
         field_map: dict = {}
         for f in it:
@@ -185,114 +417,167 @@ def _parse_search_response(res: list) -> t.List[t.Tuple[str, dict]]:
             val = next(it)
             field_map[name] = val
         entries.append((key, field_map))
-    print("_parse_search_response completed")
     return entries
 
 
-
-def semantic_lookup(query_text:str,query_vector:list, k: int = DEFAULT_K, threshold: float = THRESHOLD):
-
-    q_emb = np.array(query_vector, dtype=np.float32)
-    q_emb = normalize_inplace(q_emb)
-    q_bytes = float32_array_to_bytes(q_emb)
-
-    knn_clause = f"*=>[KNN {k} @{EMBED_FIELD} $vec AS score]"
-
-    res = r.execute_command(
+# -------------------------
+# Two-phase lookup: KNN returns keys + scores only; with a reduced index the
+# full vectors of near-threshold candidates are fetched for rescoring, and
+# the answer of the winning key is fetched only when it clears the threshold
+# -------------------------
+def _knn_command(q_emb: np.ndarray, k: int) -> list:
+    """Phase 1 FT.SEARCH: keys and distances only."""
+    if REDUCED_INDEX:
+        # Candidate search on the reduced index, exact rescoring afterwards
+        q_bytes = index_vector_bytes(q_emb)
+        k = max(k, RESCORE_CANDIDATES)
+    else:
+        q_bytes = float32_array_to_bytes(q_emb)
+
+    return [
         "FT.SEARCH", INDEX_NAME,
-        knn_clause,
+        f"*=>[KNN {k} @{INDEX_FIELD} $vec AS score]",
         "PARAMS", "2", "vec", q_bytes,
         "SORTBY", "score",
         "LIMIT", "0", str(k),
         "DIALECT", "2",
-        "RETURN", "4", "answer", "query", "score","confidence_score"
-    )
+        "RETURN", "1", "score"
+    ]
 
-    # print("RAW FT.SEARCH RESPONSE:", res)
 
-    hits = _parse_search_response(res)
-    if not hits:
-        print("[CACHE] No hits")
-        return None, 0.0, None
+def _coarse_scores(hits) -> t.List[t.Tuple[str, float]]:
+    """(key, similarity) from the KNN's COSINE distances."""
+    return [(key, 1.0 - float(field_map["score"].decode())) for key, field_map in hits]
 
-    best_score = -1.0
-    best_answer = None
-    best_key = None
 
-    for key, field_map in hits:
-        score_val = float(field_map["score"].decode())
-        similarity = 1.0 - score_val   # COSINE distance → similarity
-        confidence_score = float(field_map["confidence_score"].decode())
-        answer = json.loads(field_map["answer"].decode())
+def _rescore_keys(scored, threshold: float) -> t.List[str]:
+    """Candidates close enough to the threshold for their full vector to be fetched."""
+    if not REDUCED_INDEX:
+        return []
+    return [key for key, similarity in scored if similarity >= threshold - RESCORE_MARGIN]
 
-        print(f"[CACHE] key={key}, similarity={similarity:.4f}")
 
+def _best_candidate(q_emb: np.ndarray, scored, vectors=None) -> t.Tuple[t.Optional[str], float]:
+    """
+    Args:
+        scored: (key, coarse similarity) per KNN hit.
+        vectors (dict | None): key -> EMBED_FIELD bytes of the rescored
+            candidates. When given, only those compete, on exact cosine.
+    """
+    if vectors:
+        scored = [(key, float(np.dot(q_emb, bytes_to_float32_array(vectors[key]))))
+                  for key, _ in scored if vectors.get(key) is not None]
+
+    best_score = -1.0
+    best_key = None
+    for key, similarity in scored:
+        print(f"[CACHE] key={key}, similarity={similarity:.4f}")
         if similarity > best_score:
             best_score = similarity
-            best_answer = answer
             best_key = key
-            confidence_score = confidence_score
 
     print(f"[CACHE] BEST similarity={best_score:.4f}")
+    return best_key, best_score
 
-    if best_score >= threshold:
-        return best_answer, best_score, best_key,confidence_score
-
-    return None, best_score, best_key,confidence_score
-
-
-
-
-
-
-import typing as t
-def cache_rag(query_text: str,query_vector: list,k: int = DEFAULT_K,):
-
-    # -----------------------------
-    # 1. Semantic Cache Lookup
-    # -----------------------------
-    print("answer got before cached")
-    cached_answer, score, cache_key,confidence_score = semantic_lookup(query_text, query_vector,k=k)
-    print("answer got after cached")
-
-    # print("cached answer: ",cached_answer)
-    # print("cached answer: ",score)
-    # print("cached answer: ",cache_key)
-
-    cache_result = None
-    # query_emb = embd_model(query=query_text)
 
-    print("query in cached len: ",len(query_vector))
+def semantic_lookup(query_text:str,query_vector:list, k: int = DEFAULT_K, threshold: float = THRESHOLD):
+    """
+    Returns:
+        tuple: (answer or None, best similarity, best key, confidence score)
+    """
+    q_emb = normalize_inplace(np.array(query_vector, dtype=np.float32))
 
-    if cached_answer is not None:
-        # Update existing cache item (refresh)
-        # upsert_cache_item(
-        #     cache_key.replace(KEY_PREFIX, ""),  # existing ID
-        #     query_text,
-        #     cached_answer,
-        #     query_vector,
-        # )
-
-        cache_result = {
+    hits = _parse_search_response(r.execute_command(*_knn_command(q_emb, k)))
+    if not hits:
+        print("[CACHE] No hits")
+        return None, 0.0, None, None
+
+    scored = _coarse_scores(hits)
+    vectors = None
+    rescore = _rescore_keys(scored, threshold)
+    if rescore:
+        pipe = r.pipeline(transaction=False)
+        for key in rescore:
+            pipe.hget(key, EMBED_FIELD)
+        vectors = dict(zip(rescore, pipe.execute()))
+
+    best_key, best_score = _best_candidate(q_emb, scored, vectors)
+    if best_score < threshold:
+        return None, best_score, best_key, None
+
+    answer, confidence_score = r.hmget(best_key, "answer", "confidence_score")
+    if answer is None:
+        # Evicted or expired between the two phases
+        return None, best_score, best_key, None
+    return json.loads(answer.decode()), best_score, best_key, float(confidence_score or 0.0)
+
+
+async def asemantic_lookup(query_text: str, query_vector: list, k: int = DEFAULT_K, threshold: float = THRESHOLD):
+    """semantic_lookup on the pooled asyncio client; same return value."""
+    ar = get_async_redis()
+    q_emb = normalize_inplace(np.array(query_vector, dtype=np.float32))
+
+    hits = _parse_search_response(await ar.execute_command(*_knn_command(q_emb, k)))
+    if not hits:
+        print("[CACHE] No hits")
+        return None, 0.0, None, None
+
+    scored = _coarse_scores(hits)
+    vectors = None
+    rescore = _rescore_keys(scored, threshold)
+    if rescore:
+        pipe = ar.pipeline(transaction=False)
+        for key in rescore:
+            pipe.hget(key, EMBED_FIELD)
+        vectors = dict(zip(rescore, await pipe.execute()))
+
+    best_key, best_score = _best_candidate(q_emb, scored, vectors)
+    if best_score < threshold:
+        return None, best_score, best_key, None
+
+    answer, confidence_score = await ar.hmget(best_key, "answer", "confidence_score")
+    if answer is None:
+        return None, best_score, best_key, None
+    return json.loads(answer.decode()), best_score, best_key, float(confidence_score or 0.0)
+
+
+def _cache_result(cached_answer, score, cache_key, confidence_score):
+    if cached_answer is None:
+        return {"cache": None}
+    return {
+        "cache": {
             "answer": cached_answer,
             "similarity": score,
             "cache_key": cache_key,
             "confidence_score":confidence_score,
             "source": "semantic-cache",
         }
-    # print("cached rag")
-    # print("cached_result: ",cache_result)
-    return {
-        "cache": cache_result
     }
 
 
+def cache_rag(query_text: str,query_vector: list,k: int = DEFAULT_K,):
+    cached_answer, score, cache_key,confidence_score = semantic_lookup(query_text, query_vector,k=k)
+    if cached_answer is not None:
+        record_cache_hit(cache_key)
+    return _cache_result(cached_answer, score, cache_key, confidence_score)
+
+
+async def acache_rag(query_text: str, query_vector: list, k: int = DEFAULT_K):
+    """cache_rag without leaving the event loop (pooled redis.asyncio client)."""
+    cached_answer, score, cache_key, confidence_score = await asemantic_lookup(query_text, query_vector, k=k)
+    if cached_answer is not None:
+        await arecord_cache_hit(cache_key)
+    return _cache_result(cached_answer, score, cache_key, confidence_score)
+
+
 
 
 # -------------------------
 # Helper example id generator
 # -------------------------
 def simple_id_generator() -> t.Callable[[], str]:
+    # Per-process counter: workers started in the same second collide.
+    # Only for ad-hoc scripts; the app uses content_cache_key.
     counter = {"v": int(time.time() * 1000) % 1000000}
     def gen():
         counter["v"] += 1
@@ -307,12 +592,18 @@ def simple_id_generator() -> t.Callable[[], str]:
 
 import typing as t
 
+def content_cache_key(query_text: str, language: str = "en") -> str:
+    """semantic:<digest of model version + language + normalized query>."""
+    return f"{KEY_PREFIX}{cache_digest(query_text, language)}"
+
+
 def upsert_rag_response(
     rag_answer,
     query_text: str,
     query_vector: list,
     confidence_score:float,
-    id_generator: t.Callable[[], str],
+    id_generator: t.Optional[t.Callable[[], str]] = None,
+    language: str = "en",
 ):
     
     rag_answer = rag_answer
@@ -320,8 +611,12 @@ def upsert_rag_response(
     # -----------------------------
     # 3. Always Upsert RAG Result
     # -----------------------------
-    # query_emb = embd_model(query=query_text)
-    new_id = id_generator()
+    # Content-addressed by default, so upserting the same question from any
+    # worker overwrites its own entry and never another question's
+    if id_generator is None:
+        new_id = content_cache_key(query_text, language)[len(KEY_PREFIX):]
+    else:
+        new_id = id_generator()
     upsert_cache_item(
         new_id,
         query_text,
@@ -329,6 +624,7 @@ def upsert_rag_response(
         confidence_score,
         np.array(query_vector)
     )
+    put_exact_answer(query_text, rag_answer, confidence_score, language)
 
     print("upsert rag reponse")
 
@@ -336,33 +632,72 @@ def upsert_rag_response(
         "answer_test": rag_answer
     }
 
-def clear_redis_cache():
-    r.flushdb()  # or delete by prefix if shared
+def cached_keys(prefix: str = KEY_PREFIX) -> set:
+    """Every <prefix><id> key currently in Redis (semantic:* by default)."""
+    return {
+        key.decode() if isinstance(key, bytes) else key
+        for key in r.scan_iter(match=f"{prefix}*", count=500)
+    }
 
 
+def clear_redis_cache():
+    # Delete by prefix: the Redis DB may hold data that is not ours. The
+    # exact tier goes too, it holds copies of the same answers
+    keys = list(cached_keys()) + list(cached_keys(EXACT_KEY_PREFIX))
+    pipe = r.pipeline(transaction=False)
+    for i in range(0, len(keys), 500):
+        pipe.delete(*keys[i:i + 500])
+    pipe.delete(RANK_KEY, SIZES_KEY, BYTES_KEY)
+    pipe.execute()
+    publish_invalidation("flush")
+
 
 def refresh_redis_from_sqlite(limit=100):
-    print(f"🔥 Refreshing Redis hot cache (top {limit})")
-    clear_redis_cache()
-    
-    top_rows = get_top_k_queries(limit)
-    id_gen = simple_id_generator()
-    for query, answer,hits,confidence_score in top_rows:
-        emb = embedding_model.embed_query(query)
-
-        upsert_rag_response(
-            json.loads(answer),
-            query,
-            np.array(emb) ,
-            confidence_score,
-            id_gen
-        )
-
-        # upsert_cache_item(
-        #     id=id_gen, 
-        #     query_text=query, 
-        #     answer_text=json.loads(answer), 
-        #     embedding=np.array(emb)
-        #     )
-
-    print("✅ Redis cache refreshed")
\ No newline at end of file
+    """
+    Make the Redis hot set equal the SQLite top-`limit` questions.
+
+    Diff-based: entries that entered the top-N are written, entries that
+    left are deleted and the rest are untouched. Vectors come from
+    vec_chat_history, so nothing is re-embedded. All changes are applied in
+    one MULTI/EXEC, so readers see either the old or the new hot set. A
+    Redis lock keeps workers from refreshing concurrently.
+    """
+    token = f"{os.getpid()}:{time.time()}"
+    if not r.set(REFRESH_LOCK_KEY, token, nx=True, ex=REFRESH_LOCK_SECONDS):
+        print("⏭️ Redis hot cache refresh already running in another worker")
+        return
+
+    try:
+        print(f"🔥 Refreshing Redis hot cache (top {limit})")
+        top_rows = get_top_k_queries_with_vectors(limit)
+        # Same content keys as upsert_rag_response, so entries already cached
+        # on the miss path count as kept instead of being duplicated
+        desired = {content_cache_key(row[0], row[5]): row for row in top_rows}
+        current = cached_keys()
+
+        entered = [key for key in desired if key not in current]
+        left = [key for key in current if key not in desired]
+
+        if entered or left:
+            pipe = r.pipeline(transaction=True)
+            for key in left:
+                pipe.delete(key)
+                untrack_cache_entry(pipe, key)
+            for key in entered:
+                query, answer, hits, confidence_score, vector, language = desired[key]
+                mapping = cache_item_mapping(query, answer, confidence_score, vector)
+                pipe.hset(key, mapping=mapping)
+                # SQLite hit totals seed the LFU rank of refreshed entries
+                track_cache_entry(pipe, key, mapping, initial_hits=hits or 0)
+                # Exact tier rewritten in the same transaction, same answer
+                put_exact_answer(query, answer, confidence_score, language=language, pipe=pipe)
+            pipe.execute()
+            publish_invalidation("refresh")
+        reconcile_cache_bytes()
+        enforce_memory_budget()
+
+        print(f"✅ Redis cache refreshed (+{len(entered)} -{len(left)}, {len(desired) - len(entered)} kept)")
+    finally:
+        # Release only our own lock
+        if r.get(REFRESH_LOCK_KEY) == token.encode():
+            r.delete(REFRESH_LOCK_KEY)
\ No newline at end of file
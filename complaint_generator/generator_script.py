@@ -7,6 +7,9 @@ from langchain_ollama import ChatOllama
 import os
 import requests
 
+from src.client_registry import registry
+from src.admission import limits
+
 MODEL_API = os.getenv("MODEL_API")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "qwen3-embedding:0.6b")
 LLM_MODEL=os.getenv("LLM_MODEL","qwen2.5:3b-instruct-q8_0")
@@ -36,8 +39,8 @@ def safe_json_parse(text: str):
         raise ValueError("Invalid JSON from LLM")
 
 
-def llm_detect_intent(query: str) -> RouterOutput:
-    prompt = f"""
+def build_intent_prompt(query: str) -> str:
+    return f"""
 You are an intent classifier.
 
 Decide:
@@ -64,6 +67,10 @@ Examples:
 {{"intent": "GENERATION", "complaint_type": "CONSUMER"}}
 """
 
+
+def llm_detect_intent(query: str) -> RouterOutput:
+    prompt = build_intent_prompt(query)
+
     try:
         # response = router_llm.invoke(prompt)
         data = {
@@ -86,6 +93,26 @@ Examples:
         return RouterOutput(intent="QA")
 
 
+async def allm_detect_intent(query: str) -> RouterOutput:
+    """
+    Async variant of llm_detect_intent: the Ollama round-trip is awaited
+    on the shared httpx.AsyncClient instead of blocking a worker thread.
+    When the intent upstream is saturated it falls back to QA like any
+    other router error.
+    """
+    prompt = build_intent_prompt(query)
+
+    try:
+        print("model hitting api: ",f"{MODEL_API}/api/generate")
+        async with limits["intent"].slot():
+            response = await registry.http_client.post(f"{MODEL_API}/api/generate", content=prompt)
+        data = safe_json_parse(response.content)
+        return RouterOutput(**data)
+    except Exception as e:
+        print("[Router Error]", e)
+        return RouterOutput(intent="QA")
+
+
 
 # import json
 # import re
@@ -23,6 +23,13 @@ client = genai.Client()
 
 MODEL_NAME = "gemini-2.5-flash"
 
+GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+}
+
 
 # ======================================================
 # PROMPT BUILDER
@@ -215,6 +222,18 @@ Generate the complaint strictly in the above FOUR-PAGE format, preserving neutra
 """
 
 
+def build_generation_request(user_input: str) -> dict:
+    """
+    Keyword arguments for generate_content, shared by the sync and async
+    generators so the prompt and sampling config cannot drift apart.
+    """
+    return {
+        "model": MODEL_NAME,
+        "contents": build_general_legal_prompt(user_input),
+        "config": GENERATION_CONFIG,
+    }
+
+
 # ======================================================
 # GEMINI GENERATION (SYNCHRONOUS)
 # ======================================================
@@ -232,18 +251,8 @@ def generate_legal_text(user_input: str) -> str:
         print(f"Calling Gemini API with model: {MODEL_NAME}")
         
         # model = genai.GenerativeModel(MODEL_NAME)
-        prompt = build_general_legal_prompt(user_input)
         # Generate content
-        response = client.models.generate_content(
-            model = "gemini-2.5-flash",
-            contents = prompt,
-            config={
-                "temperature": 0.3,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-            }
-        )
+        response = client.models.generate_content(**build_generation_request(user_input))
 
         # Extract text
         legal_text = response.text.strip()
@@ -257,6 +266,33 @@ def generate_legal_text(user_input: str) -> str:
         raise RuntimeError(f"Failed to generate legal document: {str(e)}")
 
 
+async def agenerate_legal_text(user_input: str) -> str:
+    """
+    Async variant of generate_legal_text using the genai aio client,
+    so the Gemini round-trip does not block a worker thread.
+    
+    Args:
+        user_input (str): User's request with facts and details
+        
+    Returns:
+        str: Generated legal document text
+    """
+    try:
+        print(f"Calling Gemini API with model: {MODEL_NAME}")
+
+        response = await client.aio.models.generate_content(**build_generation_request(user_input))
+
+        legal_text = response.text.strip()
+
+        print(f"✓ Successfully generated legal document ({len(legal_text)} characters)")
+
+        return legal_text
+
+    except Exception as e:
+        print(f"✗ Error generating legal text: {str(e)}")
+        raise RuntimeError(f"Failed to generate legal document: {str(e)}")
+
+
 # ======================================================
 # DOCX CREATOR
 # ======================================================
@@ -1,21 +1,53 @@
 from fastapi import FastAPI,BackgroundTasks,Request
+from contextlib import asynccontextmanager
+from typing import Optional
 from pydantic import BaseModel
-import asyncio
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import time
 from src.step_3_llm_loaders import main
-from milvus_database.milvus_loading import loading_milvus
 import os
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Header
 from multilingual_pipeline.language_detection import detect_language
 from multilingual_pipeline.conversion import output_converison,translation
+from src.async_utils import run_blocking, shutdown_executor
+from src.client_registry import registry
+from src.speculation import speculation_stats
+from persistant_memory.outbox import outbox
+from persistant_memory.sqlite_pool import chat_db
+from src.request_context import embedding_lru
+from src.tracing import ServerTimingMiddleware, span, render_metrics, register_collector
+from caching_hisotry.caching.l1_cache import l1_cache
+from caching_hisotry.caching.exact_cache import exact_cache_stats
+from caching_hisotry.caching.redis_semantic_cache import cache_stats as semantic_cache_stats
+from src.redis_pool import close_async_redis
+from src.admission import Overloaded, admission, limits, limiter_snapshot
+from src.single_flight import question_flights, idempotent_requests
 
 import httpx
 
 
 BASE_DIR = os.getcwd()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build and warm every upstream client once per worker before serving
+    await registry.start()
+    # Per-worker hot-set copy of the Redis cache, kept fresh via pub/sub
+    l1_cache.start()
+    # Drain write-behind jobs (history, cache upserts, documents), including
+    # any left over from before a restart
+    outbox.start()
+    yield
+    await outbox.stop()
+    await registry.close()
+    await close_async_redis()
+    shutdown_executor()
+    chat_db.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost",
@@ -30,7 +62,37 @@ app.add_middleware(
     allow_credentials=True,           # Allow cookies and auth headers
     allow_methods=["*"],              # Allow all HTTP methods
     allow_headers=["*"],              # Allow all headers
+    expose_headers=["Server-Timing"], # Let browser clients read per-stage timings
 )
+# Per-stage spans -> Server-Timing header + /metrics histograms
+app.add_middleware(ServerTimingMiddleware)
+
+register_collector("rag_speculation", "gauge", "Speculative retrieval counters.", speculation_stats.snapshot)
+register_collector("rag_embedding_lru", "counter", "Query-embedding LRU lookups.",
+                   lambda: {"hits": embedding_lru.hits, "misses": embedding_lru.misses})
+register_collector("rag_outbox_jobs", "gauge", "Write-behind jobs queued per status.", outbox.stats)
+register_collector("rag_l1_cache", "gauge", "Per-worker L1 semantic cache entries, hits and reloads.", l1_cache.stats)
+register_collector("rag_semantic_cache", "gauge", "Redis semantic cache entries, estimated bytes, budget and evictions.",
+                   semantic_cache_stats)
+register_collector("rag_exact_cache", "gauge", "Exact-match (normalized text) cache tier lookups and hit ratio.",
+                   exact_cache_stats.snapshot)
+register_collector("rag_admission", "gauge", "Requests in flight / queued and requests shed.", admission.snapshot)
+register_collector("rag_single_flight_question", "counter", "Cache-miss generations led vs coalesced per worker.",
+                   question_flights.snapshot)
+register_collector("rag_single_flight_idempotency", "counter", "Idempotency-Key requests executed vs replayed per worker.",
+                   idempotent_requests.snapshot)
+register_collector("rag_upstream_limits", "counter", "Upstream calls throttled or rejected per limiter.", limiter_snapshot)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Shed load fast: 503 + Retry-After instead of queueing for minutes."""
+    print(f"⚠️ Shedding request to {request.url.path}: {exc.reason}")
+    return JSONResponse(
+        {"detail": "Service overloaded, please retry.", "reason": exc.reason},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 # Request model: user sends a question
@@ -45,20 +107,81 @@ class AnswerResponse(BaseModel):
 async def root():
     return {"message": "Hello World"}
 
-@app.post("/query", response_model=AnswerResponse)
-def answer_question(request: QuestionRequest):
-    user_question = request.question
-    session_id = request.session_id
-    start_time = time.time()
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the critical upstream clients have warmed successfully."""
+    if not registry.ready:
+        return JSONResponse({"ready": False, "warm_up": registry.warm_up_status}, status_code=503)
+    return {"ready": True, "warm_up": registry.warm_up_status}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (stage latency histograms and counters)."""
+    text = await run_blocking(render_metrics)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
 
-    detected_lang = detect_language(user_question)
+@app.get("/stats/speculation")
+async def speculation():
+    """Wasted speculative retrieval work vs latency saved on cache misses."""
+    return speculation_stats.snapshot()
+
+@app.get("/stats/semantic_cache")
+async def semantic_cache():
+    """Redis semantic cache size against its memory budget, and evictions."""
+    return await run_blocking(semantic_cache_stats)
+
+@app.get("/stats/exact_cache")
+async def exact_cache():
+    """Hit ratio of the exact-match tier, reported apart from the semantic tiers."""
+    return exact_cache_stats.snapshot()
+
+@app.get("/stats/admission")
+async def admission_stats():
+    """Request queue occupancy, shed requests and per-upstream throttling."""
+    return {**admission.snapshot(), **limiter_snapshot()}
+
+@app.get("/stats/single_flight")
+async def single_flight_stats():
+    """Generations led vs coalesced, for duplicate questions and idempotent retries."""
+    return {"question": question_flights.snapshot(), "idempotency": idempotent_requests.snapshot()}
+
+@app.get("/stats/outbox")
+async def outbox_stats():
+    """Write-behind jobs still queued, per status."""
+    return await run_blocking(outbox.stats)
+
+async def answer(user_question, session_id):
+    with span("language_detection"):
+        detected_lang = await run_blocking(detect_language, user_question)
     print("detected langauge",detected_lang)
 
-    translate_query = translation(detected_lang=detected_lang,user_query=user_question)
+    async with limits["translate"].slot():
+        with span("translation"):
+            translate_query = await run_blocking(translation, detected_lang=detected_lang,user_query=user_question)
 
     print("translated query: ",translate_query)
-    db_load = loading_milvus()
-    response_data = asyncio.run(main(query=translate_query,session_id= session_id))
+    return await main(query=translate_query,session_id= session_id)
+
+@app.post("/query", response_model=AnswerResponse)
+async def answer_question(request: QuestionRequest, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    user_question = request.question
+    session_id = request.session_id
+    start_time = time.time()
+
+    # Bounded queue: raises Overloaded (-> 503) when full or after QUEUE_MAX_WAIT.
+    # Retries waiting on an Idempotency-Key hold a slot too, so a burst of them
+    # cannot tie up pooled Redis (pub/sub) connections without limit
+    async with admission.admit():
+        if idempotency_key:
+            # A client retry with the same key waits for (or reuses) the first
+            # attempt's response instead of running the pipeline again
+            response_data, first = await idempotent_requests.run(
+                f"{session_id}:{idempotency_key}", lambda: answer(user_question, session_id)
+            )
+            if not first:
+                print(f"🔁 Replayed response for Idempotency-Key {idempotency_key}")
+        else:
+            response_data = await answer(user_question, session_id)
     elapsed_time = time.time() - start_time
 
     print(f"\nTotal time consumed: {elapsed_time:.2f} seconds")
@@ -30,32 +30,79 @@ def translation(detected_lang, user_query):
 
 
 
+# Use a less "natural" placeholder that is unlikely to be altered
+LINE_BREAK_PLACEHOLDER = "__[[[LINE_BREAK]]]__"
+
+# Language the RAG answers are generated in
+SOURCE_LANGUAGE = "en"
+
+
+def protect_newlines(text):
+    return text.replace("\n", LINE_BREAK_PLACEHOLDER)
+
+
+def restore_newlines(translated_text):
+    # Normalize potential placeholder variants before restoring newlines
+    translated_text = re.sub(
+        r'[_\s\[\]]*LINE[\s_]*BREAK[_\s\[\]]*',
+        LINE_BREAK_PLACEHOLDER,
+        translated_text,
+        flags=re.IGNORECASE
+    )
+
+    # Replace placeholders with actual newlines
+    return translated_text.replace(LINE_BREAK_PLACEHOLDER, "\n")
+
+
 def output_converison(text, targeted_language):
     if targeted_language and targeted_language.strip():
         try:
-            # Use a less "natural" placeholder that is unlikely to be altered
-            placeholder = "__[[[LINE_BREAK]]]__"
-            text_with_placeholders = text.replace("\n", placeholder)
+            text_with_placeholders = protect_newlines(text)
 
             translation = translate_client.translate(
                 text_with_placeholders,
                 target_language=targeted_language
             )
 
-            translated_text = translation['translatedText']
-
-            # Normalize potential placeholder variants before restoring newlines
-            translated_text = re.sub(
-                r'[_\s\[\]]*LINE[\s_]*BREAK[_\s\[\]]*',
-                placeholder,
-                translated_text,
-                flags=re.IGNORECASE
-            )
-
-            # Replace placeholders with actual newlines
-            text = translated_text.replace(placeholder, "\n")
+            text = restore_newlines(translation['translatedText'])
 
         except Exception as e:
             print("Translation failed:", str(e))
     return text
 
+
+def translate_fields(fields, targeted_language, source_language=SOURCE_LANGUAGE):
+    """
+    Translate every field of one answer in a single batched Translate call.
+
+    Fields are returned untouched when the target language matches the
+    source language, and non-string / empty fields are passed through, so
+    English answers cost no Translate round-trip at all.
+
+    Args:
+        fields (list): Field values (explanation, follow-up, table data, ...).
+        targeted_language (str): ISO code to translate into.
+        source_language (str): ISO code the fields are written in.
+
+    Returns:
+        list: Translated fields, in the same order.
+    """
+    fields = list(fields)
+    if not targeted_language or not targeted_language.strip() or targeted_language == source_language:
+        return fields
+
+    positions = [i for i, f in enumerate(fields) if isinstance(f, str) and f.strip()]
+    if not positions:
+        return fields
+
+    try:
+        translations = translate_client.translate(
+            [protect_newlines(fields[i]) for i in positions],
+            target_language=targeted_language,
+            source_language=source_language,
+        )
+        for i, translation in zip(positions, translations):
+            fields[i] = restore_newlines(translation["translatedText"])
+    except Exception as e:
+        print("Translation failed:", str(e))
+    return fields
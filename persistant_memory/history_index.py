@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+
+# Coarse index for search_history_semantic. Off by default (exact scan of
+# vec_chat_history); set HISTORY_INDEX_TYPE to int8 / bit / float and
+# HISTORY_INDEX_DIM to a Matryoshka prefix length to enable it.
+HISTORY_INDEX_TYPE = os.getenv("HISTORY_INDEX_TYPE", "").lower()
+HISTORY_INDEX_DIM = int(os.getenv("HISTORY_INDEX_DIM", 768))
+HISTORY_RESCORE_CANDIDATES = int(os.getenv("HISTORY_RESCORE_CANDIDATES", 40))
+FULL_DIM = 3072
+
+_COLUMN = {"float": "float", "int8": "int8", "bit": "bit"}
+
+
+def quantize_int8(vector):
+    """
+    Symmetric int8 with a per-vector scale. Cosine distance ignores the
+    scale, so unlike vec_quantize_int8(..., 'unit') the full int8 range is
+    used even though a unit 3072-dim vector has components around +-0.02.
+    """
+    peak = float(np.max(np.abs(vector))) or 1.0
+    return np.round(vector / peak * 127).astype(np.int8)
+
+
+class HistoryIndex:
+    """
+    Reduced copy of vec_chat_history for the coarse KNN pass.
+
+    Each row keeps the first `dim` dimensions of the stored vector,
+    renormalized and stored as float32, int8 or 1 bit per dimension, in its
+    own vec0 table (rowid = chat_history.id). A lookup takes the `candidates`
+    nearest rows from it and rescores them with vec_distance_cosine against
+    the full float32 vectors in vec_chat_history, so the similarity compared
+    to the proximity threshold is exactly what the exact scan reports.
+
+    Rescoring does one rowid lookup per candidate, about 0.1 ms with the
+    pool's mmap; vec0 answers `rowid IN (...)` with a full table scan.
+    """
+
+    def __init__(self, vector_type, dim=HISTORY_INDEX_DIM, candidates=HISTORY_RESCORE_CANDIDATES):
+        if vector_type not in _COLUMN:
+            raise ValueError(f"HISTORY_INDEX_TYPE must be one of {sorted(_COLUMN)}, got {vector_type!r}")
+        if vector_type == "bit" and dim % 8:
+            raise ValueError("bit vectors need a dimension divisible by 8")
+        self.vector_type = vector_type
+        self.dim = min(dim, FULL_DIM)
+        self.candidates = candidates
+        self.table = f"vec_chat_history_{vector_type}{self.dim}"
+
+    @classmethod
+    def from_env(cls):
+        if not HISTORY_INDEX_TYPE:
+            return None
+        return cls(HISTORY_INDEX_TYPE)
+
+    def reduce(self, vector):
+        """Truncate + renormalize, and return (SQL wrapper, bound blob) for this layout."""
+        prefix = np.asarray(vector, dtype=np.float32)[: self.dim]
+        prefix = prefix / (np.linalg.norm(prefix) or 1.0)
+        if self.vector_type == "int8":
+            return "vec_int8(?)", quantize_int8(prefix).tobytes()
+        if self.vector_type == "bit":
+            return "vec_quantize_binary(?)", prefix.astype(np.float32).tobytes()
+        return "?", prefix.astype(np.float32).tobytes()
+
+    def create(self, cursor):
+        # bit columns only support hamming distance; the others use cosine
+        metric = "" if self.vector_type == "bit" else " distance_metric=cosine"
+        cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING vec0(
+            query_vector {_COLUMN[self.vector_type]}[{self.dim}]{metric}
+        )
+        """)
+
+    def insert(self, cursor, row_id, vector):
+        wrapper, blob = self.reduce(vector)
+        cursor.execute(f"DELETE FROM {self.table} WHERE rowid = ?", (row_id,))
+        cursor.execute(f"INSERT INTO {self.table}(rowid, query_vector) VALUES (?, {wrapper})", (row_id, blob))
+
+    def backfill(self, cursor, batch=1000):
+        """Index rows of vec_chat_history that are missing (first start with this layout)."""
+        added = 0
+        last = cursor.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {self.table}").fetchone()[0]
+        while True:
+            rows = cursor.execute(
+                "SELECT rowid, query_vector FROM vec_chat_history WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last, batch),
+            ).fetchall()
+            if not rows:
+                break
+            for row_id, blob in rows:
+                self.insert(cursor, row_id, np.frombuffer(blob, dtype=np.float32))
+            last = rows[-1][0]
+            added += len(rows)
+        if added:
+            print(f"📐 Indexed {added} history vectors into {self.table}")
+
+    def nearest(self, conn, query_vector, top_k):
+        """
+        Coarse KNN, then exact rescoring.
+
+        Returns:
+            list: (rowid, cosine distance) of the top_k rows, nearest first.
+        """
+        wrapper, blob = self.reduce(query_vector)
+        candidates = conn.execute(
+            f"SELECT rowid FROM {self.table} WHERE query_vector MATCH {wrapper} AND k = ?",
+            (blob, max(self.candidates, top_k)),
+        ).fetchall()
+        query_blob = np.asarray(query_vector, dtype=np.float32).tobytes()
+        rescored = []
+        for (row_id,) in candidates:
+            row = conn.execute(
+                "SELECT vec_distance_cosine(query_vector, ?) FROM vec_chat_history WHERE rowid = ?",
+                (query_blob, row_id),
+            ).fetchone()
+            if row is not None:
+                rescored.append((row_id, row[0]))
+        rescored.sort(key=lambda row: row[1])
+        return rescored[:top_k]
+
+
+history_index = HistoryIndex.from_env()
@@ -1,11 +1,25 @@
+import os
 import sqlite3
 import sqlite_vec
 import json
 import time
+import hashlib
+import threading
 import numpy as np
 import struct
+from caching_hisotry.caching.exact_cache import put_exact_answer, normalize_query
+from persistant_memory.sqlite_pool import DB_PATH, chat_db
+from persistant_memory.history_index import history_index
 
-DB_PATH = "chat_history.db"
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+# A new question at least this similar to a stored (canonical) question is
+# saved as a variant of it: its own per-session row and hit count, but the
+# canonical row's vector and answer. Set above 1 to give every row its own.
+CANONICAL_SIMILARITY = float(os.getenv("CANONICAL_SIMILARITY", 0.97))
+CANONICAL_CANDIDATES = 5    # nearest rows checked for one in the same answer language
+PROCESSED_JOBS_TTL = 24 * 3600
 
 # def init_db():
 #     conn = sqlite3.connect(DB_PATH)
@@ -41,11 +55,33 @@ DB_PATH = "chat_history.db"
 
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.enable_load_extension(True)
-    sqlite_vec.load(conn)
-    cursor = conn.cursor()
+    """Create the tables once per process; later calls return immediately."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            _create_schema(chat_db.connection())
+            _schema_ready = True
+
 
+def _create_schema(conn):
+    """
+    Create or migrate the schema in one write transaction. init_db runs at
+    import in every gunicorn worker; BEGIN IMMEDIATE takes the write lock
+    before any "does this column / row exist" check, so a worker that
+    starts while another migrates waits and then sees the finished schema.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _apply_schema(conn.cursor())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _apply_schema(cursor):
     # 1. Main table - REMOVED the UNIQUE constraint to allow all queries
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS chat_history (
@@ -60,19 +96,156 @@ def init_db():
     )
     """)
 
-    # 2. Virtual Vector Table
+    # canonical_id: NULL for a canonical row (it has the vector and the
+    # answer), else the id of the canonical row this variant shares them with.
+    # language: the language the answer was given in (part of cache keys)
+    _add_column(cursor, "chat_history", "canonical_id", "INTEGER")
+    _add_column(cursor, "chat_history", "language", "TEXT NOT NULL DEFAULT 'en'")
+
+    # 2. Virtual Vector Table (canonical rows only, rowid = chat_history.id)
     cursor.execute("""
     CREATE VIRTUAL TABLE IF NOT EXISTS vec_chat_history USING vec0(
         query_vector float[3072]
     )
     """)
 
-    conn.commit()
-    conn.close()
+    # 3. Indexes for the per-session lookups. The rowid (id) is implicitly
+    # the last column of each index, so idx_chat_session also serves
+    # "ORDER BY id" within a session and idx_chat_question "latest row of
+    # this question"
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_session_question ON chat_history (session_id, question)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_session ON chat_history (session_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_question ON chat_history (question)")
+
+    # 4. Per-question totals, maintained by save_chat_turn in the same
+    # transaction, so the hot-cache refresh reads the top-K off an index
+    # instead of aggregating the whole history. Variants count towards
+    # their canonical question
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS query_stats (
+        question_hash TEXT PRIMARY KEY,
+        question TEXT NOT NULL,
+        total_hits INTEGER NOT NULL DEFAULT 0,
+        latest_id INTEGER NOT NULL,
+        best_confidence FLOAT,
+        last_asked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        language TEXT NOT NULL DEFAULT 'en'
+    )
+    """)
+    _add_column(cursor, "query_stats", "language", "TEXT NOT NULL DEFAULT 'en'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_stats_hits ON query_stats (total_hits, latest_id)")
+
+    if cursor.execute("SELECT 1 FROM query_stats LIMIT 1").fetchone() is None:
+        _backfill_query_stats(cursor)
+
+    # Optional reduced (truncated / int8 / bit) copy for the coarse KNN pass
+    if history_index is not None:
+        history_index.create(cursor)
+        history_index.backfill(cursor)
+
+    # 5. Counters kept in step with the tables, so hot paths never COUNT(*).
+    # history_rows is seeded from the table once; refresh_epoch records the
+    # last K_THRESHOLD multiple a hot-cache refresh was claimed for
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS chat_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO chat_counters (name, value)
+        VALUES ('history_rows', (SELECT COUNT(*) FROM chat_history)), ('refresh_epoch', 0)
+    """)
+
+    # 6. Outbox jobs already applied by save_chat_turn. Jobs run at least
+    # once, so a retry after a commit must not count the turn again
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS processed_jobs (
+        job_key TEXT PRIMARY KEY,
+        processed_at REAL NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_jobs_at ON processed_jobs (processed_at)")
+
+
+def _add_column(cursor, table, column, declaration):
+    """ALTER TABLE ... ADD COLUMN unless an older database already has it (checked under the schema lock)."""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def question_hash(question, language="en"):
+    """
+    Key of a question in query_stats: SHA-256 of its normalized text, per
+    answer language. English keeps the bare-text hash, so keys written
+    before the language was recorded stay valid.
+    """
+    material = normalize_query(question)
+    if (language or "en") != "en":
+        material = f"{language}\x1f{material}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _backfill_query_stats(cursor):
+    """One-off: build query_stats from an existing history (first start after upgrading)."""
+    stats = {}
+    rows = cursor.execute("""
+        SELECT COALESCE(h.canonical_id, h.id), COALESCE(c.question, h.question),
+               h.hit_count, COALESCE(c.confidence_score, h.confidence_score), h.last_asked_at, h.language
+        FROM chat_history h
+        LEFT JOIN chat_history c ON c.id = h.canonical_id
+        ORDER BY h.last_asked_at, h.id
+    """).fetchall()
+    for row_id, question, hits, confidence, last_asked_at, language in rows:
+        key = question_hash(question, language)
+        _, total, _, best, _, _ = stats.get(key, (None, 0, None, None, None, None))
+        if confidence is not None and (best is None or confidence > best):
+            best = confidence
+        # Rows are in asking order, so the last one seen is the latest answer
+        stats[key] = (question, total + int(hits or 1), row_id, best, last_asked_at, language)
+
+    # OR IGNORE: never fail startup over a question another writer already added
+    cursor.executemany("""
+        INSERT OR IGNORE INTO query_stats (question_hash, question, total_hits, latest_id, best_confidence, last_asked_at, language)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(key, *values) for key, values in stats.items()])
+    if stats:
+        print(f"📊 Backfilled query_stats for {len(stats)} questions")
 
 # Helper to convert list/numpy to bit-format for sqlite-vec
 def serialize_vector(vector):
-    return np.array(vector, dtype=np.float32).tobytes()
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _nearest_canonical(conn, query_vector, language="en"):
+    """
+    Canonical row a new question should be attached to. Only rows answered
+    in the same language qualify: the shared answer is already translated.
+
+    Returns:
+        tuple | None: (id, question) of the nearest such stored question if
+        it is within CANONICAL_SIMILARITY, else None.
+    """
+    if CANONICAL_SIMILARITY > 1:
+        return None
+    if history_index is not None:
+        nearest = history_index.nearest(conn, query_vector, CANONICAL_CANDIDATES)
+    else:
+        query_vec = serialize_vector(query_vector)
+        nearest = conn.execute("""
+            SELECT rowid, vec_distance_cosine(query_vector, ?)
+            FROM vec_chat_history
+            WHERE query_vector MATCH ? AND k = ?
+        """, (query_vec, query_vec, CANONICAL_CANDIDATES)).fetchall()
+    for row_id, distance in sorted(nearest, key=lambda row: row[1]):
+        if 1 - distance < CANONICAL_SIMILARITY:
+            break
+        row = conn.execute("SELECT id, question FROM chat_history WHERE id = ? AND language = ?",
+                           (row_id, language or "en")).fetchone()
+        if row is not None:
+            return row
+    return None
 
 # def save_chat_turn(session_id, question, answer_dict, query_vector,confidence_score):
 #     conn = sqlite3.connect(DB_PATH)
@@ -116,92 +289,209 @@ def serialize_vector(vector):
 #         conn.close()
 
 
-def save_chat_turn(session_id, question, answer_dict, query_vector, confidence_score):
-    conn = sqlite3.connect(DB_PATH)
-    conn.enable_load_extension(True)
-    sqlite_vec.load(conn)
+def save_chat_turn(session_id, question, answer_dict, query_vector, confidence_score, language="en", job_key=None,
+                   fresh_answer=False):
+    """
+    Persist one turn. With job_key (the outbox job saving it), a job that
+    already committed is skipped, so retries do not double count hits.
+
+    Args:
+        fresh_answer (bool): The answer was just generated (a cache miss).
+            Only such answers replace the one stored on an existing
+            canonical row; turns served from a cache tier only count a hit.
+
+    Returns:
+        bool: False if job_key was already processed, else True.
+    """
+    conn = chat_db.connection()
     cursor = conn.cursor()
     
     try:
+        if job_key is not None:
+            # Recorded in the same transaction as the turn itself
+            cursor.execute("INSERT OR IGNORE INTO processed_jobs (job_key, processed_at) VALUES (?, ?)",
+                           (job_key, time.time()))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                print(f"⏭️ Outbox job {job_key} already saved, skipping")
+                return False
+            # Retries end well within a day; keep the table small
+            cursor.execute("DELETE FROM processed_jobs WHERE processed_at < ?", (time.time() - PROCESSED_JOBS_TTL,))
+
         # Step A: Check for an EXACT match in this session to increment count
+        # (an answer in another language is a different cache entry)
         cursor.execute("""
-            SELECT id FROM chat_history 
-            WHERE session_id = ? AND question = ?
+            SELECT h.id, h.canonical_id, c.question
+            FROM chat_history h
+            LEFT JOIN chat_history c ON c.id = h.canonical_id
+            WHERE h.session_id = ? AND h.question = ? AND h.language = ?
             LIMIT 1
-        """, (session_id, question))
+        """, (session_id, question, language or "en"))
         
         existing_row = cursor.fetchone()
 
         if existing_row:
-            # EXACT MATCH: Just update the existing entry
-            row_id = existing_row[0]
-            cursor.execute("""
-                UPDATE chat_history SET 
-                    answer = ?, 
-                    confidence_score = ?,
-                    hit_count = hit_count + 1, 
-                    last_asked_at = CURRENT_TIMESTAMP 
-                WHERE id = ?
-            """, (json.dumps(answer_dict), confidence_score, row_id))
+            row_id, canonical_id, canonical_question = existing_row
+            if canonical_id is None and fresh_answer:
+                # EXACT MATCH: Just update the existing entry
+                cursor.execute("""
+                    UPDATE chat_history SET 
+                        answer = ?, 
+                        confidence_score = ?,
+                        hit_count = hit_count + 1, 
+                        last_asked_at = CURRENT_TIMESTAMP 
+                    WHERE id = ?
+                """, (json.dumps(answer_dict), confidence_score, row_id))
+            else:
+                # Served from a cache (which read this row), or a variant
+                # whose answer lives on the canonical row
+                cursor.execute("""
+                    UPDATE chat_history SET 
+                        hit_count = hit_count + 1, 
+                        last_asked_at = CURRENT_TIMESTAMP 
+                    WHERE id = ?
+                """, (row_id,))
             print(f"🔄 Exact match! Incremented hit_count for ID: {row_id}")
         else:
-            # NEW QUERY: Insert as a fresh row (allows similar but unique entries)
+            canonical = _nearest_canonical(conn, query_vector, language)
+            canonical_id, canonical_question = canonical if canonical else (None, None)
+            # NEW QUERY: Insert as a fresh row. A near-paraphrase of a stored
+            # question only records the session row (answer kept on the
+            # canonical row, so the placeholder '' is never read)
             cursor.execute("""
-                INSERT INTO chat_history (session_id, timestamp, question, answer, confidence_score, hit_count)
-                VALUES (?, ?, ?, ?, ?, 1)
+                INSERT INTO chat_history (session_id, timestamp, question, answer, confidence_score, hit_count, canonical_id, language)
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?)
                 RETURNING id
-            """, (session_id, time.strftime("%Y-%m-%d %H:%M:%S"), question, json.dumps(answer_dict), confidence_score))
+            """, (session_id, time.strftime("%Y-%m-%d %H:%M:%S"), question,
+                  "" if canonical_id is not None else json.dumps(answer_dict), confidence_score, canonical_id,
+                  language or "en"))
             
             row_id = cursor.fetchone()[0]
-            print(f"🆕 New entry saved! Assigned ID: {row_id}")
-
-        # Step B: Sync the vector table
-        # Delete old vector if it existed (for updates), then insert new vector
-        cursor.execute("DELETE FROM vec_chat_history WHERE rowid = ?", (row_id,))
+            cursor.execute("UPDATE chat_counters SET value = value + 1 WHERE name = 'history_rows'")
+            if canonical_id is not None:
+                print(f"🔗 New entry saved as a variant of ID {canonical_id}! Assigned ID: {row_id}")
+            else:
+                print(f"🆕 New entry saved! Assigned ID: {row_id}")
+
+        # Cache hits carry a blended similarity/confidence score and an answer
+        # read from a cache, so only a fresh answer's own Confidence_Score is
+        # compared with (and may replace) the canonical answer
+        answer_confidence = answer_dict.get("confidence_score") if fresh_answer else None
+        if canonical_id is not None and answer_confidence is not None:
+            cursor.execute("""
+                UPDATE chat_history SET answer = ?, confidence_score = ?
+                WHERE id = ? AND (confidence_score IS NULL OR confidence_score < ?)
+            """, (json.dumps(answer_dict), answer_confidence, canonical_id, answer_confidence))
+        new_canonical = not existing_row and canonical_id is None
+        stats_confidence = confidence_score if fresh_answer or new_canonical else None
+
+        # Hits of a variant count towards its canonical question, whose row
+        # holds the answer and vector the hot cache is rebuilt from
+        stats_question = canonical_question if canonical_id is not None else question
+        stats_row_id = canonical_id if canonical_id is not None else row_id
+
+        # Step B: Per-question totals (same transaction as the history row)
         cursor.execute("""
-            INSERT INTO vec_chat_history(rowid, query_vector) 
-            VALUES (?, ?)
-        """, (row_id, serialize_vector(query_vector)))
+            INSERT INTO query_stats (question_hash, question, total_hits, latest_id, best_confidence, last_asked_at, language)
+            VALUES (?, ?, 1, ?, ?, CURRENT_TIMESTAMP, ?)
+            ON CONFLICT(question_hash) DO UPDATE SET
+                question = excluded.question,
+                total_hits = total_hits + 1,
+                latest_id = excluded.latest_id,
+                best_confidence = CASE
+                    WHEN best_confidence IS NULL OR excluded.best_confidence > best_confidence
+                    THEN excluded.best_confidence ELSE best_confidence END,
+                last_asked_at = excluded.last_asked_at
+        """, (question_hash(stats_question, language), stats_question, stats_row_id, stats_confidence, language or "en"))
+
+        # Step C: Sync the vector table (canonical rows only)
+        # Delete old vector if it existed (for updates), then insert new vector
+        if canonical_id is None:
+            cursor.execute("DELETE FROM vec_chat_history WHERE rowid = ?", (row_id,))
+            cursor.execute("""
+                INSERT INTO vec_chat_history(rowid, query_vector) 
+                VALUES (?, ?)
+            """, (row_id, serialize_vector(query_vector)))
+            if history_index is not None:
+                history_index.insert(cursor, row_id, query_vector)
 
         conn.commit()
     except Exception as e:
         print(f"❌ Error saving to SQLite: {e}")
         conn.rollback()
-    finally:
-        conn.close()
+        raise  # let the outbox retry the write
 
+    # Outside the transaction: a Redis hiccup must not make the outbox replay
+    # (and double count) the SQLite write
+    put_exact_answer(question, answer_dict, confidence_score, language)
+    return True
+
+
+def get_stored_query_vector(question):
+    """
+    Vector already saved for this exact question text, so turns served by
+    the exact-match tier can be persisted without calling the embedding API.
+
+    Returns:
+        np.ndarray | None
+    """
+    conn = chat_db.connection()
+    row = conn.execute("""
+        SELECT v.query_vector
+        FROM chat_history h
+        JOIN vec_chat_history v ON v.rowid = COALESCE(h.canonical_id, h.id)
+        WHERE h.question = ?
+        ORDER BY h.id DESC
+        LIMIT 1
+    """, (question,)).fetchone()
+    return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+
+
+def _search_history_indexed(conn, query_vector, top_k):
+    """Coarse KNN on the reduced index + exact rescoring; same rows and order as the exact scan."""
+    distances = dict(history_index.nearest(conn, query_vector, top_k))
+    if not distances:
+        return []
+    rows = conn.execute(f"""
+        SELECT id, answer, question, confidence_score, session_id
+        FROM chat_history
+        WHERE id IN ({",".join("?" * len(distances))})
+    """, list(distances)).fetchall()
+    # ORDER BY confidence_score DESC, NULLs last as in SQLite
+    rows.sort(key=lambda row: (row[3] is None, -(row[3] or 0)))
+    return [(answer, distances[row_id], question, confidence, session)
+            for row_id, answer, question, confidence, session in rows]
 
 
 def search_history_semantic(query_vector, proximity_threshold=0.95, top_k=5):
-    conn = sqlite3.connect(DB_PATH)
-    conn.enable_load_extension(True)
-    sqlite_vec.load(conn)
+    conn = chat_db.connection()
     cursor = conn.cursor()
 
     query_vec = serialize_vector(query_vector)
 
     try:
-        # Search for top_k similar vectors, then sort those by confidence score
-        cursor.execute("""
-            SELECT 
-                h.answer,
-                vec_distance_cosine(v.query_vector, ?) AS distance,
-                h.question,
-                h.confidence_score,
-                h.session_id
-            FROM vec_chat_history v
-            JOIN chat_history h ON v.rowid = h.id
-            WHERE v.query_vector MATCH ?
-              AND k = ?
-            ORDER BY h.confidence_score DESC  -- Prioritize best quality answer
-        """, (query_vec, query_vec, top_k))
-
-        rows = cursor.fetchall()
+        if history_index is not None:
+            rows = _search_history_indexed(conn, query_vector, top_k)
+        else:
+            # Search for top_k similar vectors, then sort those by confidence score
+            cursor.execute("""
+                SELECT 
+                    h.answer,
+                    vec_distance_cosine(v.query_vector, ?) AS distance,
+                    h.question,
+                    h.confidence_score,
+                    h.session_id
+                FROM vec_chat_history v
+                JOIN chat_history h ON v.rowid = h.id
+                WHERE v.query_vector MATCH ?
+                  AND k = ?
+                ORDER BY h.confidence_score DESC  -- Prioritize best quality answer
+            """, (query_vec, query_vec, top_k))
+            rows = cursor.fetchall()
     except Exception as e:
         print(f"⚠️ SQLite Search Error: {e}")
         rows = []
-    finally:
-        conn.close()
 
     if not rows:
         return None
@@ -231,56 +521,114 @@ def search_history_semantic(query_vector, proximity_threshold=0.95, top_k=5):
 
 def increment_hit_count(session_id: str, question: str):
     """Increment hit_count for a specific session + question."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = chat_db.connection()
     cursor = conn.cursor()
 
-    cursor.execute("""
-        UPDATE chat_history
-        SET hit_count = hit_count + 1,
-            last_asked_at = CURRENT_TIMESTAMP
-        WHERE session_id = ?
-          AND question = ?
-    """, (session_id, question))
-
-    conn.commit()
-    conn.close()
+    with conn:
+        cursor.execute("""
+            UPDATE chat_history
+            SET hit_count = hit_count + 1,
+                last_asked_at = CURRENT_TIMESTAMP
+            WHERE session_id = ?
+              AND question = ?
+            RETURNING canonical_id, language
+        """, (session_id, question))
+        updated = cursor.fetchall()
+        for canonical_id, language in updated:
+            # Variants are counted under their canonical question
+            stats_question = question
+            if canonical_id is not None:
+                stats_question = cursor.execute("SELECT question FROM chat_history WHERE id = ?", (canonical_id,)).fetchone()[0]
+            cursor.execute("""
+                UPDATE query_stats
+                SET total_hits = total_hits + 1,
+                    last_asked_at = CURRENT_TIMESTAMP
+                WHERE question_hash = ?
+            """, (question_hash(stats_question, language),))
 
 def get_unique_query_count() -> int:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM chat_history")
-    count = cur.fetchone()[0]
-    conn.close()
-    return count
+    """Rows in chat_history, read from the maintained counter (one primary-key lookup)."""
+    conn = chat_db.connection()
+    row = conn.execute("SELECT value FROM chat_counters WHERE name = 'history_rows'").fetchone()
+    return row[0] if row else 0
+
+
+def claim_refresh_epoch(epoch: int) -> bool:
+    """
+    Compare-and-set on refresh_epoch: True for exactly one caller, across
+    every worker, the first time the row count reaches a new K_THRESHOLD
+    multiple (epoch = count // K_THRESHOLD).
+    """
+    conn = chat_db.connection()
+    with conn:
+        cur = conn.execute("""
+            UPDATE chat_counters SET value = ?
+            WHERE name = 'refresh_epoch' AND value < ?
+        """, (epoch, epoch))
+    return cur.rowcount == 1
+
+
+def release_refresh_epoch(epoch: int):
+    """Undo a claim whose refresh failed, so the retried job can claim it again."""
+    conn = chat_db.connection()
+    with conn:
+        conn.execute("""
+            UPDATE chat_counters SET value = ?
+            WHERE name = 'refresh_epoch' AND value = ?
+        """, (epoch - 1, epoch))
 
 def get_top_k_queries(k: int):
-    conn = sqlite3.connect(DB_PATH)
+    conn = chat_db.connection()
     cur = conn.cursor()
 
+    # Walks idx_query_stats_hits backwards: no aggregation over chat_history
     cur.execute("""
-        SELECT 
-            q.question,
+        SELECT
+            s.question,
             q.answer,
-            stats.total_hits
+            s.total_hits,
             q.confidence_score
-        FROM chat_history q
-        JOIN (
-            SELECT 
-                question,
-                SUM(hit_count) AS total_hits,
-                MAX(last_asked_at) AS latest_time
-            FROM chat_history
-            GROUP BY question
-        ) stats
-        ON q.question = stats.question
-        AND q.last_asked_at = stats.latest_time
-        ORDER BY stats.total_hits DESC
+        FROM query_stats s
+        JOIN chat_history q ON q.id = s.latest_id
+        ORDER BY s.total_hits DESC, s.latest_id DESC
         LIMIT ?
     """, (k,))
 
     rows = cur.fetchall()
-    conn.close()
-    return rows  # Returns list of (question, answer_json)
+    return rows  # Returns list of (question, answer_json, total_hits, confidence_score)
+
+
+def get_top_k_queries_with_vectors(k: int):
+    """
+    Same ranking as get_top_k_queries, plus the stored query vector of each
+    row, so the hot cache can be rebuilt without calling the embedding API,
+    and the answer language its cache key is built with.
+
+    Returns:
+        list: (question, answer_json, total_hits, confidence_score, np.ndarray, language)
+    """
+    conn = chat_db.connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT
+            s.question,
+            q.answer,
+            s.total_hits,
+            q.confidence_score,
+            v.query_vector,
+            s.language
+        FROM query_stats s
+        JOIN chat_history q ON q.id = s.latest_id
+        JOIN vec_chat_history v ON v.rowid = s.latest_id
+        ORDER BY s.total_hits DESC, s.latest_id DESC
+        LIMIT ?
+    """, (k,))
+
+    return [
+        (question, answer, total_hits, confidence_score, np.frombuffer(vector, dtype=np.float32), language)
+        for question, answer, total_hits, confidence_score, vector, language in cur.fetchall()
+    ]
 
 
 
@@ -289,21 +637,22 @@ def get_full_conversation(session_id):
     Returns the full conversation for a given session_id from SQLite.
     """
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = chat_db.connection()
     cursor = conn.cursor()
 
     cursor.execute(
         """
-        SELECT timestamp, question, answer
-        FROM chat_history
-        WHERE session_id = ?
-        ORDER BY id ASC
+        SELECT h.timestamp, h.question,
+               CASE WHEN h.canonical_id IS NULL THEN h.answer ELSE c.answer END
+        FROM chat_history h
+        LEFT JOIN chat_history c ON c.id = h.canonical_id
+        WHERE h.session_id = ?
+        ORDER BY h.id ASC
         """,
         (session_id,)
     )
 
     rows = cursor.fetchall()
-    conn.close()
 
     if not rows:
         return {
@@ -334,22 +683,23 @@ def get_recent_conversation(session_id, last_n=5):
     Returns last N conversation turns for a session_id from SQLite.
     """
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = chat_db.connection()
     cursor = conn.cursor()
 
     cursor.execute(
         """
-        SELECT timestamp, question, answer
-        FROM chat_history
-        WHERE session_id = ?
-        ORDER BY id DESC
+        SELECT h.timestamp, h.question,
+               CASE WHEN h.canonical_id IS NULL THEN h.answer ELSE c.answer END
+        FROM chat_history h
+        LEFT JOIN chat_history c ON c.id = h.canonical_id
+        WHERE h.session_id = ?
+        ORDER BY h.id DESC
         LIMIT ?
         """,
         (session_id, last_n)
     )
 
     rows = cursor.fetchall()
-    conn.close()
 
     if not rows:
         return {
@@ -0,0 +1,241 @@
+import json
+import time
+import base64
+import asyncio
+import os
+import numpy as np
+
+from src.async_utils import run_blocking
+from src.tracing import span
+from persistant_memory.sqlite_pool import SQLitePool
+
+OUTBOX_DB_PATH = os.getenv("OUTBOX_DB_PATH", "outbox.db")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+LEASE_SECONDS = 120          # a claimed job is retried if its worker dies mid-run
+POLL_INTERVAL = 0.5
+# Idle workers back off up to this long between polls; enqueue in the same
+# process wakes them at once, so only other processes' retries wait for it
+IDLE_POLL_MAX = float(os.getenv("OUTBOX_IDLE_POLL_MAX", 5))
+
+
+# Payloads are JSON; numpy vectors travel as base64 float32 bytes
+def _encode(obj):
+    if isinstance(obj, np.ndarray):
+        return {"__ndarray__": base64.b64encode(np.asarray(obj, dtype=np.float32).tobytes()).decode("ascii")}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if "__ndarray__" in obj:
+        return np.frombuffer(base64.b64decode(obj["__ndarray__"]), dtype=np.float32)
+    return obj
+
+
+class Outbox:
+    """
+    Durable, SQLite-backed write-behind queue.
+
+    Work that does not affect the answer (chat history, cache upserts and
+    refreshes, docx/pdf rendering) is enqueued as a row and the response is
+    returned immediately. Worker tasks in every gunicorn worker claim due
+    rows with a lease, run the registered handler on the blocking pool,
+    and retry failures with exponential backoff. Rows survive restarts, and
+    a lease that expires because its worker died is picked up again, so
+    handlers run at least once. Handlers whose effects must not repeat are
+    registered with with_job_key=True and receive a job_key that is unique
+    per job, to record in the same transaction as their write.
+    """
+
+    def __init__(self, db_path=OUTBOX_DB_PATH):
+        self.db_path = db_path
+        # Jobs must survive power loss too, so keep synchronous=FULL here
+        self._pool = SQLitePool(db_path, synchronous="FULL")
+        self.handlers = {}
+        self._tasks = []
+        self._wakeup = None
+        self._loop = None
+        self.init_db()
+
+    def _connect(self):
+        return self._pool.connection()
+
+    def init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                locked_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+            """)
+            conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_outbox_due
+            ON outbox_jobs (status, next_attempt_at)
+            """)
+
+    # -------------------------
+    # Producers
+    # -------------------------
+    def handler(self, kind, with_job_key=False):
+        """
+        Decorator registering the (blocking) function that runs jobs of `kind`.
+
+        Args:
+            kind (str): Job kind passed to enqueue.
+            with_job_key (bool): Also call the function with job_key=<str>,
+                the same on every retry of a job and never reused by
+                another one.
+        """
+        def register(func):
+            self.handlers[kind] = (func, with_job_key)
+            return func
+        return register
+
+    def enqueue(self, kind, **payload):
+        """Persist one job; it is run by a worker after the response is sent."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO outbox_jobs (kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload, default=_encode), now, now),
+            )
+        if self._loop is not None:
+            # enqueue may run on a blocking-pool thread (chained jobs)
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def aenqueue(self, kind, **payload):
+        await run_blocking(self.enqueue, kind, **payload)
+
+    def run_async(self, coro):
+        """
+        Run a coroutine from a handler (a blocking-pool thread) on the
+        workers' event loop, so it goes through the same upstream limiters
+        as requests. Without running workers (drain() in scripts) it gets
+        its own loop.
+        """
+        if self._loop is None:
+            return asyncio.run(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    # -------------------------
+    # Workers
+    # -------------------------
+    def claim(self):
+        """Lease the oldest due job, or return None when nothing is due."""
+        now = time.time()
+        conn = self._connect()
+        # Read-only check first: an idle poll takes no write lock and no fsync
+        due = conn.execute("""
+            SELECT 1 FROM outbox_jobs
+            WHERE status = 'pending' AND next_attempt_at <= ? AND locked_until <= ?
+            LIMIT 1
+        """, (now, now)).fetchone()
+        if due is None:
+            return None
+        with conn:
+            row = conn.execute("""
+                UPDATE outbox_jobs SET locked_until = ?
+                WHERE id = (
+                    SELECT id FROM outbox_jobs
+                    WHERE status = 'pending' AND next_attempt_at <= ? AND locked_until <= ?
+                    ORDER BY id
+                    LIMIT 1
+                )
+                RETURNING id, kind, payload, attempts, created_at
+            """, (now + LEASE_SECONDS, now, now)).fetchone()
+        return row
+
+    def complete(self, job_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM outbox_jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id, attempts, error):
+        """Schedule a retry with exponential backoff, or park the job as dead."""
+        attempts += 1
+        status = "dead" if attempts >= OUTBOX_MAX_ATTEMPTS else "pending"
+        with self._connect() as conn:
+            conn.execute("""
+                UPDATE outbox_jobs
+                SET status = ?, attempts = ?, next_attempt_at = ?, locked_until = 0, last_error = ?
+                WHERE id = ?
+            """, (status, attempts, time.time() + min(2 ** attempts, 300), error, job_id))
+
+    def run_one(self):
+        """Claim and run a single job. Returns False when the queue has nothing due."""
+        job = self.claim()
+        if job is None:
+            return False
+
+        job_id, kind, payload, attempts, created_at = job
+        func, with_job_key = self.handlers.get(kind, (None, False))
+        try:
+            if func is None:
+                raise LookupError(f"no handler registered for job kind {kind!r}")
+            kwargs = json.loads(payload, object_hook=_decode)
+            if with_job_key:
+                # The id alone restarts at 1 if outbox.db is ever recreated
+                kwargs["job_key"] = f"{job_id}@{created_at!r}"
+            with span(f"outbox_{kind}"):
+                func(**kwargs)
+        except Exception as e:
+            print(f"⚠️ Outbox job {job_id} ({kind}) failed (attempt {attempts + 1}): {e}")
+            self.fail(job_id, attempts, str(e))
+        else:
+            self.complete(job_id)
+        return True
+
+    async def _worker(self):
+        idle_wait = POLL_INTERVAL
+        while True:
+            try:
+                ran = await run_blocking(self.run_one)
+            except Exception as e:
+                print(f"⚠️ Outbox worker error: {e}")
+                ran = False
+            if ran:
+                idle_wait = POLL_INTERVAL
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=idle_wait)
+                idle_wait = POLL_INTERVAL
+            except asyncio.TimeoutError:
+                idle_wait = min(idle_wait * 2, IDLE_POLL_MAX)
+
+    def start(self, workers=OUTBOX_WORKERS):
+        """Start draining worker tasks on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"outbox-{i}") for i in range(workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+
+    def drain(self):
+        """Run every due job synchronously (scripts without the app lifespan)."""
+        while self.run_one():
+            pass
+
+    def stats(self):
+        """Number of queued jobs per status ('pending' / 'dead')."""
+        conn = self._connect()
+        return dict(conn.execute(
+            "SELECT status, COUNT(*) FROM outbox_jobs GROUP BY status"
+        ).fetchall())
+
+
+outbox = Outbox()
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import threading
+
+import sqlite_vec
+
+DB_PATH = os.getenv("CHAT_DB_PATH", "chat_history.db")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))    # bytes
+# Page cache PER CONNECTION. Each pool keeps one connection per thread that
+# touches its database: the MAX_BLOCKING_WORKERS blocking-pool threads
+# (src.async_utils, 32 by default; outbox handlers run there as well) plus
+# the main thread at startup. With 16 gunicorn workers (-w 16 in the
+# Dockerfile) the worst case for chat_history.db is 33 * 16 * SQLITE_CACHE_KIB:
+# about 4.1 GiB at 8 MiB. outbox.db has its own pool of the same shape. The
+# cache only grows with the pages actually read. The mmap region is
+# different: it maps the OS page cache of the file, which all connections
+# and processes share.
+SQLITE_CACHE_KIB = int(os.getenv("SQLITE_CACHE_KIB", 8 * 1024))
+SQLITE_BUSY_TIMEOUT = 30            # seconds a writer waits for the lock
+STATEMENT_CACHE_SIZE = 256          # prepared statements kept per connection
+
+
+class SQLitePool:
+    """
+    Long-lived SQLite connections to one database file, one per thread.
+
+    Blocking-pool threads and outbox workers each keep their own connection,
+    opened on first use with sqlite-vec already loaded (load_vec), WAL
+    journaling, memory-mapped reads and a page cache of SQLITE_CACHE_KIB. Python's
+    per-connection statement cache then keeps the prepared statements of the
+    hot queries alive across calls. A connection inherited through fork
+    (gunicorn workers) is never reused: each process opens its own.
+    """
+
+    def __init__(self, path, load_vec=False, synchronous="NORMAL"):
+        self.path = path
+        self.load_vec = load_vec
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._pid = os.getpid()
+        self.opened = 0
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _open(self):
+        # Only the owning thread uses it; check_same_thread=False just lets close() run at shutdown
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False)
+        if self.load_vec:
+            conn.enable_load_extension(True)
+            sqlite_vec.load(conn)
+            conn.enable_load_extension(False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KIB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's connections are left alone, never closed here
+                self._connections, self._pid = [], os.getpid()
+            self._connections.append(conn)
+            self.opened += 1
+        return conn
+
+    def close(self):
+        """Close every connection opened by this process (shutdown only)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def stats(self):
+        return {"connections": len(self._connections), "opened": self.opened}
+
+
+# chat_history.db: history rows + sqlite-vec vectors. synchronous=NORMAL is
+# safe against process crashes under WAL; only an OS crash can lose the
+# last few commits
+chat_db = SQLitePool(DB_PATH, load_vec=True)
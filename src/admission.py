@@ -0,0 +1,194 @@
+# admission.py
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+from src.redis_pool import get_async_redis
+
+# Per-worker request admission
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 32))        # requests running at once
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", 64))                # requests allowed to wait for a slot
+QUEUE_MAX_WAIT = float(os.getenv("QUEUE_MAX_WAIT", 10))    # seconds a queued request may wait
+UPSTREAM_MAX_WAIT = float(os.getenv("UPSTREAM_MAX_WAIT", 15))
+REDIS_RETRY_SECONDS = 30     # fail open this long after a Redis error
+
+# Shared token bucket: take a token, or get back the seconds until one is free.
+# State lives in Redis so every gunicorn worker draws from the same quota.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class Overloaded(Exception):
+    """Raised to shed load; main.py turns it into a 503 with Retry-After."""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+class UpstreamLimiter:
+    """
+    Concurrency + rate limit for one upstream (Gemini, embeddings, ranker...).
+
+    Concurrency is an asyncio.Semaphore per worker; the rate is a token bucket
+    in Redis shared by all workers. A caller that cannot get both within
+    max_wait seconds gets Overloaded instead of piling up. If Redis is
+    unreachable the rate limit is skipped and only the local semaphore applies.
+    """
+
+    def __init__(self, name, concurrency, rate=None, burst=None, max_wait=UPSTREAM_MAX_WAIT):
+        self.name = name
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst or (rate * 2 if rate else None)
+        self.max_wait = max_wait
+        self._semaphore = None
+        self._script = None
+        self._redis_down_until = 0.0
+        self.throttled = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, name, concurrency, rate=None):
+        prefix = f"LIMIT_{name.upper()}"
+        rate = os.getenv(f"{prefix}_RPS", rate)
+        burst = os.getenv(f"{prefix}_BURST")
+        return cls(
+            name,
+            concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+            rate=float(rate) if rate else None,
+            burst=float(burst) if burst else None,
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        deadline = time.monotonic() + self.max_wait
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(f"{self.name} concurrency limit reached", retry_after=self.max_wait)
+        try:
+            if self.rate:
+                await self._take_token(deadline)
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _take_token(self, deadline):
+        if time.monotonic() < self._redis_down_until:
+            return
+        while True:
+            try:
+                if self._script is None:
+                    self._script = get_async_redis().register_script(TOKEN_BUCKET_LUA)
+                wait = float(await self._script(
+                    keys=[f"ratelimit:{self.name}"],
+                    args=[self.rate, self.burst, time.time()],
+                ))
+            except Exception as e:
+                print(f"⚠️ Rate limiter for {self.name} unavailable, allowing calls for {REDIS_RETRY_SECONDS}s: {e}")
+                self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+                return
+            if wait <= 0:
+                return
+            self.throttled += 1
+            if time.monotonic() + wait > deadline:
+                self.rejected += 1
+                raise Overloaded(f"{self.name} rate limit reached", retry_after=wait)
+            await asyncio.sleep(wait)
+
+
+class AdmissionController:
+    """
+    Bounded per-worker request queue.
+
+    Up to max_in_flight requests run; up to max_queue more wait at most
+    max_wait seconds for a slot. Anything beyond that is rejected at once,
+    so tail latency stays bounded instead of requests piling up for minutes.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE, max_wait=QUEUE_MAX_WAIT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore = None
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                self.shed += 1
+                raise Overloaded("request queue full", retry_after=self.max_wait)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                raise Overloaded("timed out waiting in request queue", retry_after=self.max_wait)
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def snapshot(self):
+        return {"in_flight": self.in_flight, "queued": self.queued, "shed": self.shed}
+
+
+admission = AdmissionController()
+
+# Defaults are per worker; rates (requests/s) are shared through Redis and
+# are off unless LIMIT_<NAME>_RPS is set.
+limits = {
+    name: UpstreamLimiter.from_env(name, concurrency)
+    for name, concurrency in [
+        ("embedding", 16),
+        ("gemini", 8),
+        ("rerank", 8),
+        ("translate", 8),
+        ("intent", 8),
+        ("milvus", 16),
+    ]
+}
+
+
+def limiter_snapshot():
+    snapshot = {}
+    for name, limiter in limits.items():
+        snapshot[f"{name}_throttled"] = limiter.throttled
+        snapshot[f"{name}_rejected"] = limiter.rejected
+    return snapshot
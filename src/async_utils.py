@@ -0,0 +1,49 @@
+# async_utils.py
+import os
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bound on threads used for blocking client calls (SQLite, Redis, Milvus,
+# Translate). Async-native clients never touch this pool.
+MAX_BLOCKING_WORKERS = int(os.getenv("MAX_BLOCKING_WORKERS", 32))
+
+_executor = ThreadPoolExecutor(
+    max_workers=MAX_BLOCKING_WORKERS,
+    thread_name_prefix="rag-blocking",
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the bounded thread pool and await its result,
+    so the event loop keeps serving other requests meanwhile.
+
+    Args:
+        func (callable): Blocking function to call.
+        *args, **kwargs: Arguments forwarded to func.
+
+    Returns:
+        Whatever func returns.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+def submit_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the pool without waiting for it. Only for
+    best-effort bookkeeping whose failure must not affect the response;
+    exceptions are logged, not raised.
+    """
+    def run():
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            print(f"⚠️ Background call {getattr(func, '__name__', func)} failed: {e}")
+    return _executor.submit(run)
+
+
+def shutdown_executor(wait: bool = True):
+    """Release the blocking pool (called on application shutdown)."""
+    _executor.shutdown(wait=wait)
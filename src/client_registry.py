@@ -0,0 +1,162 @@
+# client_registry.py
+import os
+import time
+import asyncio
+import httpx
+from langchain_core.documents import Document
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from vertexai.generative_models import GenerativeModel
+from google.cloud import discoveryengine_v1 as discoveryengine
+from src.utils import load_config
+from src.async_utils import run_blocking
+
+MODEL_API = os.getenv("MODEL_API")
+WARM_UP_RETRY_SECONDS = float(os.getenv("WARM_UP_RETRY_SECONDS", 15))
+# /query cannot answer without these; the reranker and intent model are best effort
+CRITICAL_WARM_UPS = ("milvus_load", "embedding", "milvus_search", "gemini")
+
+
+class ClientRegistry:
+    """
+    Process-wide holder for every upstream client (embeddings, Gemini,
+    Discovery Engine ranker, Ollama HTTP client, Milvus).
+
+    Clients are built once per worker by the FastAPI lifespan, warmed with a
+    dummy call and then shared by all requests, so no request pays for a new
+    gRPC channel / TLS handshake. Accessing a client before start() builds it
+    lazily, which keeps scripts such as test.py working without the app.
+
+    `ready` is only set once every CRITICAL_WARM_UPS call has succeeded;
+    until then the warm-up is retried in the background and /ready keeps
+    answering 503.
+    """
+
+    def __init__(self):
+        self.config = load_config()
+        self._embedding_model = None
+        self._gemini_model = None
+        self._rank_client = None
+        self._http_client = None
+        self.ready = False
+        self.warm_up_status = {}
+        self._retry_task = None
+
+    @property
+    def model_version(self):
+        """LLM + embedding model names; part of every cache key, so a model change never serves stale answers."""
+        return f'{self.config["llm"]["google"]["model_name"]}+{self.config["embedding"]["google"]["model_name"]}'
+
+    # -------------------------
+    # Clients
+    # -------------------------
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            em_model_name = self.config["embedding"]["google"]["model_name"]
+            self._embedding_model = GoogleGenerativeAIEmbeddings(model=em_model_name)
+        return self._embedding_model
+
+    @property
+    def gemini_model(self):
+        if self._gemini_model is None:
+            self._gemini_model = GenerativeModel(self.config["llm"]["google"]["model_name"])
+        return self._gemini_model
+
+    @property
+    def rank_client(self):
+        if self._rank_client is None:
+            self._rank_client = discoveryengine.RankServiceAsyncClient()
+        return self._rank_client
+
+    @property
+    def http_client(self):
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(timeout=None)
+        return self._http_client
+
+    # -------------------------
+    # Lifespan
+    # -------------------------
+    async def start(self):
+        """Build every client and warm it; readiness flips only once the critical ones succeeded."""
+        await self._warm_up()
+        if not self.ready:
+            self._retry_task = asyncio.create_task(self._retry_warm_up())
+
+    async def _warm_up(self):
+        from milvus_database.milvus_loading import loading_milvus
+
+        # Connect and load the collection into memory once per worker
+        await self._warm("milvus_load", run_blocking(loading_milvus))
+
+        vector = await self._warm("embedding", self.embedding_model.aembed_query("warm up"))
+        await asyncio.gather(
+            self._warm("milvus_search", self._warm_milvus(vector)),
+            self._warm("reranker", self._warm_reranker()),
+            self._warm("gemini", self.gemini_model.generate_content_async(
+                "ping", generation_config={"max_output_tokens": 1}
+            )),
+            self._warm("intent", self.http_client.get(f"{MODEL_API}/api/tags")),
+        )
+
+        failed = [name for name in CRITICAL_WARM_UPS if not self.warm_up_status.get(name, {}).get("ok")]
+        self.ready = not failed
+        if failed:
+            print(f"❌ Client registry not ready, failed warm-ups: {failed}")
+        else:
+            print("✅ Client registry warmed:", self.warm_up_status)
+
+    async def _retry_warm_up(self):
+        while not self.ready:
+            await asyncio.sleep(WARM_UP_RETRY_SECONDS)
+            print("🔁 Retrying client warm-up")
+            await self._warm_up()
+
+    async def close(self):
+        self.ready = False
+        if self._retry_task is not None:
+            self._retry_task.cancel()
+            self._retry_task = None
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        if self._rank_client is not None:
+            await self._rank_client.transport.close()
+
+    async def _warm(self, name, awaitable):
+        """Await one warm-up call, recording its status instead of failing startup."""
+        start_time = time.perf_counter()
+        try:
+            result = await awaitable
+            self.warm_up_status[name] = {"ok": True, "seconds": round(time.perf_counter() - start_time, 3)}
+            return result
+        except Exception as e:
+            print(f"⚠️ Warm-up of {name} failed: {e}")
+            self.warm_up_status[name] = {"ok": False, "error": str(e)}
+            return None
+
+    async def _warm_milvus(self, vector):
+        from milvus_database.milvus_db import vector_search
+        from milvus_database.config import DB
+
+        if vector is None:
+            raise RuntimeError("no warm-up vector available")
+        return await run_blocking(
+            vector_search,
+            collection_name=DB.milvus_collection_name,
+            partition_name=DB.default_partition,
+            query_vectors=vector,
+            num_results=1,
+        )
+
+    async def _warm_reranker(self):
+        from src.step_6_reranker import arerank_with_google
+
+        return await arerank_with_google(
+            "warm up",
+            [Document(page_content="warm up", metadata={})],
+            project_id="km-judisasory",
+            client=self.rank_client,
+        )
+
+
+registry = ClientRegistry()
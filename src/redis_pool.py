@@ -0,0 +1,44 @@
+# redis_pool.py
+import os
+
+import redis
+import redis.asyncio as aioredis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 64))   # per worker, per pool
+REDIS_POOL_TIMEOUT = 5     # seconds to wait for a free pooled connection
+
+# Shared blocking client for code running on the blocking pool and outbox
+# workers (exact-match tier, semantic-cache writes, L1 loads).
+_redis = None
+
+# Shared asyncio client for the request path (cache lookups, rate limits,
+# single-flight leases). Created on first use so its pool binds to the
+# worker's event loop.
+_async_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis(connection_pool=redis.BlockingConnectionPool(
+            host=REDIS_HOST, port=REDIS_PORT, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT,
+        ))
+    return _redis
+
+
+def get_async_redis():
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(
+            host=REDIS_HOST, port=REDIS_PORT, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT,
+        ))
+    return _async_redis
+
+
+async def close_async_redis():
+    global _async_redis
+    if _async_redis is not None:
+        await _async_redis.aclose()
+        _async_redis = None
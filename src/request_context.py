@@ -0,0 +1,96 @@
+# request_context.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from src.client_registry import registry
+from src.admission import limits
+
+EMBEDDING_LRU_SIZE = int(os.getenv("EMBEDDING_LRU_SIZE", 2048))
+
+
+@dataclass
+class RequestContext:
+    """
+    Request-scoped state shared by every pipeline stage.
+
+    The query vector is computed once (see embed_query) and read from here by
+    the Redis / SQLite cache tiers, Milvus search and the persistence calls.
+    """
+    query: str
+    session_id: str = "defaut_session"
+    detected_lang: str = "en"
+    query_vector: Optional[np.ndarray] = None
+    embedding_source: Optional[str] = None   # "lru" or "api"
+    started_at: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingLRU:
+    """Thread-safe bounded LRU of query text -> read-only float32 vector."""
+
+    def __init__(self, maxsize: int = EMBEDDING_LRU_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            vector = self._data.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = vector
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+embedding_lru = EmbeddingLRU()
+
+
+def to_query_vector(vector) -> np.ndarray:
+    """Convert an embedding to a contiguous, read-only float32 array."""
+    arr = np.ascontiguousarray(vector, dtype=np.float32)
+    arr.setflags(write=False)
+    return arr
+
+
+async def embed_query(ctx: RequestContext) -> np.ndarray:
+    """
+    Fill ctx.query_vector, calling the embedding API only when the query
+    text is not already in the in-process LRU.
+    """
+    if ctx.query_vector is not None:
+        return ctx.query_vector
+
+    key = ctx.query.strip()
+    vector = embedding_lru.get(key)
+    if vector is not None:
+        ctx.embedding_source = "lru"
+    else:
+        async with limits["embedding"].slot():
+            vector = await registry.embedding_model.aembed_query(ctx.query)
+        vector = to_query_vector(vector)
+        embedding_lru.put(key, vector)
+        ctx.embedding_source = "api"
+
+    ctx.query_vector = vector
+    return vector
@@ -0,0 +1,177 @@
+# single_flight.py
+import os
+import json
+import time
+import uuid
+import asyncio
+
+import redis
+
+from src.redis_pool import get_async_redis
+
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", 90))   # > a slow Gemini generation
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", 60))
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+POLL_INTERVAL = 1.0          # followers re-check the lease this often while waiting
+REDIS_RETRY_SECONDS = 30     # run uncoordinated this long after a Redis error
+
+_MISSING = object()     # leader gone without a result: take over
+_TIMED_OUT = object()   # waited wait_seconds: stop waiting and compute
+
+# Delete the lease only if we still own it
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one computation.
+
+    Within a worker, duplicates await the first caller's future. Across
+    workers, the first caller takes a short Redis lease (SET NX EX) and
+    computes; the others subscribe to the key's channel and pick up the
+    result the leader stores under a short TTL. If the leader fails or dies
+    (the lease expires), a waiting follower takes the lease over. When
+    Redis is unreachable every caller simply computes on its own.
+    """
+
+    def __init__(self, namespace, lease_seconds=SINGLE_FLIGHT_LEASE_SECONDS,
+                 wait_seconds=SINGLE_FLIGHT_WAIT_SECONDS, result_ttl=30):
+        self.namespace = namespace
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.result_ttl = result_ttl
+        self._local = {}
+        self._release = None
+        self._redis_down_until = 0.0
+        self.leaders = 0
+        self.local_followers = 0
+        self.remote_followers = 0
+        self.takeovers = 0
+
+    def _keys(self, key):
+        base = f"flight:{self.namespace}:{key}"
+        return f"{base}:lease", f"{base}:result", f"{base}:done"
+
+    async def run(self, key, compute):
+        """
+        Await compute() once per key across all workers.
+
+        Args:
+            key (str): Coalescing key (e.g. a cache digest or idempotency key).
+            compute (callable): Zero-argument coroutine function producing a
+                JSON-serializable result.
+
+        Returns:
+            tuple: (result, True if this call computed it)
+        """
+        pending = self._local.get(key)
+        if pending is not None:
+            self.local_followers += 1
+            return await asyncio.shield(pending), False
+
+        future = asyncio.get_running_loop().create_future()
+        self._local[key] = future
+        try:
+            result, leader = await self._run_shared(key, compute)
+            future.set_result(result)
+            return result, leader
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()   # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._local.pop(key, None)
+
+    async def _run_shared(self, key, compute):
+        if time.monotonic() < self._redis_down_until:
+            return await compute(), True
+
+        lease_key, result_key, channel = self._keys(key)
+        token = uuid.uuid4().hex
+        r = get_async_redis()
+        # Only Redis calls are guarded: errors raised by compute() propagate
+        try:
+            raw = await r.get(result_key)
+            if raw is not None:
+                self.remote_followers += 1
+                return json.loads(raw), False
+
+            while not await r.set(lease_key, token, nx=True, ex=self.lease_seconds):
+                result = await self._follow(r, lease_key, result_key, channel)
+                if result is _TIMED_OUT:
+                    print(f"⚠️ Single-flight ({self.namespace}) waited {self.wait_seconds}s, computing anyway")
+                    return await compute(), True
+                if result is not _MISSING:
+                    self.remote_followers += 1
+                    return result, False
+                # Leader failed or vanished without a result: try to take over
+                self.takeovers += 1
+        except redis.exceptions.RedisError as e:
+            print(f"⚠️ Single-flight ({self.namespace}) unavailable, computing uncoordinated: {e}")
+            self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+            return await compute(), True
+
+        return await self._lead(r, compute, token, lease_key, result_key, channel), True
+
+    async def _lead(self, r, compute, token, lease_key, result_key, channel):
+        self.leaders += 1
+        if self._release is None:
+            self._release = r.register_script(RELEASE_LUA)
+        try:
+            result = await compute()
+        except BaseException:
+            try:
+                await self._release(keys=[lease_key], args=[token])
+                await r.publish(channel, "failed")
+            except redis.exceptions.RedisError as e:
+                print(f"⚠️ Single-flight ({self.namespace}) could not release lease: {e}")
+            raise
+
+        try:
+            pipe = r.pipeline(transaction=True)
+            pipe.set(result_key, json.dumps(result), ex=self.result_ttl)
+            pipe.publish(channel, "done")
+            await pipe.execute()
+            await self._release(keys=[lease_key], args=[token])
+        except redis.exceptions.RedisError as e:
+            # Followers fall back once the lease expires
+            print(f"⚠️ Single-flight ({self.namespace}) could not publish result: {e}")
+        return result
+
+    async def _follow(self, r, lease_key, result_key, channel):
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+        try:
+            deadline = time.monotonic() + self.wait_seconds
+            while time.monotonic() < deadline:
+                # Checked after subscribing, so a result published in between is not missed
+                raw = await r.get(result_key)
+                if raw is not None:
+                    return json.loads(raw)
+                if not await r.exists(lease_key):
+                    return _MISSING
+                await pubsub.get_message(timeout=min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            return _TIMED_OUT
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+    def snapshot(self):
+        return {
+            "leaders": self.leaders,
+            "local_followers": self.local_followers,
+            "remote_followers": self.remote_followers,
+            "takeovers": self.takeovers,
+        }
+
+
+# Identical questions in flight at the same time (keyed by cache digest and
+# chat history, see step_3_llm_loaders.question_flight_key)
+question_flights = SingleFlight("question")
+# Client retries carrying the same Idempotency-Key header
+idempotent_requests = SingleFlight("idempotency", result_ttl=IDEMPOTENCY_TTL)
@@ -0,0 +1,78 @@
+# speculation.py
+import os
+import time
+import threading
+
+# Start Milvus search + rerank as soon as the query vector exists, in
+# parallel with the cache lookups. Worth enabling when the hit rate is low.
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() in ("1", "true", "yes")
+
+
+class SpeculativeRun:
+    """Start/finish timestamps of one speculative retrieval."""
+
+    def __init__(self):
+        self.started_at = None
+        self.finished_at = None
+
+    async def run(self, func, *args, **kwargs):
+        self.started_at = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def busy_until(self, verdict_at):
+        """Seconds of retrieval that overlapped the cache lookups."""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else verdict_at
+        return max(0.0, min(end, verdict_at) - self.started_at)
+
+
+class SpeculationStats:
+    """
+    Process-wide counters comparing wasted speculative work (retrievals
+    thrown away because a cache tier hit) with latency saved on misses.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.used = 0
+        self.wasted = 0
+        self.wasted_completed = 0        # Milvus + rerank calls fully paid for, then discarded
+        self.wasted_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def record_launch(self):
+        with self._lock:
+            self.launched += 1
+
+    def record_used(self, run: SpeculativeRun, verdict_at: float):
+        with self._lock:
+            self.used += 1
+            self.saved_seconds += run.busy_until(verdict_at)
+
+    def record_wasted(self, run: SpeculativeRun, verdict_at: float):
+        with self._lock:
+            self.wasted += 1
+            if run.finished_at is not None and run.finished_at <= verdict_at:
+                self.wasted_completed += 1
+            self.wasted_seconds += run.busy_until(verdict_at)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "enabled": SPECULATIVE_RETRIEVAL,
+                "launched": self.launched,
+                "used": self.used,
+                "wasted": self.wasted,
+                "wasted_completed": self.wasted_completed,
+                "wasted_seconds": round(self.wasted_seconds, 3),
+                "saved_seconds": round(self.saved_seconds, 3),
+                "waste_ratio": round(self.wasted / self.launched, 3) if self.launched else 0.0,
+            }
+
+
+speculation_stats = SpeculationStats()
@@ -0,0 +1,90 @@
+# stage_scheduler.py
+import asyncio
+
+
+class StageScheduler:
+    """
+    Runs the independent stages of one request concurrently.
+
+    Each stage is an async callable started as its own task; a stage that
+    needs another stage's output lists it in `after` and only starts once
+    those have finished. Used by src.step_3_llm_loaders.main to overlap the
+    intent call, the query embedding and the cache-tier lookups.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def start(self, name, func, *args, after=(), **kwargs):
+        """
+        Schedule func(*args, **kwargs) as stage `name`.
+
+        Args:
+            name (str): Stage name, used by later `after` lists.
+            func (callable): Async callable running the stage.
+            after (Iterable[str]): Stages that must complete first.
+
+        Returns:
+            asyncio.Task: Task resolving to the stage result.
+        """
+        deps = [self.tasks[d] for d in after]
+
+        async def run():
+            if deps:
+                # asyncio.wait (not gather) so cancelling this stage never
+                # cancels the shared stages it depends on
+                await asyncio.wait(deps)
+                for dep in deps:
+                    dep.result()  # re-raise a failed dependency
+            return await func(*args, **kwargs)
+
+        task = asyncio.create_task(run(), name=name)
+        self.tasks[name] = task
+        return task
+
+    async def first_hit(self, names, is_hit=lambda result: result is not None):
+        """
+        Wait for the given stages and return the first result accepted by
+        is_hit; every other stage in `names` is cancelled once one wins.
+
+        Failed stages count as misses.
+
+        Returns:
+            tuple: (stage name, result), or (None, None) if no stage hit.
+        """
+        pending = {self.tasks[n] for n in names}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        print(f"⚠️ Stage {task.get_name()} failed: {task.exception()}")
+                        continue
+                    result = task.result()
+                    if is_hit(result):
+                        return task.get_name(), result
+            return None, None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def cancel(self, *names):
+        for name in names:
+            task = self.tasks.get(name)
+            if task is not None and not task.done():
+                task.cancel()
+
+    def cancel_all(self):
+        """Cancel every unfinished stage and mark failed ones as observed."""
+        self.cancel(*self.tasks)
+        for task in self.tasks.values():
+            task.add_done_callback(_consume_exception)
+
+
+def _consume_exception(task):
+    # Nobody awaits an abandoned stage: retrieve its exception so asyncio
+    # does not log "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
@@ -2,143 +2,132 @@ import os
 import json
 import re
 import time
+import hashlib
 from dotenv import load_dotenv
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.output_parsers import StrOutputParser
-from multilingual_pipeline.conversion import output_converison
-from src.step_4_processing import process_file
+from multilingual_pipeline.conversion import output_converison, translate_fields
+from src.step_4_processing import process_file, retrieve_documents
 from src.utils import load_config
 from multilingual_pipeline.conversion import output_converison
 # from url_integration.gcs_url import generate_signed_url
 from src.step_7_utility import escape_inner_quotes, replace_links
-from persistant_memory.loading_and_saving_chat import save_chat_turn, init_db,get_unique_query_count,search_history_semantic
-from caching_hisotry.caching.redis_semantic_cache import upsert_rag_response,simple_id_generator,cache_rag,create_index_if_not_exists,refresh_redis_from_sqlite
+from persistant_memory.loading_and_saving_chat import save_chat_turn, init_db,get_unique_query_count,search_history_semantic,get_stored_query_vector,claim_refresh_epoch,release_refresh_epoch
+from caching_hisotry.caching.exact_cache import get_exact_answer, cache_digest
+from caching_hisotry.caching.redis_semantic_cache import upsert_rag_response,acache_rag,create_index_if_not_exists,refresh_redis_from_sqlite,record_cache_hit
+from caching_hisotry.caching.l1_cache import l1_cache
 from persistant_memory.load_chat_history import load_chat_conversation,retrive_from_redis
-from complaint_generator.legal_generator import generate_legal_text, save_to_docx, save_to_pdf
-from complaint_generator.generator_script import llm_detect_intent
-DB_PATH = "chat_history.db"
-import sqlite3          
+from complaint_generator.legal_generator import agenerate_legal_text, save_to_docx, save_to_pdf
+from complaint_generator.generator_script import allm_detect_intent
+from src.async_utils import run_blocking, submit_blocking
+from src.request_context import RequestContext, embed_query
+from src.stage_scheduler import StageScheduler
+from src.speculation import SPECULATIVE_RETRIEVAL, SpeculativeRun, speculation_stats
+from persistant_memory.outbox import outbox
+from src.tracing import span, traced
+from src.admission import limits
+from src.single_flight import question_flights
+# Schema setup runs once per process, here at startup
 init_db()
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
 K_THRESHOLD = 17
 load_dotenv()       
-id_gen = simple_id_generator()
 create_index_if_not_exists()
 # Legal document generator
 
 load_dotenv()
 
-async def main(query: str, detected_lang: str = "en",session_id = "defaut_session"):
-
-    intent = llm_detect_intent(query)
-    if intent == "GENERATION":
-        print(" Routing to LEGAL GENERATION pipeline")
 
-        
-        legal_text = generate_legal_text(query)
+# -------------------------
+# Write-behind jobs (run by persistant_memory.outbox workers, off the request path)
+# -------------------------
+@outbox.handler("save_chat_turn", with_job_key=True)
+def persist_chat_turn(session_id, question, answer_dict, query_vector, confidence_score, cache_miss=False, language="en", job_key=None):
+    if query_vector is None:
+        # Exact-match hits are answered before any embedding; reuse the
+        # stored vector, and only embed here (off the request path) if the
+        # normalized match came from differently written text
+        query_vector = get_stored_query_vector(question)
+        if query_vector is None:
+            # Same embedding limiter (and LRU) as the request path
+            ctx = RequestContext(query=question, session_id=session_id, detected_lang=language)
+            query_vector = outbox.run_async(embed_query(ctx))
 
-        if detected_lang not in ["en", "hi", "mr", "te"]:
-            detected_lang = "en"
+    save_chat_turn(
+        session_id=session_id,
+        question=question,
+        answer_dict=answer_dict,
+        query_vector=query_vector,
+        confidence_score=confidence_score,
+        language=language,
+        job_key=job_key,
+        fresh_answer=cache_miss,
+    )
+    # Chained so the cache sync always sees this turn counted. Also enqueued
+    # when a retry finds the turn already saved: the first run may have
+    # failed between the save and this enqueue
+    outbox.enqueue(
+        "sync_redis_cache",
+        question=question,
+        answer_dict=answer_dict,
+        query_vector=query_vector,
+        confidence_score=confidence_score,
+        cache_miss=cache_miss,
+        language=language,
+    )
 
-        legal_text_translated = output_converison(
-            legal_text, detected_lang
-        )
 
-        save_to_docx(legal_text, "generated_complaint.docx")
-        save_to_pdf(legal_text, "generated_complaint.pdf")
+@outbox.handler("sync_redis_cache")
+def sync_redis_cache(question, answer_dict, query_vector, confidence_score, cache_miss=False, language="en"):
+    current_cnt = get_unique_query_count()
 
-        return {
-            "intent": "GENERATION",
-            "bold_words": [],
-            "meta_data": [],
-            "response": legal_text_translated,
-            "follow_up": None,
-            "table_data": [],
-            "ucid": "LEGAL_01"
-        }
+    if cache_miss and current_cnt < K_THRESHOLD:
+        upsert_rag_response(answer_dict, question, query_vector, confidence_score, language=language)
+        return
 
+    # Refresh once per K_THRESHOLD rows: the first job (in any worker) to
+    # see a new multiple claims it, later jobs at the same count do nothing
+    epoch = current_cnt // K_THRESHOLD
+    if epoch and claim_refresh_epoch(epoch):
+        try:
+            refresh_redis_from_sqlite(limit=5)
+        except Exception:
+            release_refresh_epoch(epoch)
+            raise
 
-    print("Loading embedding model and LLM...")
 
-    # Load model configuration
-    config = load_config()
-    em_model_name = config['embedding']['google']['model_name']
-    embedding_model = GoogleGenerativeAIEmbeddings(model=em_model_name)
-    query_vector = embedding_model.embed_query(query)
+@outbox.handler("render_legal_documents")
+def render_legal_documents(legal_text):
+    save_to_docx(legal_text, "generated_complaint.docx")
+    save_to_pdf(legal_text, "generated_complaint.pdf")
 
-    print(f"\n[1] Checking Cache for Query: {query}")
-        
 
+async def redis_tier(ctx):
+    """Redis semantic-cache stage: (score, answer, confidence) on a hit, else None."""
+    # Per-worker hot set first: one dot product, no Redis round-trip
+    l1_lookup = l1_cache.lookup(ctx.query_vector)
+    if l1_lookup is not None:
+        # LFU/TTL accounting still happens in Redis, just not on the request path
+        submit_blocking(record_cache_hit, l1_lookup["cache"]["cache_key"])
+        return retrive_from_redis(l1_lookup)
     try:
-        cache_lookup = cache_rag(query, query_vector)
-        score , cache_answer,confidence_score = retrive_from_redis(cache_lookup)
+        cache_lookup = await acache_rag(ctx.query, ctx.query_vector)
+        return retrive_from_redis(cache_lookup)
     except Exception as e:
         # Log the error but don't stop the execution
         print(f"⚠️ Redis Cache Error (Index might be missing): {e}")
-        cache_answer = None
-    if cache_answer:
-        confidence_score = cache_answer.get("confidence_score")
-        print("Final output prepared.", cache_answer)
-        # weighted_final_score = 0.7*score + 0.3*confidence_score
-        save_chat_turn(
-            session_id=session_id,
-            question=query,
-            answer_dict=cache_answer,
-            query_vector=query_vector,
-            confidence_score=confidence_score
-        )
-        curr_cnt = get_unique_query_count()
-        if curr_cnt % K_THRESHOLD == 0:
-            refresh_redis_from_sqlite(limit=5)
-        return cache_answer
-    
-    # if query is not found in cache proceed with sqlite
-    history_response = search_history_semantic(query_vector, proximity_threshold=0.95)
-    # print(f" SQLite Semantic Hit! (Sim: {history_response['similarity']:.2f})")
- 
-    if history_response:
-        confidence_score = history_response["confidence"]
-        similarity_score = history_response["similarity"]
-        print(f" SQLite Semantic Hit! (Sim: {history_response['similarity']:.2f})")
-        print("complete response:",history_response["answer"])
-        final_score = 0.7*similarity_score + 0.3*confidence_score
-
-        save_chat_turn(
-            session_id=session_id,
-            question=query,
-            answer_dict=history_response["answer"],
-            query_vector=query_vector,
-            confidence_score=final_score
-        )
-        curr_cnt = get_unique_query_count()
-        if curr_cnt % K_THRESHOLD == 0:
-            refresh_redis_from_sqlite(limit=5)
-        return history_response["answer"]
-    
-    print(" CACHE MISS! Starting full RAG pipeline (Milvus + Rerank + Gemini)...")
-    chat_history = load_chat_conversation(session_id=session_id,last_n=2)
-    # print("chat_history: ",chat_history)
-    tasks = process_file(
-        query=query,
-        embedding_model=embedding_model,
-        chat_history = chat_history
-    )
-    
-    results=[tasks]
-    per_file_responses = [r for r in results if r]
-    # Step 2: Filter irrelevant responses
-    irrelevant_pattern = re.compile(r"(does not provide relevant information|answer is not available)", re.IGNORECASE)
-    
-    # Step 3: Deduplicate metadata
-    all_meta_data = []
-    seen_files_pages = set()
-    for r in per_file_responses:
-        all_meta_data.extend(r["metadata"])
+        return None
 
- 
-    complete_response = "\n\n".join([r["response"] for r in per_file_responses])
 
+async def sqlite_tier(ctx):
+    """sqlite-vec history stage: the matching history row on a hit, else None."""
+    return await run_blocking(search_history_semantic, ctx.query_vector, proximity_threshold=0.95)
+
+
+async def format_answer(complete_response, all_meta_data, detected_lang="en"):
+    """
+    Turn Gemini's JSON answer text into the response dict returned by /query
+    (and stored by the cache tiers), translating it into detected_lang.
+    """
     print("complete response: ",complete_response)
     bold_words = list(set(re.findall(r"\*\*(.*?)\*\*", complete_response)))
 
@@ -158,9 +147,14 @@ async def main(query: str, detected_lang: str = "en",session_id = "defaut_sessio
         detected_lang = "en"
 
 
-    explanation_translated = output_converison(explanation_and_summary, detected_lang)
-    follow_up_translated = output_converison(follow_up_question, detected_lang)
-    table_data_translated = output_converison(table_data, detected_lang)
+    # One batched Translate call for all fields; skipped entirely for English
+    async with limits["translate"].slot():
+        with span("output_translation"):
+            explanation_translated, follow_up_translated, table_data_translated = await run_blocking(
+                translate_fields,
+                [explanation_and_summary, follow_up_question, table_data],
+                detected_lang,
+            )
 
     # Step 7: Final output dict
     output = {
@@ -172,21 +166,218 @@ async def main(query: str, detected_lang: str = "en",session_id = "defaut_sessio
         "confidence_score": confidence_score,
         "ucid": "99_18"  # example unique ID
     }
+    return output
+
+
+def question_flight_key(ctx, chat_history):
+    """
+    Coalescing key for a cache-miss generation. The answer depends on the
+    chat history fed to Gemini, so sessions only share a generation when
+    their history is identical (or both empty).
+    """
+    key = cache_digest(ctx.query, ctx.detected_lang)
+    if chat_history:
+        key += ":" + hashlib.sha256(chat_history.encode("utf-8")).hexdigest()[:16]
+    return key
+
+
+async def generate_answer(ctx, scheduler, speculative_run, verdict_at):
+    """
+    Full RAG pipeline for a cache miss: Milvus + rerank + Gemini, then
+    translation. Returns the JSON-serializable output dict.
+    """
+    chat_history = await scheduler.tasks["chat_history"]
+    # print("chat_history: ",chat_history)
+
+    retrieved = None
+    if speculative_run is not None:
+        try:
+            retrieved = await scheduler.tasks["retrieval"]
+            speculation_stats.record_used(speculative_run, verdict_at)
+        except Exception as e:
+            # process_file retries the retrieval itself
+            print(f"⚠️ Speculative retrieval failed: {e}")
+
+    tasks = await process_file(
+        ctx=ctx,
+        chat_history = chat_history,
+        retrieved=retrieved
+    )
+    
+    results=[tasks]
+    per_file_responses = [r for r in results if r]
+    # Step 2: Filter irrelevant responses
+    irrelevant_pattern = re.compile(r"(does not provide relevant information|answer is not available)", re.IGNORECASE)
+    
+    # Step 3: Deduplicate metadata
+    all_meta_data = []
+    seen_files_pages = set()
+    for r in per_file_responses:
+        all_meta_data.extend(r["metadata"])
+
+ 
+    complete_response = "\n\n".join([r["response"] for r in per_file_responses])
+
+    output = await format_answer(complete_response, all_meta_data, ctx.detected_lang)
     print("Final output prepared.", output)
-    save_chat_turn(
-        session_id=session_id,
-        question=query,
-        answer_dict=output,
-        query_vector=query_vector,
-        confidence_score=confidence_score
+    return output
+
+
+async def main(query: str, detected_lang: str = "en",session_id = "defaut_session"):
+    ctx = RequestContext(query=query, session_id=session_id, detected_lang=detected_lang)
+
+    # Exact-match tier: a repeated question (after NFKC / casefold /
+    # punctuation normalization) skips the embedding, intent and KNN calls.
+    # Only QA answers are ever stored, so skipping the router is safe.
+    with span("exact_cache"):
+        exact_hit = await run_blocking(get_exact_answer, query, ctx.detected_lang)
+    if exact_hit is not None:
+        print("⚡ EXACT CACHE HIT! Returning stored response without embedding.")
+        with span("persistence"):
+            await outbox.aenqueue(
+                "save_chat_turn",
+                session_id=session_id,
+                language=ctx.detected_lang,
+                question=query,
+                answer_dict=exact_hit["answer"],
+                query_vector=None,
+                confidence_score=exact_hit["confidence_score"]
+            )
+        return exact_hit["answer"]
+
+    # Fan out the stages that do not depend on each other: the intent call,
+    # the embedding (then both cache tiers) and the chat-history read.
+    scheduler = StageScheduler()
+    try:
+        scheduler.start("intent", traced, "intent", allm_detect_intent, query)
+        scheduler.start("embedding", traced, "embedding", embed_query, ctx)
+        scheduler.start("redis", traced, "redis_knn", redis_tier, ctx, after=["embedding"])
+        scheduler.start("sqlite", traced, "sqlite_knn", sqlite_tier, ctx, after=["embedding"])
+        scheduler.start("chat_history", traced, "chat_history", run_blocking, load_chat_conversation, session_id=session_id, last_n=2)
+
+        # Optionally start Milvus + rerank alongside the cache lookups; the work
+        # is thrown away if a cache tier hits
+        speculative_run = None
+        if SPECULATIVE_RETRIEVAL:
+            speculative_run = SpeculativeRun()
+            speculation_stats.record_launch()
+            scheduler.start("retrieval", speculative_run.run, retrieve_documents, ctx, after=["embedding"])
+
+        intent = await scheduler.tasks["intent"]
+        if intent == "GENERATION":
+            scheduler.cancel_all()
+            if speculative_run is not None:
+                speculation_stats.record_wasted(speculative_run, time.perf_counter())
+            print(" Routing to LEGAL GENERATION pipeline")
+
         
-    )
+            async with limits["gemini"].slot():
+                with span("gemini_generation"):
+                    legal_text = await agenerate_legal_text(query)
 
-    current_cnt = get_unique_query_count()
+            if detected_lang not in ["en", "hi", "mr", "te"]:
+                detected_lang = "en"
 
-    if current_cnt < K_THRESHOLD:
-        upsert_rag_response(output, query, query_vector,confidence_score, id_gen)
-    elif current_cnt % K_THRESHOLD == 0:
-        refresh_redis_from_sqlite(limit=5)
+            async with limits["translate"].slot():
+                with span("output_translation"):
+                    [legal_text_translated] = await run_blocking(
+                        translate_fields, [legal_text], detected_lang
+                    )
+
+            with span("persistence"):
+                await outbox.aenqueue("render_legal_documents", legal_text=legal_text)
+
+            return {
+                "intent": "GENERATION",
+                "bold_words": [],
+                "meta_data": [],
+                "response": legal_text_translated,
+                "follow_up": None,
+                "table_data": [],
+                "ucid": "LEGAL_01"
+            }
+
+        print(f"\n[1] Checking Cache for Query: {query}")
+
+        # Whichever cache tier hits first wins; the other lookup is cancelled
+        tier, hit = await scheduler.first_hit(["redis", "sqlite"])
+        verdict_at = time.perf_counter()
+        # Embedding failures surface here rather than as a silent miss
+        await scheduler.tasks["embedding"]
+
+        if tier is not None and speculative_run is not None:
+            scheduler.cancel("retrieval")
+            speculation_stats.record_wasted(speculative_run, verdict_at)
+
+        if tier == "redis":
+            scheduler.cancel("chat_history")
+            score, cache_answer, confidence_score = hit
+            confidence_score = cache_answer.get("confidence_score")
+            print("Final output prepared.", cache_answer)
+            # weighted_final_score = 0.7*score + 0.3*confidence_score
+            with span("persistence"):
+                await outbox.aenqueue(
+                    "save_chat_turn",
+                    session_id=session_id,
+                    language=ctx.detected_lang,
+                    question=query,
+                    answer_dict=cache_answer,
+                    query_vector=ctx.query_vector,
+                    confidence_score=confidence_score
+                )
+            return cache_answer
+ 
+        if tier == "sqlite":
+            scheduler.cancel("chat_history")
+            history_response = hit
+            confidence_score = history_response["confidence"]
+            similarity_score = history_response["similarity"]
+            print(f" SQLite Semantic Hit! (Sim: {history_response['similarity']:.2f})")
+            print("complete response:",history_response["answer"])
+            final_score = 0.7*similarity_score + 0.3*confidence_score
+
+            with span("persistence"):
+                await outbox.aenqueue(
+                    "save_chat_turn",
+                    session_id=session_id,
+                    language=ctx.detected_lang,
+                    question=query,
+                    answer_dict=history_response["answer"],
+                    query_vector=ctx.query_vector,
+                    confidence_score=final_score
+                )
+            return history_response["answer"]
     
-    return output
+        print(" CACHE MISS! Starting full RAG pipeline (Milvus + Rerank + Gemini)...")
+        # Identical questions with the same chat history arriving together (in
+        # any worker) share one generation; followers get the leader's output
+        # instead of paying for their own Milvus / rerank / Gemini calls
+        chat_history = await scheduler.tasks["chat_history"]
+        output, leader = await question_flights.run(
+            question_flight_key(ctx, chat_history),
+            lambda: generate_answer(ctx, scheduler, speculative_run, verdict_at),
+        )
+        if not leader:
+            print("🔁 Coalesced with an in-flight generation of the same question.")
+            if speculative_run is not None:
+                scheduler.cancel("retrieval")
+                speculation_stats.record_wasted(speculative_run, verdict_at)
+        confidence_score = output.get("confidence_score")
+        # History, counter and cache upsert/refresh happen after the response is sent
+        with span("persistence"):
+            await outbox.aenqueue(
+                "save_chat_turn",
+                session_id=session_id,
+                language=ctx.detected_lang,
+                question=query,
+                answer_dict=output,
+                query_vector=ctx.query_vector,
+                confidence_score=confidence_score,
+                cache_miss=leader,
+            )
+    
+        return output
+    finally:
+        # Stages still running (or failed unobserved) when main returns or
+        # raises, e.g. after the intent or embedding stage failed
+        scheduler.cancel_all()
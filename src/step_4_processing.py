@@ -4,7 +4,11 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from vertexai.generative_models import GenerativeModel  #issue
 from dotenv import load_dotenv
 from src.step_5_prompt import prompt
-from src.step_6_reranker import rerank_with_google
+from src.step_6_reranker import arerank_with_google
+from src.async_utils import run_blocking
+from src.client_registry import registry
+from src.tracing import span
+from src.admission import Overloaded, limits
 
 from src.llm_config import safety_settings, GENERATION_CONFIG, GENERATION_CONFIG1
 
@@ -31,47 +35,72 @@ import json
 load_dotenv()
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.path.join(os.getcwd(), "service-account.json")
 
-def process_file(query, embedding_model,chat_history):
+async def retrieve_documents(ctx):
+    """
+    Milvus search + Google rerank for the request's query vector.
+
+    Returns:
+        tuple: (top reranked Documents, metadata of every Milvus hit)
+    """
+    async with limits["milvus"].slot():
+        with span("milvus_search"):
+            results = await run_blocking(
+                vector_search,
+                collection_name=DB.milvus_collection_name,
+                partition_name=DB.default_partition,
+                query_vectors=ctx.query_vector,
+                num_results=30
+            )
+
+    hits = results[0] if results else []
+
+    # Step 3: Build docs
+    docs,meta_data = [],[]
+    for hit in hits:
+        entity = hit["entity"]
+        text = entity.get("text", "")
+        doc = Document(
+            page_content=text,
+            metadata={
+                "chapter": entity.get("chapter"),
+                "chapter_title": entity.get("chapter_title"),
+                "section": entity.get("section"),
+                "section_title": entity.get("section_title"),
+                "score": hit.get("distance")
+            }
+        )
+        docs.append(doc)
+        meta_data.append(doc.metadata)
+
+    # Step 4: Rerank
+    start_time = time.time()
+    project_id = "km-judisasory"
+    async with limits["rerank"].slot():
+        with span("rerank"):
+            docs = (await arerank_with_google(ctx.query, docs, project_id, client=registry.rank_client))[:10]
+    print("re ranking time", time.time()-start_time)
+
+    return docs, meta_data
+
+
+async def process_file(ctx, chat_history, retrieved=None):
     """
     Match senior's function signature but adapted for JSON-based legal data.
+    Every network call is awaited (native async client or the bounded
+    blocking pool), so the worker can serve other requests meanwhile.
+    The query vector is read from the RequestContext, never re-embedded.
+
+    `retrieved` takes the (docs, meta_data) of a speculative retrieval that
+    already ran; otherwise Milvus search and rerank run here.
     """
-    query_vector = embedding_model.embed_query(query)
+    query = ctx.query
     try:
         
         print(f"\n Processing Query: {query}")
 
-        results = vector_search(
-            collection_name=DB.milvus_collection_name,
-            partition_name=DB.default_partition,
-            query_vectors=query_vector,
-            num_results=30
-        )
-
-        hits = results[0] if results else []
-
-        # Step 3: Build docs
-        docs,meta_data = [],[]
-        for hit in hits:
-            entity = hit["entity"]
-            text = entity.get("text", "")
-            doc = Document(
-                page_content=text,
-                metadata={
-                    "chapter": entity.get("chapter"),
-                    "chapter_title": entity.get("chapter_title"),
-                    "section": entity.get("section"),
-                    "section_title": entity.get("section_title"),
-                    "score": hit.get("distance")
-                }
-            )
-            docs.append(doc)
-            meta_data.append(doc.metadata)
-
-        # Step 4: Rerank
-        start_time = time.time()
-        project_id = "km-judisasory"
-        docs = rerank_with_google(query, docs, project_id)[:10]
-        print("re ranking time", time.time()-start_time)
+        if retrieved is None:
+            retrieved = await retrieve_documents(ctx)
+        docs, meta_data = retrieved
 
         # Step 5: Build context
         context_chunks = []
@@ -85,12 +114,14 @@ def process_file(query, embedding_model,chat_history):
         # Step 6: Generate LLM response
         formated_prompt = prompt.format(context=context, question=query,chat_history=chat_history)
 
-        model = GenerativeModel("gemini-2.5-flash")
-        result_new = model.generate_content(
-            formated_prompt,
-            generation_config=GENERATION_CONFIG,
-            safety_settings=safety_settings,
-        )
+        model = registry.gemini_model
+        async with limits["gemini"].slot():
+            with span("gemini_generation"):
+                result_new = await model.generate_content_async(
+                    formated_prompt,
+                    generation_config=GENERATION_CONFIG,
+                    safety_settings=safety_settings,
+                )
 
         # print("result_new:", result_new)
 
@@ -188,6 +219,9 @@ def process_file(query, embedding_model,chat_history):
         # )
         return final_output
 
+    except Overloaded:
+        # Surface load shedding to the endpoint as a 503, not an empty answer
+        raise
     except Exception as e:
         print(f" Error processing query: {e}")
         return None
@@ -23,7 +23,32 @@ def rerank_with_google(query, docs, project_id=PROJECT_ID, location="global", re
         List[Document]: Re-ranked list of Document objects.
     """
     client = discoveryengine.RankServiceClient()
+    request = build_rank_request(client, query, docs, project_id, location)
 
+    # Call Google Discovery Engine ranker
+    response = client.rank(request=request)
+
+    return reorder_docs(response, docs, return_scores)
+
+
+async def arerank_with_google(query, docs, project_id=PROJECT_ID, location="global", return_scores=False, client=None):
+    """
+    Async variant of rerank_with_google using the gRPC asyncio transport,
+    so the ranking round-trip does not hold a worker thread.
+
+    Pass the shared client from src.client_registry to reuse its channel.
+    """
+    if client is None:
+        client = discoveryengine.RankServiceAsyncClient()
+    request = build_rank_request(client, query, docs, project_id, location)
+
+    response = await client.rank(request=request)
+
+    return reorder_docs(response, docs, return_scores)
+
+
+def build_rank_request(client, query, docs, project_id, location):
+    """Build the Discovery Engine RankRequest for a list of Documents."""
     # Path to the ranking configuration in Google Discovery Engine
     ranking_config = client.ranking_config_path(
         project=project_id,
@@ -43,7 +68,7 @@ def rerank_with_google(query, docs, project_id=PROJECT_ID, location="global", re
         )
 
     # Build rank request
-    request = discoveryengine.RankRequest(
+    return discoveryengine.RankRequest(
         ranking_config=ranking_config,
         model="semantic-ranker-default@latest",
         top_n=len(docs),
@@ -51,10 +76,9 @@ def rerank_with_google(query, docs, project_id=PROJECT_ID, location="global", re
         records=records,
     )
 
-    # Call Google Discovery Engine ranker
-    response = client.rank(request=request)
 
-    # Reorder documents based on the response
+def reorder_docs(response, docs, return_scores=False):
+    """Reorder documents based on the ranker response."""
     ranked_docs = []
     for r in response.records:
         idx = int(r.id)
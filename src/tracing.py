@@ -0,0 +1,162 @@
+# tracing.py
+import os
+import time
+import bisect
+import threading
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (ms) through full Gemini generations (tens of s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Spans of the request being served, read by the Server-Timing middleware
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    """
+    Minimal Prometheus-style histogram keyed by one label.
+
+    Metrics live in the worker process; with gunicorn each worker exposes its
+    own /metrics, which Prometheus scrapes and sums per instance.
+    """
+
+    def __init__(self, name, documentation, label="stage", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}   # label value -> [bucket counts..., sum, count]
+
+    def observe(self, label_value, seconds):
+        idx = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for value, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {series[-1]}')
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Latency of each pipeline stage.")
+REQUEST_SECONDS = Histogram("rag_request_duration_seconds", "End-to-end latency per endpoint.", label="path")
+
+# Extra gauge/counter providers registered by other modules: name -> (type, help, callable)
+_collectors = {}
+
+
+def register_collector(name, metric_type, documentation, func):
+    """Expose func() (a number, or a {label: number} dict) on /metrics."""
+    _collectors[name] = (metric_type, documentation, func)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a block as one pipeline stage.
+
+    The duration goes to the stage histogram and, inside a request, to the
+    Server-Timing header. Works in both sync and async code; spans opened on
+    blocking-pool threads only reach the histogram. When tracemalloc is
+    running (benchmarks), the net bytes allocated in the block are recorded too.
+    """
+    tracing_memory = tracemalloc.is_tracing()
+    mem_before = tracemalloc.get_traced_memory()[0] if tracing_memory else 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        allocated = tracemalloc.get_traced_memory()[0] - mem_before if tracing_memory else None
+        STAGE_SECONDS.observe(stage, elapsed)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed, allocated))
+
+
+async def traced(stage, func, *args, **kwargs):
+    """Await func(*args, **kwargs) inside span(stage); handy for scheduler stages."""
+    with span(stage):
+        return await func(*args, **kwargs)
+
+
+@contextmanager
+def collect_spans():
+    """Collect the spans of the enclosed block (one request) into a list."""
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def server_timing_header(spans):
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds, *_ in spans)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that collects the spans of one HTTP request and returns
+    them as a `Server-Timing` header, and records total request latency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+
+        with collect_spans() as spans:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    total = time.perf_counter() - start
+                    header = server_timing_header(spans + [("total", total)])
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                REQUEST_SECONDS.observe(scope.get("path", ""), time.perf_counter() - start)
+
+
+def render_metrics():
+    """Prometheus text exposition of every histogram and registered collector."""
+    parts = [STAGE_SECONDS.render(), REQUEST_SECONDS.render()]
+    for name, (metric_type, documentation, func) in sorted(_collectors.items()):
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+        try:
+            value = func()
+        except Exception as e:
+            print(f"⚠️ Metric {name} failed: {e}")
+            continue
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                lines.append(f'{name}{{key="{label}"}} {float(v)}')
+        else:
+            lines.append(f"{name} {float(value)}")
+        parts.append("\n".join(lines))
+    parts.append(f'rag_worker_info{{pid="{os.getpid()}"}} 1')
+    return "\n".join(parts) + "\n"
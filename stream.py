@@ -1,8 +1,9 @@
 # main.py
 
 from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import asyncio
 import time
@@ -13,13 +14,33 @@ import os
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from multilingual_pipeline.language_detection import detect_language
 from multilingual_pipeline.conversion import translation, output_converison
-from milvus_database.milvus_loading import loading_milvus
 from streaming.step_1_llm_with_stream import main
+from src.client_registry import registry
+from src.redis_pool import close_async_redis
+from src.async_utils import shutdown_executor
+from persistant_memory.outbox import outbox
+from persistant_memory.sqlite_pool import chat_db
+from caching_hisotry.caching.l1_cache import l1_cache
 
 
 # ------------------- FASTAPI SETUP -------------------
 
-app = FastAPI(title="Gemini RAG Streaming API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build and warm every upstream client once per worker before serving
+    await registry.start()
+    # The stream checks and fills the same cache tiers as /query
+    l1_cache.start()
+    outbox.start()
+    yield
+    await outbox.stop()
+    await registry.close()
+    await close_async_redis()
+    shutdown_executor()
+    chat_db.close()
+
+
+app = FastAPI(title="Gemini RAG Streaming API", lifespan=lifespan)
 
 origins = [
     "http://localhost",
@@ -40,6 +61,7 @@ app.add_middleware(
 
 class QuestionRequest(BaseModel):
     question: str
+    session_id: str = "defaut_session"
 
 
 # ------------------- STREAM ENDPOINT (POST) -------------------
@@ -56,11 +78,9 @@ async def stream(request: QuestionRequest):
     user_question = request.question
     print(f"🔹 Incoming query: {user_question}")
 
-    db_load = loading_milvus()
-    
     async def event_generator():
         start_time = time.time()
-        async for chunk in main(query=user_question, detected_lang="en"):
+        async for chunk in main(query=user_question, detected_lang="en", session_id=request.session_id):
             print(chunk, end="")
             elapsed_time = time.time() - start_time
             print("Total Time: ",elapsed_time)
@@ -78,3 +98,11 @@ async def stream(request: QuestionRequest):
 @app.get("/")
 async def root():
     return {"message": "Gemini Streaming RAG API is live 🚀"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the critical upstream clients have warmed successfully."""
+    if not registry.ready:
+        return JSONResponse({"ready": False, "warm_up": registry.warm_up_status}, status_code=503)
+    return {"ready": True, "warm_up": registry.warm_up_status}
@@ -3,36 +3,227 @@ import re
 import json
 from dotenv import load_dotenv
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from multilingual_pipeline.conversion import output_converison
+from multilingual_pipeline.conversion import output_converison, translate_fields
 from streaming.step_2_processing_with_stream import process_file_stream
 from src.utils import load_config
+from src.client_registry import registry
+from src.request_context import RequestContext, embed_query
+from src.async_utils import run_blocking
+from src.tracing import span
+from src.step_3_llm_loaders import redis_tier, sqlite_tier, format_answer
+from caching_hisotry.caching.exact_cache import get_exact_answer
+from persistant_memory.outbox import outbox
+from persistant_memory.load_chat_history import load_chat_conversation
 
 load_dotenv()
 
+REPLAY_CHUNK_CHARS = 200   # size of the token events a cached answer is replayed in
+SUMMARY_SEPARATOR = "\n\n**Summary:**\n"   # how format_answer joins Explanation and Summary
 
-async def main(query: str, detected_lang: str = "en"):
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def find_bold_words(text):
+    return list(set(re.findall(r"\*\*(.*?)\*\*", text)))
+
+
+def token_event(content, bold_words):
+    return sse_event({"type": "token", "content": content, "bold_words": bold_words})
+
+
+def final_event(answer, source):
+    """
+    Closing SSE event for an answer dict in the /query response shape. Live
+    and replayed streams both end with it, so clients parse one schema.
+    """
+    response = answer.get("response") or ""
+    return sse_event({
+        "type": "final",
+        "full_response": response,
+        "bold_words": answer.get("bold_words") or find_bold_words(response),
+        "meta_data": answer.get("meta_data", []),
+        "follow_up": answer.get("follow_up"),
+        "table_data": answer.get("table_data", []),
+        "ucid": answer.get("ucid", "99_18"),
+        "source": source,
+    })
+
+
+def _partial_json_string(raw, field, pos=0):
+    """
+    Decode the (possibly still streaming) string value of `field` in raw JSON.
+
+    Returns:
+        tuple: (decoded text so far or None if the field has not started,
+                True once the closing quote has arrived, end offset)
+    """
+    match = re.compile(rf'"{field}"\s*:\s*"').search(raw, pos)
+    if match is None:
+        return None, False, pos
+    start = end = match.end()
+    closed = False
+    while end < len(raw):
+        char = raw[end]
+        if char == '"':
+            closed = True
+            break
+        if char != "\\":
+            end += 1
+            continue
+        # Never split an escape sequence (or a \u surrogate pair) across events
+        if end + 1 >= len(raw):
+            break
+        if raw[end + 1] != "u":
+            end += 2
+            continue
+        if end + 6 > len(raw):
+            break
+        if 0xD800 <= int(raw[end + 2:end + 6], 16) <= 0xDBFF:
+            if end + 12 > len(raw):
+                break
+            end += 12
+        else:
+            end += 6
+    return json.loads(f'"{raw[start:end]}"', strict=False), closed, end
+
+
+class ResponseTextStream:
+    """
+    Pull the answer text out of Gemini's streamed JSON as it arrives.
+
+    Gemini streams the raw JSON object; clients should only ever see the
+    "response" text of the /query shape (the Explanation, then the Summary),
+    the same text a cached answer is replayed with.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.text = ""
+
+    def feed(self, chunk):
+        """Add a streamed chunk; returns the response text it completed."""
+        self.raw += chunk
+        try:
+            explanation, closed, end = _partial_json_string(self.raw, "Explanation")
+            text = explanation or ""
+            if closed:
+                summary, _, _ = _partial_json_string(self.raw, "Summary", end)
+                if summary is not None:
+                    text += SUMMARY_SEPARATOR + summary
+        except ValueError:
+            # Not the JSON shape we expect; the final event still carries the answer
+            return ""
+        new_text = text[len(self.text):]
+        self.text = text
+        return new_text
+
+
+async def cached_answer(ctx):
+    """
+    Same cache tiers as /query, in the same order: exact match, then the
+    Redis semantic cache (L1 first), then the SQLite history.
+
+    Returns:
+        tuple | None: (source, answer dict, confidence score) on a hit.
+    """
+    with span("exact_cache"):
+        exact_hit = await run_blocking(get_exact_answer, ctx.query, ctx.detected_lang)
+    if exact_hit is not None:
+        return "exact-cache", exact_hit["answer"], exact_hit["confidence_score"]
+
+    with span("embedding"):
+        await embed_query(ctx)
+    with span("redis_knn"):
+        hit = await redis_tier(ctx)
+    if hit is not None:
+        score, answer, confidence_score = hit
+        return "semantic-cache", answer, answer.get("confidence_score")
+    with span("sqlite_knn"):
+        hit = await sqlite_tier(ctx)
+    if hit is not None:
+        return "history", hit["answer"], 0.7 * hit["similarity"] + 0.3 * hit["confidence"]
+    return None
+
+
+def replay_chunks(text, size=REPLAY_CHUNK_CHARS):
+    """Split a cached response into token-sized pieces on spaces; they join back to `text`."""
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            space = text.rfind(" ", start + 1, end)
+            if space != -1:
+                end = space + 1
+        yield text[start:end]
+        start = end
+
+
+async def replay_cached(answer, source):
+    """Replay a cached answer dict with the same SSE events as a live stream."""
+    if isinstance(answer, str):
+        answer = json.loads(answer)
+    response = answer.get("response") or ""
+    bold_words = answer.get("bold_words") or find_bold_words(response)
+    for piece in replay_chunks(response):
+        yield token_event(piece, bold_words)
+
+    yield final_event(answer, source)
+    yield "data: [DONE]\n\n"
+
+
+async def main(query: str, detected_lang: str = "en", session_id: str = "defaut_session"):
     """
     Streaming version of the RAG main pipeline.
     Streams Gemini's output live, while handling:
+      - Cache lookup (a hit is replayed as SSE without any LLM call)
       - Embeddings & retrieval
       - Translation
       - Bold word extraction
       - Metadata accumulation
+      - Writing the completed answer back to the cache tiers
     """
 
     print("🔹 [Streaming RAG] Processing query:", query)
+    ctx = RequestContext(query=query, session_id=session_id, detected_lang=detected_lang)
 
-    # Step 1: Load configuration and embedding model
-    config = load_config()
-    em_model_name = config["embedding"]["google"]["model_name"]
-    embedding_model = GoogleGenerativeAIEmbeddings(model=em_model_name)
+    # Step 1: Same cache tiers as /query; a hit streams back immediately
+    hit = await cached_answer(ctx)
+    if hit is not None:
+        source, answer, confidence_score = hit
+        print(f"⚡ Streaming cached answer ({source}).")
+        async for event in replay_cached(answer, source):
+            yield event
+        with span("persistence"):
+            await outbox.aenqueue(
+                "save_chat_turn",
+                session_id=session_id,
+                language=ctx.detected_lang,
+                question=query,
+                answer_dict=answer,
+                query_vector=ctx.query_vector,
+                confidence_score=confidence_score,
+            )
+        return
 
-    # Step 2: Initialize metadata and output accumulators
+    # Step 2: Shared, pre-warmed embedding client and the session's recent turns
+    embedding_model = registry.embedding_model
+    chat_history = await run_blocking(load_chat_conversation, session_id=session_id, last_n=2)
+
+    if detected_lang not in ["en", "hi", "mr", "te"]:
+        detected_lang = "en"
+
+    # Step 3: Initialize metadata and output accumulators
     meta_data_accum = []
-    accumulated_text = ""
+    response_text = ResponseTextStream()
+    raw_text = ""          # Gemini's output exactly as streamed, for the cache
+    error = None
 
-    # Step 3: Stream the LLM response token by token
-    async for chunk in process_file_stream(query=query, embedding_model=embedding_model):
+    # Step 4: Stream the answer text as Gemini produces it
+    async for chunk in process_file_stream(query=query, embedding_model=embedding_model,
+                                           query_vector=ctx.query_vector, meta_data=meta_data_accum,
+                                           chat_history=chat_history):
         if not chunk:
             continue
 
@@ -40,45 +231,52 @@ async def main(query: str, detected_lang: str = "en"):
         if chunk.strip().startswith("data: [DONE]"):
             break
 
-        # Extract clean text token
-        text_part = chunk.replace("data:", "").strip()
-        if not text_part:
-            continue
-
-        # Accumulate response
-        accumulated_text += text_part + " "
-
-        # Live bold word detection
-        bold_words = list(set(re.findall(r"\*\*(.*?)\*\*", accumulated_text)))
-
-        # Step 4: Translation (on the fly)
-        if detected_lang not in ["en", "hi", "mr", "te"]:
-            detected_lang = "en"
+        text_part = chunk[len("data: "):].removesuffix("\n\n")
+        if text_part.startswith("[Error]"):
+            error = text_part
+            break
+        raw_text += text_part
 
-        translated_chunk = output_converison(text_part, detected_lang)
+        piece = response_text.feed(text_part)
+        if not piece:
+            continue
 
-        # Step 5: Yield partial response chunk as SSE
-        sse_data = {
-            "type": "token",
-            "content": translated_chunk,
-            "bold_words": bold_words,
-        }
-        yield f"data: {json.dumps(sse_data, ensure_ascii=False)}\n\n"
+        # Step 5: Translation (on the fly)
+        if detected_lang != "en":
+            [piece] = await run_blocking(translate_fields, [piece], detected_lang)
 
-    # Step 6: After streaming ends — send metadata + full text
-    bold_words_final = list(set(re.findall(r"\*\*(.*?)\*\*", accumulated_text)))
+        # Step 6: Yield partial response chunk as SSE
+        yield token_event(piece, find_bold_words(response_text.text))
 
-    # Translate the full accumulated response
-    translated_full = output_converison(accumulated_text.strip(), detected_lang)
+    if error is not None:
+        yield token_event(error, [])
+        yield final_event({"response": error}, "error")
+        yield "data: [DONE]\n\n"
+        return
 
-    final_payload = {
-        "type": "final",
-        "full_response": translated_full,
-        "bold_words": bold_words_final,
-        "meta_data": meta_data_accum,  # optional; fill from Milvus if needed
-        "ucid": "99_18",
-    }
+    # Step 7: After streaming ends — send the answer in the /query shape,
+    # the same final event a cache hit is replayed with
+    try:
+        output = await format_answer(raw_text, meta_data_accum, ctx.detected_lang)
+    except json.JSONDecodeError as e:
+        print(f"⚠️ Streamed answer is not valid JSON, not caching it: {e}")
+        yield final_event({"response": raw_text.strip(), "meta_data": meta_data_accum}, "rag")
+        yield "data: [DONE]\n\n"
+        return
 
-    yield f"data: {json.dumps(final_payload, ensure_ascii=False)}\n\n"
+    yield final_event(output, "rag")
     yield "data: [DONE]\n\n"
 
+    # Step 8: Write the assembled answer back so the next request for this
+    # question (streamed or not) is a cache hit
+    with span("persistence"):
+        await outbox.aenqueue(
+            "save_chat_turn",
+            session_id=session_id,
+            language=ctx.detected_lang,
+            question=query,
+            answer_dict=output,
+            query_vector=ctx.query_vector,
+            confidence_score=output.get("confidence_score"),
+            cache_miss=True,
+        )
@@ -4,7 +4,7 @@ from langchain_core.documents import Document
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from vertexai.preview.language_models import TextGenerationModel
 from src.step_5_prompt import prompt
-from src.step_6_reranker import rerank_with_google
+from src.step_6_reranker import arerank_with_google
 from milvus_database.milvus_db import vector_search
 from milvus_database.config import DB
 import os
@@ -13,23 +13,34 @@ import json
 import asyncio
 from vertexai.generative_models import GenerativeModel
 from src.llm_config import GENERATION_CONFIG,safety_settings
+from src.client_registry import registry
+from src.async_utils import run_blocking
 
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.path.join(os.getcwd(), "service-account.json")
 
 
 # ------------------- STREAMING VERSION -------------------
-async def process_file_stream(query, embedding_model):
+async def process_file_stream(query, embedding_model, query_vector=None, meta_data=None, chat_history=""):
     """
-    Async generator for streaming Gemini responses via SSE.
+    Async generator for streaming Gemini responses via SSE. Milvus runs on
+    the bounded blocking pool and Gemini is streamed through its async
+    client, so other requests keep being served while this one waits.
+
+    Args:
+        query_vector: Embedding already computed for the cache lookup, if any.
+        meta_data (list): When given, filled with the reranked documents' metadata.
+        chat_history (str): Recent turns of the session, for the prompt.
     """
     try:
         print(f"\n[Streaming Query]: {query}")
 
-        # Step 1: Embed query
-        query_vector = embedding_model.embed_query(query)
+        # Step 1: Embed query (reused from the cache lookup when available)
+        if query_vector is None:
+            query_vector = await embedding_model.aembed_query(query)
 
         # Step 2: Vector search in Milvus
-        results = vector_search(
+        results = await run_blocking(
+            vector_search,
             collection_name=DB.milvus_collection_name,
             partition_name=DB.default_partition,
             query_vectors=query_vector,
@@ -57,7 +68,9 @@ async def process_file_stream(query, embedding_model):
 
         # Step 4: Rerank top documents
         project_id = "km-judisasory"
-        docs = rerank_with_google(query, docs, project_id)[:10]
+        docs = (await arerank_with_google(query, docs, project_id, client=registry.rank_client))[:10]
+        if meta_data is not None:
+            meta_data.extend(doc.metadata for doc in docs)
 
         # Step 5: Build context
         context_chunks = []
@@ -68,11 +81,11 @@ async def process_file_stream(query, embedding_model):
 
         context = "\n\n".join(context_chunks)
 
-        formatted_prompt = prompt.format(context=context, question=query)
-        model = GenerativeModel("gemini-2.5-flash")
+        formatted_prompt = prompt.format(context=context, question=query, chat_history=chat_history)
+        model = registry.gemini_model
 
         # Step 6: Stream from Gemini
-        stream = model.generate_content(
+        stream = await model.generate_content_async(
             formatted_prompt,
             generation_config=GENERATION_CONFIG,
             safety_settings=safety_settings,
@@ -80,7 +93,7 @@ async def process_file_stream(query, embedding_model):
         )
 
         # Step 7: Yield token-by-token output
-        for chunk in stream:
+        async for chunk in stream:
             if hasattr(chunk, "text") and chunk.text:
                 yield f"data: {chunk.text}\n\n"
 
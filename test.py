@@ -1,6 +1,7 @@
 from milvus_database.config import DB
 from milvus_database.factory_client import MilvusDB
 from src.step_3_llm_loaders import main
+from persistant_memory.outbox import outbox
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -33,6 +34,8 @@ query = "tell me about the Territorial divisions?"
 # query = "tell me about the Act of a child above seven and under twelve years of age of immature understanding"
 print("query: ",query)
 response = asyncio.run(main(query=query,detected_lang="en",session_id=session_id))
+# No app lifespan here, so run the queued history / cache writes before exiting
+outbox.drain()
 elapsed_time = time.time() - start
 print("Total time", elapsed_time)
 
@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+
+import fakeredis
+import numpy as np
+import pytest
+
+# The chat DB path is read when persistant_memory is imported
+os.environ["CHAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "chat_history.db")
+
+from caching_hisotry.caching import exact_cache
+from persistant_memory import loading_and_saving_chat as history
+
+DIM = 3072
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(monkeypatch):
+    monkeypatch.setattr(exact_cache, "r", fakeredis.FakeRedis())
+    history.init_db()
+    conn = history.chat_db.connection()
+    for table in ("chat_history", "vec_chat_history", "query_stats", "processed_jobs"):
+        conn.execute(f"DELETE FROM {table}")
+    conn.commit()
+
+
+def unit(v):
+    return (v / np.linalg.norm(v)).astype(np.float32)
+
+
+def paraphrase_of(vector, rng):
+    """A vector within CANONICAL_SIMILARITY of `vector`."""
+    return unit(vector + 0.05 * unit(rng.standard_normal(DIM)))
+
+
+def canonical_row(row_id):
+    conn = history.chat_db.connection()
+    answer, confidence = conn.execute(
+        "SELECT answer, confidence_score FROM chat_history WHERE id = ?", (row_id,)
+    ).fetchone()
+    best = conn.execute("SELECT best_confidence FROM query_stats WHERE latest_id = ?", (row_id,)).fetchone()[0]
+    return json.loads(answer), confidence, best
+
+
+def save(session_id, question, answer, vector, confidence, fresh_answer):
+    history.save_chat_turn(
+        session_id=session_id,
+        question=question,
+        answer_dict=answer,
+        query_vector=vector,
+        confidence_score=confidence,
+        fresh_answer=fresh_answer,
+    )
+
+
+def test_cache_hit_turns_leave_canonical_row_unchanged():
+    rng = np.random.default_rng(0)
+    vector = unit(rng.standard_normal(DIM))
+    generated = {"text": "generated", "confidence_score": 0.6}
+    save("s1", "What is an FIR?", generated, vector, 0.6, fresh_answer=True)
+    row_id = history.chat_db.connection().execute("SELECT id FROM chat_history").fetchone()[0]
+
+    # A paraphrase in another session served by the SQLite tier, with the
+    # blended similarity/confidence score
+    save("s2", "what's an FIR", {"text": "cached", "confidence_score": 0.9}, paraphrase_of(vector, rng),
+         0.95, fresh_answer=False)
+    # The same question again, served by the exact-match tier
+    save("s1", "What is an FIR?", {"text": "cached", "confidence_score": 0.9}, vector, 0.99, fresh_answer=False)
+
+    assert canonical_row(row_id) == (generated, 0.6, 0.6)
+
+
+def test_fresh_answer_with_higher_confidence_replaces_canonical_answer():
+    rng = np.random.default_rng(1)
+    vector = unit(rng.standard_normal(DIM))
+    save("s1", "What is an FIR?", {"text": "first", "confidence_score": 0.6}, vector, 0.6, fresh_answer=True)
+    row_id = history.chat_db.connection().execute("SELECT id FROM chat_history").fetchone()[0]
+
+    better = {"text": "better", "confidence_score": 0.8}
+    save("s2", "what's an FIR", better, paraphrase_of(vector, rng), 0.8, fresh_answer=True)
+
+    assert canonical_row(row_id) == (better, 0.8, 0.8)